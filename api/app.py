@@ -2,23 +2,95 @@
 
 import sys
 import os
+import time
 from flasgger import Swagger
 sys.path.append(os.path.dirname(os.path.abspath(__file__)) + '/../')
 
-from flask import Flask  # noqa: E402
+from flask import Flask, request, jsonify  # noqa: E402
 from api.views import app_views  # noqa: E402
+from api.views.hash_password import PasswordPoolBusy  # noqa: E402
 from models import storage  # noqa: E402
+from models.low_stock import LowStockNotifier  # noqa: E402
+
+# Cookie, and header for clients without cookies, holding the time of
+# the client's last write request
+LAST_WRITE_COOKIE = 'picknest_last_write'
+LAST_WRITE_HEADER = 'X-Last-Write'
+READ_METHODS = ('GET', 'HEAD', 'OPTIONS')
 
 app = Flask(__name__, static_folder='static')
 app.config['SECRET_KEY'] = 'nyakundi'
 app.config['DEBUG'] = True
 
+# Rebuild the storage engine so DATABASE_URI and the DB_POOL_* settings
+# can come from the app config as well as from the environment
+storage.configure(app.config)
+storage.reload()
+
+# Optional low-stock events, delivered off the request threads
+if os.environ.get('LOW_STOCK_NOTIFY', '').lower() in ('1', 'true', 'yes'):
+    low_stock_notifier = LowStockNotifier(
+        webhook_url=os.environ.get('LOW_STOCK_WEBHOOK_URL'))
+    low_stock_notifier.start()
+    storage.subscribe_low_stock(low_stock_notifier.publish)
+
 # Initialize Swagger
 swagger = Swagger(app)
 
 # Registering app_views that has the routes
 app.register_blueprint(app_views)
 
+
+def last_write_time():
+    """Time of the client's last write, from its cookie or header"""
+    last_write = 0
+    for marker in (request.cookies.get(LAST_WRITE_COOKIE),
+                   request.headers.get(LAST_WRITE_HEADER)):
+        try:
+            last_write = max(last_write, float(marker or 0))
+        except ValueError:
+            pass
+    return last_write
+
+
+@app.before_request
+def route_reads_to_replica():
+    """Serve read-only requests from a replica when the client has not
+    written within the tolerated replica lag (read-your-writes)
+
+    Replicas measured further behind than that are skipped, and the
+    primary serves the request when none is left.
+    """
+    if request.method not in READ_METHODS or not storage.has_replicas:
+        return
+    if time.time() - last_write_time() > storage.replica_max_lag:
+        storage.use_replica()
+
+
+@app.after_request
+def remember_write(response):
+    """Keep the client on the primary for a while after it writes
+
+    The time is set as a cookie and sent as a header, which clients
+    without cookies echo back on their next requests.
+    """
+    if request.method not in READ_METHODS and storage.has_replicas:
+        written_at = str(time.time())
+        response.set_cookie(LAST_WRITE_COOKIE, written_at,
+                            max_age=int(storage.replica_max_lag) + 1,
+                            httponly=True)
+        response.headers[LAST_WRITE_HEADER] = written_at
+    return response
+
+
+@app.errorhandler(PasswordPoolBusy)
+def password_pool_busy(error):
+    """Reject sign-ups and logins quickly while the password pool is full"""
+    response = jsonify({'Error': 'Server busy, please retry shortly'})
+    response.headers['Retry-After'] = '1'
+    return response, 503
+
+
 @app.teardown_appcontext
 def close_storage(exception):
     """Closes the storage on teardown"""
@@ -12,3 +12,6 @@ from api.views.items import *  # noqa: E402
 from api.views.order_items import *  # noqa: E402
 from api.views.orders import *  # noqa: E402
 from api.views.payments import *  # noqa: E402
+from api.views.search import *  # noqa: E402
+from api.views.status import *  # noqa: E402
+from api.views.tokens import *  # noqa: E402
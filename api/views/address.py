@@ -7,7 +7,8 @@ from models.address import Address
 from sqlalchemy.exc import IntegrityError
 from flask import jsonify, request
 from .token_auth import token_required
-import uuid
+from .pagination import paginated_response
+from models.ids import new_public_id
 
 
 @app_views.route('/clients/<client_id>/addresses',
@@ -23,11 +24,7 @@ def get_client_addresses(current_user, client_id):
     if current_user.role == 'client' and current_user.public_id != client_id:
         return jsonify({'Error': 'Unauthorized Access'}), 403
 
-    all_addresses = storage.all(Address)
-    list_addresses = [address.to_dict() for
-                      address in all_addresses if
-                      address.client_id == client_id]
-    return jsonify(list_addresses)
+    return paginated_response(Address, client_id=client_id)
 
 
 @app_views.route('/addresses/<address_id>',
@@ -58,9 +55,7 @@ def get_all_addresses(current_user):
     if current_user.role != 'admin':
         return jsonify({'Error': 'Unauthorized access'}), 403
 
-    all_addresses = storage.all(Address)
-    list_addresses = [item.to_dict() for item in all_addresses]
-    return jsonify(list_addresses)
+    return paginated_response(Address)
 
 
 @app_views.route('/addresses',
@@ -86,7 +81,7 @@ def add_address(current_user):
     for field in required_fields:
         if field not in data:
             return jsonify({"Error": f"{field} is missing"}), 400
-    data["public_id"] = str(uuid.uuid4())
+    data["public_id"] = new_public_id()
     instance = Address(**data)
     try:
         storage.new(instance)
@@ -4,16 +4,18 @@
 from api.views import app_views
 from models import storage
 from models.client import Client
-from flask import jsonify, abort, request, make_response, current_app
-from sqlalchemy.exc import IntegrityError
-from datetime import datetime, timedelta
-import uuid
-import jwt
-from .token_auth import token_required
-from .hash_password import hash_password, verify_password
+from flask import jsonify, abort, request, make_response
+from sqlalchemy.exc import IntegrityError, SQLAlchemyError
+from models.ids import new_public_id
+from .token_auth import token_required, invalidate_principal
+from .tokens import issue_tokens
+from .pagination import paginated_response
+from .hash_password import hash_password, verify_password, needs_rehash
 from flasgger import swag_from
 
 roles = ['admin', 'client']
+# Unique columns a client can log in with
+login_fields = ['username', 'email', 'phone']
 
 
 @app_views.route('/clients/sign_up', methods=['POST'], strict_slashes=False)
@@ -36,7 +38,7 @@ def sign_up():
 
     # Create new client instance
     client = Client(
-        public_id=str(uuid.uuid4()),
+        public_id=new_public_id(),
         email=data.get('email'),
         hashedpassword=hashed.encode(),
         firstname=data.get('firstname'),
@@ -73,17 +75,16 @@ def login():
     """Login route for clients"""
     data = request.get_json()
 
-    if (not data or not data.get('username') or
-            not data.get('password') or not data.get('role')):
+    # Log in by username, email or phone, each backed by a unique index
+    field = next((name for name in login_fields
+                  if data and data.get(name)), None)
+    if not field or not data.get('password') or not data.get('role'):
         return make_response(jsonify({'message': 'Invalid input'}), 400)
 
     if data.get('role') != 'client':
         return make_response(jsonify({'message': 'Invalid role'}), 401)
 
-    # Query the client by username
-    all_clients = storage.all(Client)
-    user = next((client for client in all_clients if
-                 client.username == data.get('username')), None)
+    user = storage.get_by(Client, **{field: data.get(field)})
     if not user:
         return jsonify({'message': 'Client not found!'}), 404
 
@@ -91,32 +92,55 @@ def login():
     if not verify_password(data.get('password'), user.hashedpassword):
         return jsonify({'message': 'Incorrect Password'}), 401
 
-    # Generate token
-    token = jwt.encode({
-        'public_id': user.public_id,
-        'role': 'client',
-        'exp': datetime.utcnow() + timedelta(minutes=120)
-    }, current_app.config['SECRET_KEY'], algorithm='HS256')
+    # Upgrade hashes made with a lower work factor while we know the password
+    if needs_rehash(user.hashedpassword):
+        user.hashedpassword = hash_password(data.get('password'))
+        try:
+            storage.save()
+        except SQLAlchemyError:
+            storage.rollback()
 
+    # Generate an access token and a refresh token to renew it
     return jsonify({'message': 'Client logged in successfully',
-                    'token': token if isinstance(token, str)
-                    else token.decode('utf-8')})
+                    **issue_tokens(user, 'client')})
 
 
 @app_views.route('/clients', methods=['GET'], strict_slashes=False)
 @swag_from({
+    'parameters': [
+        {
+            'name': 'limit',
+            'in': 'query',
+            'type': 'integer',
+            'required': False,
+            'description': 'Maximum number of clients per page'
+        },
+        {
+            'name': 'cursor',
+            'in': 'query',
+            'type': 'string',
+            'required': False,
+            'description': 'next_cursor returned by the previous page'
+        }
+    ],
     'responses': {
         200: {
-            'description': 'A list of clients',
+            'description': 'A page of clients',
             'schema': {
-                'type': 'array',
-                'items': {
-                    'type': 'object',
-                    'properties': {
-                        'id': {'type': 'integer'},
-                        'name': {'type': 'string'},
-                        'email': {'type': 'string'}
-                    }
+                'type': 'object',
+                'properties': {
+                    'results': {
+                        'type': 'array',
+                        'items': {
+                            'type': 'object',
+                            'properties': {
+                                'id': {'type': 'integer'},
+                                'name': {'type': 'string'},
+                                'email': {'type': 'string'}
+                            }
+                        }
+                    },
+                    'next_cursor': {'type': 'string'}
                 }
             }
         }
@@ -128,9 +152,7 @@ def get_clients(current_user):
     if current_user.role != 'admin':
         return jsonify({'message': 'Unauthorized access'}), 403
 
-    all_clients = storage.all(Client)
-    list_clients = [client.to_dict() for client in all_clients]
-    return jsonify(list_clients)
+    return paginated_response(Client)
 
 
 @app_views.route('/clients/<client_id>', methods=['GET'], strict_slashes=False)
@@ -199,7 +221,7 @@ def add_client(current_user):
     del data["password"]
 
     data["role"] = "client"
-    data["public_id"] = str(uuid.uuid4())
+    data["public_id"] = new_public_id()
     instance = Client(**data)
     try:
         # Save the new client to storage
@@ -261,6 +283,7 @@ def update_client(current_user, client_id):
     except IntegrityError as e:
         return jsonify({'Error': 'Invalid data', 'message': str(e)}), 400
 
+    invalidate_principal('client', client.public_id)
     return jsonify(client.to_dict()), 200
 
 
@@ -283,5 +306,6 @@ def delete_client(current_user, client_id):
     client_name = client.username
     storage.delete(client)
     storage.save()
+    invalidate_principal('client', client.public_id)
 
     return jsonify({'message': f'{client_name} removed'}), 200
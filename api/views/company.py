@@ -4,15 +4,17 @@
 from api.views import app_views
 from models import storage
 from models.company import Company
-from flask import jsonify, abort, request, make_response, current_app
-from sqlalchemy.exc import IntegrityError
-from .token_auth import token_required
-from datetime import datetime, timedelta
-import jwt
-import uuid
-from .hash_password import hash_password, verify_password
+from flask import jsonify, abort, request, make_response
+from sqlalchemy.exc import IntegrityError, SQLAlchemyError
+from .token_auth import token_required, invalidate_principal
+from .tokens import issue_tokens
+from .pagination import paginated_response
+from models.ids import new_public_id
+from .hash_password import hash_password, verify_password, needs_rehash
 
 roles = ['admin', 'company']
+# Unique columns a company can log in with
+login_fields = ['username', 'email', 'phone_number']
 
 
 @app_views.route('/companies/sign_up', methods=['POST'], strict_slashes=False)
@@ -33,7 +35,7 @@ def company_sign_up():
 
     # Create a new company instance
     company = Company(
-        public_id=str(uuid.uuid4()),
+        public_id=new_public_id(),
         name=data.get('name'),
         username=data.get('username'),
         hashed_password=hashed_password,
@@ -77,17 +79,16 @@ def company_login():
     """Login route for companies"""
     data = request.get_json()
 
-    if (not data or not data.get('username') or
-            not data.get('password') or not data.get('role')):
+    # Log in by username, email or phone, each backed by a unique index
+    field = next((name for name in login_fields
+                  if data and data.get(name)), None)
+    if not field or not data.get('password') or not data.get('role'):
         return make_response(jsonify({'message': 'Invalid input'}), 400)
 
     if data.get('role') != 'company':
         return make_response(jsonify({'message': 'Invalid role'}), 401)
 
-    # Query the company by username
-    all_companies = storage.all(Company)
-    company = next((comp for comp in all_companies if
-                    comp.username == data.get('username')), None)
+    company = storage.get_by(Company, **{field: data.get(field)})
     if not company:
         return jsonify({'message': 'Company not found!'}), 404
 
@@ -95,16 +96,17 @@ def company_login():
     if not verify_password(data.get('password'), company.hashed_password):
         return jsonify({'message': 'Incorrect Password'}), 401
 
-    # Generate token
-    token = jwt.encode({
-        'public_id': company.public_id,
-        'role': 'company',
-        'exp': datetime.utcnow() + timedelta(minutes=120)
-    }, current_app.config['SECRET_KEY'], algorithm='HS256')
+    # Upgrade hashes made with a lower work factor while we know the password
+    if needs_rehash(company.hashed_password):
+        company.hashed_password = hash_password(data.get('password'))
+        try:
+            storage.save()
+        except SQLAlchemyError:
+            storage.rollback()
 
+    # Generate an access token and a refresh token to renew it
     return jsonify({'message': 'Company logged in successfully',
-                    'token': token if
-                    isinstance(token, str) else token.decode('utf-8')})
+                    **issue_tokens(company, 'company')})
 
 
 @app_views.route('/companies', methods=['GET'], strict_slashes=False)
@@ -114,9 +116,7 @@ def get_companies(current_user):
     if current_user.role != 'admin':
         return jsonify({'message': 'Unauthorized access'}), 403
 
-    all_companies = storage.all(Company)
-    list_companies = [company.to_dict() for company in all_companies]
-    return jsonify(list_companies)
+    return paginated_response(Company)
 
 
 @app_views.route('/companies/<company_id>',
@@ -156,7 +156,7 @@ def add_company(current_user):
     for field in required_fields:
         if field not in data:
             abort(400, description=f"{field} not found")
-    data["public_id"] = str(uuid.uuid4())
+    data["public_id"] = new_public_id()
     data["role"] = "company"
     instance = Company(**data)
     storage.new(instance)
@@ -207,6 +207,7 @@ def update_company(current_user, company_id):
     except IntegrityError as e:
         return jsonify({'Error': 'Invalid data', 'message': str(e)}), 400
 
+    invalidate_principal('company', company.public_id)
     return jsonify(company.to_dict()), 200
 
 
@@ -232,4 +233,5 @@ def delete_company(current_user, company_id):
         return jsonify({'message':
                         'An error occurred while deleting the company'}), 500
 
+    invalidate_principal('company', company.public_id)
     return jsonify({'message': f'{company.name} removed'}), 200
@@ -4,15 +4,163 @@
 import bcrypt
 import hashlib
 import base64
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+# Work factors calibration may choose from; 10 is the lowest we accept
+MIN_ROUNDS = 10
+MAX_ROUNDS = 16
+
+
+class PasswordPoolBusy(Exception):
+    """Raised when the password pool cannot take more work"""
+
+
+class PasswordPool:
+    """Bounded pool of threads for bcrypt work
+
+    bcrypt releases the GIL while hashing, so the workers run in
+    parallel with each other and with the request threads. At most
+    workers + queue_depth calls are admitted at once; any call beyond
+    that is rejected immediately with PasswordPoolBusy instead of
+    queueing behind a login storm.
+    """
+
+    def __init__(self, workers=4, queue_depth=32):
+        """Start an idle pool"""
+        self.workers = workers
+        self.queue_depth = queue_depth
+        self.__executor = ThreadPoolExecutor(max_workers=workers,
+                                             thread_name_prefix='bcrypt')
+        self.__lock = threading.Lock()
+        self.in_flight = 0
+        self.completed = 0
+        self.rejected = 0
+
+    def __release(self, future):
+        """Free the slot of a finished call"""
+        with self.__lock:
+            self.in_flight -= 1
+            self.completed += 1
+
+    def run(self, fn, *args):
+        """Run fn(*args) on a worker and wait for its result"""
+        with self.__lock:
+            if self.in_flight >= self.workers + self.queue_depth:
+                self.rejected += 1
+                raise PasswordPoolBusy('Password pool is saturated')
+            self.in_flight += 1
+        try:
+            future = self.__executor.submit(fn, *args)
+        except Exception:
+            with self.__lock:
+                self.in_flight -= 1
+            raise
+        future.add_done_callback(self.__release)
+        return future.result()
+
+    def stats(self):
+        """Size, load and rejection count of the pool"""
+        with self.__lock:
+            return {'workers': self.workers,
+                    'queue_depth': self.queue_depth,
+                    'in_flight': self.in_flight,
+                    'queued': max(self.in_flight - self.workers, 0),
+                    'completed': self.completed,
+                    'rejected': self.rejected}
+
+
+# Sized apart from the request workers: PASSWORD_WORKERS threads hash
+# while up to PASSWORD_QUEUE_DEPTH more calls wait for one of them
+password_pool = PasswordPool(
+    workers=int(os.environ.get('PASSWORD_WORKERS', os.cpu_count() or 1)),
+    queue_depth=int(os.environ.get('PASSWORD_QUEUE_DEPTH', 32)))
+
+
+def time_rounds(rounds, samples=3):
+    """Fastest of samples bcrypt hashes at rounds, in seconds"""
+    salt = bcrypt.gensalt(rounds)
+    best = None
+    for _ in range(samples):
+        start = time.perf_counter()
+        bcrypt.hashpw(b'calibration', salt)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def calibrate_rounds(target_ms=250):
+    """Highest work factor whose hash takes at most target_ms here
+
+    Each extra round doubles the cost, so one measurement at MIN_ROUNDS
+    is extrapolated to the others. The result stays within MIN_ROUNDS
+    and MAX_ROUNDS.
+    """
+    milliseconds = time_rounds(MIN_ROUNDS) * 1000
+    rounds = MIN_ROUNDS
+    while rounds < MAX_ROUNDS and milliseconds * 2 <= target_ms:
+        milliseconds *= 2
+        rounds += 1
+    return rounds
+
+
+_rounds = None
+_rounds_lock = threading.Lock()
+
+
+def bcrypt_rounds():
+    """Work factor for new hashes
+
+    BCRYPT_ROUNDS pins it; otherwise it is calibrated once per process
+    to hash in BCRYPT_TARGET_MS milliseconds (250 by default).
+    """
+    global _rounds
+    with _rounds_lock:
+        if _rounds is None:
+            if os.environ.get('BCRYPT_ROUNDS'):
+                _rounds = int(os.environ['BCRYPT_ROUNDS'])
+            else:
+                _rounds = calibrate_rounds(
+                    float(os.environ.get('BCRYPT_TARGET_MS', 250)))
+        return _rounds
+
+
+def hash_rounds(hashed):
+    """Work factor a bcrypt hash was made with, e.g. 12 for $2b$12$..."""
+    if isinstance(hashed, bytes):
+        hashed = hashed.decode()
+    try:
+        return int(hashed.split('$')[2])
+    except (IndexError, ValueError):
+        return None
+
+
+def needs_rehash(hashed):
+    """Whether hashed was made with a lower work factor than ours
+
+    Only upgrades: workers calibrate their own work factor, so hashes
+    from a worker that settled one round higher are kept rather than
+    rewritten back and forth on alternate logins.
+    """
+    rounds = hash_rounds(hashed)
+    return rounds is None or rounds < bcrypt_rounds()
+
+
+def _hash(password):
+    """Hash password with a fresh salt"""
+    salt = bcrypt.gensalt(bcrypt_rounds())
+    return bcrypt.hashpw(password.encode(), salt)
 
 
 def hash_password(password: str) -> str:
     """utility func to hash function"""
-    salt = bcrypt.gensalt()
-    hashed_password = bcrypt.hashpw(password.encode(), salt)
+    hashed_password = password_pool.run(_hash, password)
     return hashed_password.decode()
 
 
 def verify_password(user_pass, hash):
     """used to verify a user on login"""
-    return bcrypt.checkpw(user_pass.encode(), hash.encode())
+    return password_pool.run(bcrypt.checkpw, user_pass.encode(),
+                             hash.encode())
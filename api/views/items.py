@@ -4,13 +4,34 @@
 from api.views import app_views
 from models import storage
 from models.items import Items
+from models.company import Company
+from models.category_count import CategoryCount
+from models.stock_movement import StockMovement
 from flask import jsonify, request
+import csv
+import json
+from datetime import datetime
 from .token_auth import token_required
+from .pagination import paginated_response
 from sqlalchemy.exc import IntegrityError
-import uuid
+from models.ids import new_public_id
 
 roles = ['admin', 'company']
 
+# Rows validated and written per transaction by the bulk import
+IMPORT_CHUNK_SIZE = 1000
+# Row errors listed in an import report (all of them are counted)
+IMPORT_MAX_ERRORS = 1000
+# Columns of an imported row; company_id comes from the URL
+IMPORT_FIELDS = ['name', 'stockamount', 'reorder_level',
+                 'price', 'description', 'category', 'SKU']
+# Entries written per transaction by the bulk update, and most per request
+UPDATE_CHUNK_SIZE = 1000
+MAX_UPDATE_ROWS = 10000
+# Fields the bulk update may set; SKU changes go through update_item
+UPDATE_FIELDS = ['name', 'stockamount', 'reorder_level',
+                 'price', 'description', 'category']
+
 
 @app_views.route('/companies/<company_id>/items',
                  methods=['GET'], strict_slashes=False)
@@ -24,10 +45,76 @@ def get_company_items(current_user, company_id):
     if current_user.role == 'company' and current_user.public_id != company_id:
         return jsonify({'Error': 'Invalid access'}), 403
 
-    all_items = storage.all(Items)
-    list_items = [item.to_dict() for
-                  item in all_items if item.company_id == company_id]
-    return jsonify(list_items)
+    return paginated_response(Items, company_id=company_id)
+
+
+@app_views.route('/companies/<company_id>/items/reorder',
+                 methods=['GET'], strict_slashes=False)
+@token_required
+def get_company_reorder_report(current_user, company_id):
+    """Retrieve a company's items at or below their reorder level"""
+    if current_user.role not in roles:
+        return jsonify({'Error': 'Invalid access'}), 403
+
+    # restricts companies from accessing other companies' profiles
+    if current_user.role == 'company' and current_user.public_id != company_id:
+        return jsonify({'Error': 'Invalid access'}), 403
+
+    return paginated_response(Items, company_id=company_id,
+                              needs_reorder=True)
+
+
+@app_views.route('/items/reorder', methods=['GET'], strict_slashes=False)
+@token_required
+def get_reorder_report(current_user):
+    """Retrieve every item at or below its reorder level"""
+    if current_user.role != 'admin':
+        return jsonify({'Error': 'Invalid access'}), 403
+
+    return paginated_response(Items, needs_reorder=True)
+
+
+def category_facets(company_id=None):
+    """Categories with their item and in-stock counts, most items first
+
+    Read from the category_counts summary table, which
+    refresh_category_counts.py rebuilds; company_id None gives the
+    totals across companies.
+    """
+    counts = storage.query(CategoryCount, company_id=company_id)\
+        .order_by(CategoryCount.item_count.desc(),
+                  CategoryCount.category).all()
+    refreshed_at = max((count.created_at for count in counts), default=None)
+    return jsonify({
+        'categories': [{'category': count.category,
+                        'item_count': count.item_count,
+                        'in_stock_count': count.in_stock_count}
+                       for count in counts],
+        'refreshed_at': refreshed_at.isoformat() if refreshed_at else None
+    })
+
+
+@app_views.route('/companies/<company_id>/items/categories',
+                 methods=['GET'], strict_slashes=False)
+@token_required
+def get_company_categories(current_user, company_id):
+    """Retrieve the categories of a company's catalogue with counts"""
+    all_roles = ['admin', 'client', 'company']
+    if current_user.role not in all_roles:
+        return jsonify({'Error': 'Invalid access'}), 403
+
+    return category_facets(company_id)
+
+
+@app_views.route('/items/categories', methods=['GET'], strict_slashes=False)
+@token_required
+def get_categories(current_user):
+    """Retrieve the categories of all catalogues with counts"""
+    all_roles = ['admin', 'client', 'company']
+    if current_user.role not in all_roles:
+        return jsonify({'Error': 'Invalid access'}), 403
+
+    return category_facets()
 
 
 @app_views.route('/items', methods=['GET'], strict_slashes=False)
@@ -38,9 +125,7 @@ def get_all_items(current_user):
     if current_user.role not in all_roles:
         return jsonify({'Error': 'Unauthorized access'}), 403
 
-    all_items = storage.all(Items)
-    list_items = [item.to_dict() for item in all_items]
-    return jsonify(list_items)
+    return paginated_response(Items)
 
 
 @app_views.route('/items/<item_id>',
@@ -62,6 +147,88 @@ def get_item(current_user, item_id):
     return jsonify(item.to_dict())
 
 
+@app_views.route('/items/<item_id>/availability',
+                 methods=['GET'], strict_slashes=False)
+@token_required
+def get_item_availability(current_user, item_id):
+    """Retrieve the stock available and held by pending orders"""
+    all_roles = ['admin', 'client', 'company']
+    if current_user.role not in all_roles:
+        return jsonify({'Error': 'Invalid access'}), 403
+
+    item = storage.get(Items, item_id)
+    if not item:
+        return jsonify({'Error': 'Item not found'}), 404
+
+    # Stock held by pending orders is already off initial_stock
+    reserved = storage.reserved_quantities([item.public_id])
+    return jsonify({'item_id': item.public_id,
+                    'available': item.initial_stock,
+                    'reserved': reserved.get(item.public_id, 0)})
+
+
+@app_views.route('/items/<item_id>/stock',
+                 methods=['GET'], strict_slashes=False)
+@token_required
+def get_item_stock(current_user, item_id):
+    """Retrieve the stock of an item at ?at= (default now) from the ledger"""
+    if current_user.role not in roles:
+        return jsonify({'Error': 'Invalid access'}), 403
+
+    item = storage.get(Items, item_id)
+    if not item:
+        return jsonify({'Error': 'Item not found'}), 404
+
+    # restricts companies from accessing other companies' items
+    if (current_user.role == 'company' and
+            current_user.public_id != item.company_id):
+        return jsonify({'Error': 'Invalid access'}), 403
+
+    try:
+        at = datetime.fromisoformat(request.args['at']) \
+            if request.args.get('at') else datetime.utcnow()
+    except ValueError:
+        return jsonify({'Error': 'at must be an ISO 8601 time'}), 400
+
+    snapshot = storage.latest_snapshot(item.public_id, at)
+    return jsonify({'item_id': item.public_id,
+                    'at': at.isoformat(),
+                    'stock': storage.stock_at(item.public_id, at),
+                    'snapshot': snapshot.to_dict() if snapshot else None})
+
+
+@app_views.route('/items/<item_id>/movements',
+                 methods=['GET'], strict_slashes=False)
+@token_required
+def get_item_movements(current_user, item_id):
+    """Retrieve the stock movements of an item since ?since=, by default
+    since its latest snapshot"""
+    if current_user.role not in roles:
+        return jsonify({'Error': 'Invalid access'}), 403
+
+    item = storage.get(Items, item_id)
+    if not item:
+        return jsonify({'Error': 'Item not found'}), 404
+
+    # restricts companies from accessing other companies' items
+    if (current_user.role == 'company' and
+            current_user.public_id != item.company_id):
+        return jsonify({'Error': 'Invalid access'}), 403
+
+    criteria = {'item_id': item.public_id}
+    if request.args.get('since'):
+        try:
+            criteria['created_at__gt'] = datetime.fromisoformat(
+                request.args['since'])
+        except ValueError:
+            return jsonify({'Error': 'since must be an ISO 8601 time'}), 400
+    else:
+        snapshot = storage.latest_snapshot(item.public_id)
+        if snapshot and snapshot.last_sequence:
+            criteria['sequence__gt'] = snapshot.last_sequence
+    return paginated_response(StockMovement, **criteria)
+
+
 @app_views.route('/items',
                  methods=['POST'], strict_slashes=False)
 @token_required
@@ -87,7 +254,9 @@ def add_item(current_user):
             return jsonify({'Error': f'{field} is missing'}), 400
     # Calculate initial_stock based on stockamount
     data['initial_stock'] = data['stockamount']
-    data["public_id"] = str(uuid.uuid4())
+    # Computed by the database
+    data.pop('needs_reorder', None)
+    data["public_id"] = new_public_id()
 
     instance = Items(**data)
     try:
@@ -128,7 +297,8 @@ def update_item(current_user, item_id):
         return jsonify({'Error': 'Invalid access'}), 403
 
     ignored_fields = ['public_id', 'created_at',
-                      'updated_at', 'company_id', 'initial_stock']
+                      'updated_at', 'company_id', 'initial_stock',
+                      'needs_reorder']
 
     item = storage.get(Items, item_id)
     if not item:
@@ -188,3 +358,327 @@ def delete_item(current_user, item_id):
                         f"Item {item.public_id} deleted successfully"}), 200
     except IntegrityError as e:
         return jsonify({"Error during deletion": f"{str(e)}"}), 400
+
+
+class UploadError(ValueError):
+    """An upload that cannot be read from a given line on"""
+
+    def __init__(self, line, reason):
+        """Error reading line of the upload"""
+        super().__init__(f'Line {line}: {reason}')
+        self.line = line
+
+
+def decode_lines(stream):
+    """Yield the lines of a UTF-8 upload, without a byte order mark
+
+    Lines are decoded one by one so an invalid byte is reported with
+    its line, as an UploadError.
+    """
+    for number, line in enumerate(stream, start=1):
+        try:
+            yield line.decode('utf-8-sig' if number == 1 else 'utf-8')
+        except UnicodeDecodeError:
+            raise UploadError(number, 'Not valid UTF-8') from None
+
+
+def read_import_rows(stream, content_type):
+    """Yield (line number, row dict) from a CSV or NDJSON upload
+
+    Rows are parsed as the body streams in; a line that is not a JSON
+    object yields a string error instead of a dict. Raises UploadError
+    where the rest of the upload cannot be read.
+    """
+    lines = decode_lines(stream)
+    if 'csv' in content_type:
+        reader = csv.DictReader(lines)
+        try:
+            for row in reader:
+                yield reader.line_num, row
+        except csv.Error as e:
+            # DictReader only copies line_num after a row parses
+            raise UploadError(reader.reader.line_num, str(e)) from None
+        return
+    for number, line in enumerate(lines, start=1):
+        if not line.strip():
+            continue
+        try:
+            row = json.loads(line)
+        except ValueError:
+            row = None
+        yield number, row if isinstance(row, dict) else 'Not a JSON object'
+
+
+def clean_import_row(row):
+    """Item columns of an imported row, or the reason it is invalid"""
+    if not isinstance(row, dict):
+        return row
+    for field in IMPORT_FIELDS:
+        if row.get(field) in (None, ''):
+            return f'{field} is missing'
+    item = {field: row[field] for field in IMPORT_FIELDS}
+    for field in ('name', 'description', 'category', 'SKU'):
+        item[field] = str(item[field])
+        if len(item[field]) > 255:
+            return f'{field} is longer than 255 characters'
+    try:
+        item['stockamount'] = int(item['stockamount'])
+        item['reorder_level'] = int(item['reorder_level'])
+        item['price'] = float(item['price'])
+    except (TypeError, ValueError):
+        return 'stockamount, reorder_level and price must be numbers'
+    if item['stockamount'] < 0:
+        return 'Stock amount should be non-negative'
+    if item['reorder_level'] < 0:
+        return 'Reorder level should be non-negative'
+    return item
+
+
+def import_chunk(company_id, chunk, upsert, seen_skus):
+    """Validate and write one chunk of (line, row) pairs
+
+    New SKUs are inserted with one executemany; with upsert, SKUs the
+    company already has are updated with another. Returns the inserted
+    and updated counts and the (line, SKU, error) of rejected rows.
+    """
+    errors, valid = [], []
+    for line, row in chunk:
+        item = clean_import_row(row)
+        if isinstance(item, str):
+            errors.append((line, row.get('SKU') if isinstance(row, dict)
+                           else None, item))
+        elif item['SKU'] in seen_skus:
+            errors.append((line, item['SKU'], 'Duplicate SKU in upload'))
+        else:
+            seen_skus.add(item['SKU'])
+            valid.append((line, item))
+
+    # Look the chunk's SKUs up with one query
+    existing = {found.SKU: found for found in storage.query(
+        Items, SKU__in=[item['SKU'] for line, item in valid])
+        .with_entities(Items.SKU, Items.public_id, Items.company_id)}
+    inserts, updates = [], []
+    now = datetime.utcnow()
+    for line, item in valid:
+        found = existing.get(item['SKU'])
+        if not found:
+            inserts.append((line, dict(
+                item, public_id=new_public_id(), company_id=company_id,
+                initial_stock=item['stockamount'],
+                created_at=now, updated_at=now)))
+        elif not upsert:
+            errors.append((line, item['SKU'], 'Duplicate SKU'))
+        elif found.company_id != company_id:
+            errors.append((line, item['SKU'],
+                           'SKU belongs to another company'))
+        else:
+            updates.append((line, dict(item, public_id=found.public_id)))
+
+    # Items may have been deleted since the lookup: update_catalogue
+    # skips those rows
+    skipped = set(storage.update_catalogue([row for line, row in updates]))
+    storage.save()
+    for line, row in updates:
+        if row['public_id'] in skipped:
+            errors.append((line, row['SKU'], 'Item not found'))
+    try:
+        storage.bulk_insert(Items, [row for line, row in inserts])
+        storage.save()
+        inserted = len(inserts)
+    except IntegrityError:
+        # A concurrent import took some SKUs: insert row by row instead
+        storage.rollback()
+        inserted = 0
+        for line, row in inserts:
+            try:
+                storage.bulk_insert(Items, [row])
+                storage.save()
+                inserted += 1
+            except IntegrityError:
+                storage.rollback()
+                errors.append((line, row['SKU'], 'Duplicate SKU'))
+    return inserted, len(updates) - len(skipped), errors
+
+
+@app_views.route('/companies/<company_id>/items/import',
+                 methods=['POST'], strict_slashes=False)
+@token_required
+def import_items(current_user, company_id):
+    """Bulk import a company catalogue from a CSV or NDJSON upload
+
+    The body is read as it streams in and written IMPORT_CHUNK_SIZE
+    rows per transaction. Invalid rows are reported, not fatal. With
+    ?upsert=true, SKUs the company already has are updated. An upload
+    that cannot be read to the end keeps the chunks before the failing
+    line and reports it with a 400.
+    """
+    if current_user.role not in roles:
+        return jsonify({'Error': 'Invalid access'}), 403
+
+    # restricts companies from accessing other companies' profiles
+    if current_user.role == 'company' and current_user.public_id != company_id:
+        return jsonify({'Error': 'Invalid access'}), 403
+
+    content_type = request.content_type or ''
+    if not any(kind in content_type for kind in ('csv', 'ndjson', 'jsonl')):
+        return jsonify({
+            'Error': 'Upload text/csv or application/x-ndjson'}), 415
+
+    if not storage.get(Company, company_id):
+        return jsonify({'Error': 'Company not found'}), 404
+
+    upsert = request.args.get('upsert', '').lower() in ('1', 'true')
+    inserted = updated = error_count = 0
+    errors = []
+    seen_skus = set()
+    chunk = []
+    failure = None
+    rows = read_import_rows(request.stream, content_type)
+    while True:
+        try:
+            row = next(rows, None)
+        except UploadError as e:
+            # Write the rows read so far, then stop
+            failure, row = e, None
+        if row is not None:
+            chunk.append(row)
+        if chunk and (row is None or len(chunk) == IMPORT_CHUNK_SIZE):
+            counts = import_chunk(company_id, chunk, upsert, seen_skus)
+            inserted += counts[0]
+            updated += counts[1]
+            error_count += len(counts[2])
+            errors.extend(counts[2][:IMPORT_MAX_ERRORS - len(errors)])
+            chunk = []
+        if row is None:
+            break
+
+    report = {
+        'inserted': inserted,
+        'updated': updated,
+        'error_count': error_count,
+        'errors': [{'line': line, 'SKU': sku, 'Error': error}
+                   for line, sku, error in errors]
+    }
+    if failure:
+        return jsonify(dict(report, Error=str(failure))), 400
+    return jsonify(report), 200
+
+
+def clean_update_fields(fields):
+    """Columns to set from a bulk update entry, or why it is invalid"""
+    if not isinstance(fields, dict) or not fields:
+        return 'fields must be a non-empty object'
+    for key, value in fields.items():
+        if key not in UPDATE_FIELDS:
+            if key in Items.__table__.columns:
+                return f'{key} cannot be modified'
+            return f'Unknown field {key}'
+        if key in ('stockamount', 'reorder_level'):
+            if (not isinstance(value, int) or isinstance(value, bool)
+                    or value < 0):
+                return f'Invalid {key}'
+        elif key == 'price':
+            if (not isinstance(value, (int, float))
+                    or isinstance(value, bool)):
+                return 'Invalid price'
+        elif not isinstance(value, str) or not value or len(value) > 255:
+            return f'Invalid {key}'
+    return dict(fields)
+
+
+def update_chunk(current_user, chunk, seen_ids):
+    """Resolve, validate and write one chunk of bulk update entries
+
+    Items are looked up with one query per kind of identifier and the
+    valid entries are written in one transaction. Returns one result
+    per entry, in order.
+    """
+    entries = [entry for entry in chunk if isinstance(entry, dict)]
+    item_ids = [entry['item_id'] for entry in entries
+                if entry.get('item_id')]
+    skus = [entry['SKU'] for entry in entries
+            if not entry.get('item_id') and entry.get('SKU')]
+    by_id, by_sku = {}, {}
+    if item_ids:
+        by_id = {item.public_id: item for item in storage.query(
+            Items, public_id__in=item_ids).with_entities(
+            Items.public_id, Items.company_id)}
+    if skus:
+        by_sku = {item.SKU: item for item in storage.query(
+            Items, SKU__in=skus).with_entities(
+            Items.SKU, Items.public_id, Items.company_id)}
+
+    results, rows = [], []
+    for entry in chunk:
+        if not isinstance(entry, dict) or not (entry.get('item_id')
+                                               or entry.get('SKU')):
+            results.append({'status': 400,
+                            'Error': 'item_id or SKU is required'})
+            continue
+        if entry.get('item_id'):
+            result = {'item_id': entry['item_id']}
+            item = by_id.get(entry['item_id'])
+        else:
+            result = {'SKU': entry['SKU']}
+            item = by_sku.get(entry['SKU'])
+        results.append(result)
+        fields = clean_update_fields(entry.get('fields'))
+        if not item:
+            result.update(status=404, Error='Item not found')
+        # restricts companies from updating other companies' items
+        elif (current_user.role == 'company' and
+                current_user.public_id != item.company_id):
+            result.update(status=403, Error='Invalid access')
+        elif isinstance(fields, str):
+            result.update(status=400, Error=fields)
+        elif item.public_id in seen_ids:
+            result.update(status=400, Error='Item is updated twice')
+        else:
+            seen_ids.add(item.public_id)
+            result.update(item_id=item.public_id, status=200)
+            rows.append(dict(fields, public_id=item.public_id))
+
+    try:
+        storage.update_items(rows)
+        storage.save()
+    except IntegrityError as e:
+        storage.rollback()
+        for result in results:
+            if result['status'] == 200:
+                result.update(status=400, Error='Invalid data',
+                              message=str(e.orig))
+    return results
+
+
+@app_views.route('/items', methods=['PATCH'], strict_slashes=False)
+@token_required
+def update_items(current_user):
+    """Update the price, stock or other fields of many items at once
+
+    The body is a list of {item_id or SKU, fields}. Entries that set
+    the same fields are written together with one UPDATE, in one
+    transaction per UPDATE_CHUNK_SIZE entries. As in update_item, a
+    stockamount is added to the available stock.
+    """
+    if current_user.role not in roles:
+        return jsonify({'Error': 'Invalid access'}), 403
+
+    data = request.get_json(silent=True)
+    if not isinstance(data, list) or not data:
+        return jsonify({'Error': 'Expected a list of item updates'}), 400
+    if len(data) > MAX_UPDATE_ROWS:
+        return jsonify({
+            'Error': f'At most {MAX_UPDATE_ROWS} items per request'}), 400
+
+    results = []
+    seen_ids = set()
+    for start in range(0, len(data), UPDATE_CHUNK_SIZE):
+        results.extend(update_chunk(
+            current_user, data[start:start + UPDATE_CHUNK_SIZE], seen_ids))
+
+    updated = sum(result['status'] == 200 for result in results)
+    return jsonify({
+        'updated': updated,
+        'error_count': len(results) - updated,
+        'results': results
+    }), 200
@@ -6,13 +6,18 @@ from models import storage
 from models.order_items import OrderItems
 from models.items import Items
 from flask import jsonify, request
-from models.orders import Orders
+from models.orders import Orders, reservation_deadline
 from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import joinedload
 from .token_auth import token_required
-import uuid
+from .pagination import paginated_response
+from models.ids import new_public_id
 
 roles = ["admin", "client"]
 
+# Load plan: an order line with its item and order in a single query
+ORDER_ITEM_PLAN = (joinedload(OrderItems.item), joinedload(OrderItems.order))
+
 
 @app_views.route('/orders/<order_id>/order_items',
                  methods=['GET'], strict_slashes=False)
@@ -22,11 +27,7 @@ def get_order_items(current_user, order_id):
     if current_user.role not in roles:
         return jsonify({'Error': 'Invalid role'})
 
-    all_order_items = storage.all(OrderItems)
-    list_items = [item.to_dict() for
-                  item in all_order_items if
-                  item.order_id == order_id]
-    return jsonify(list_items)
+    return paginated_response(OrderItems, order_id=order_id)
 
 
 @app_views.route('/orders/<order_id>/order_items/<order_item_id>',
@@ -62,19 +63,16 @@ def add_order_item(current_user, order_id):
         return jsonify({"Error": "Item not found"}), 404
 
     # Check if the item_id already exists in the order_id
-    order_items = storage.all(OrderItems)
-    existing_order_item = next((oi for oi in order_items if
-                                oi.order_id == order_id and
-                                oi.item_id == data['item_id']), None)
+    existing_order_item = storage.query(OrderItems,
+                                        order_id=order_id,
+                                        item_id=data['item_id']).first()
     if existing_order_item:
         return jsonify({"Error": "Item already exists in the order"}), 400
 
-    if data['quantity_ordered'] > item.initial_stock:
-        return jsonify({"Error": "Insufficient stock"}), 400
     price_at_order_time = item.price * data['quantity_ordered']
 
     order_item = OrderItems(
-        public_id=str(uuid.uuid4()),
+        public_id=new_public_id(),
         order_id=order_id,
         item_id=data['item_id'],
         quantity_ordered=data['quantity_ordered'],
@@ -84,28 +82,39 @@ def add_order_item(current_user, order_id):
     order = storage.get(Orders, order_id)
     if not order:
         return jsonify({"Error": "Order not found"})
-
-    # Calculate the new order total
-    new_order_total = order.order_total + price_at_order_time
-    order.order_total = new_order_total
+    # Stock is only held (and released by the sweeper) for pending orders
+    if order.status != 'Pending':
+        return jsonify({"Error": "Only pending orders can take items"}), 400
 
     try:
+        # Calculate the new order total in SQL, safe from concurrent
+        # lines, while the order is still pending: the sweeper or a
+        # payment may be cancelling it
+        if not storage.update_pending_order(
+                order.public_id,
+                order_total=Orders.order_total + price_at_order_time,
+                reserved_until=reservation_deadline()):
+            storage.rollback()
+            return jsonify({
+                "Error": "Only pending orders can take items"}), 400
+        # Reserve the stock, the line and the total in one transaction
+        if not storage.reserve_stock(item.public_id,
+                                     data['quantity_ordered'],
+                                     order.public_id):
+            storage.rollback()
+            return jsonify({"Error": "Insufficient stock"}), 400
         storage.new(order_item)
         storage.save()
 
-        # Update the item's initial stock
-        new_initial_stock = item.initial_stock - data['quantity_ordered']
-        item.initial_stock = new_initial_stock
-
-        # Save the updated item
-        storage.save()
-
         return jsonify(order_item.to_dict()), 201
 
     except IntegrityError as e:
+        storage.rollback()
         if 'check_quantity_ordered_gt0' in str(e.orig):
             return jsonify({
                 'Error': 'Quantity ordered should be 1 or more'}), 400
+        if 'uq_order_items_order_id_item_id' in str(e.orig):
+            return jsonify({"Error": "Item already exists in the order"}), 400
         return jsonify({'Error': 'Invalid data', 'message': str(e.orig)}), 400
 
 
@@ -121,44 +130,49 @@ def update_order_item(current_user, order_id, order_item_id):
     ignored_fields = ['public_id', 'created_at', 'updated_at',
                       'order_id', 'price_at_order_time']
     data = request.get_json()
-    order_item = storage.get(OrderItems, order_item_id)
+    order_item = storage.get(OrderItems, order_item_id,
+                             options=ORDER_ITEM_PLAN)
     if not order_item or order_item.order_id != order_id:
         return jsonify({"Error": "Order item not found"}), 404
-    item = storage.get(Items, order_item.item_id)
+    item = order_item.item
     if not item:
         return jsonify({"Error": "Item not found"}), 404
-    if data and 'quantity_ordered' in data and \
-            data['quantity_ordered'] > item.initial_stock:
-        return jsonify({"Error": "Insufficient stock"}), 400
     new_quantity = data.get('quantity_ordered', order_item.quantity_ordered)
     old_quantity = order_item.quantity_ordered
     price_per_item = order_item.price_at_order_time / old_quantity
 
-    if new_quantity > old_quantity:
-        # Deduct the difference from the stock
-        stock_difference = new_quantity - old_quantity
-        if stock_difference > item.initial_stock:
-            return jsonify({"Error": "Insufficient stock"}), 400
-        new_stock = item.initial_stock - stock_difference
-        item.initial_stock = new_stock
-
-    elif new_quantity < old_quantity:
-        # Restock the difference
-        stock_difference = old_quantity - new_quantity
-        new_stock = item.initial_stock + stock_difference
-        item.initial_stock = new_stock
+    # Retrieve the existing order
+    order = order_item.order
+    if not order:
+        return jsonify({"Error": "Order not found"}), 404
 
     # Calculate the new price at order time
     new_price_at_order_time = price_per_item * new_quantity
 
-    # Retrieve the existing order
-    order = storage.get(Orders, order_id)
-    if not order:
-        return jsonify({"Error": "Order not found"}), 404
+    if new_quantity != old_quantity:
+        # Calculate the new order total in SQL, safe from concurrent
+        # lines, while the order still holds its stock
+        values = {'order_total': Orders.order_total
+                  - order_item.price_at_order_time + new_price_at_order_time}
+        if new_quantity > old_quantity:
+            values['reserved_until'] = reservation_deadline()
+        if not storage.update_pending_order(order.public_id, **values):
+            storage.rollback()
+            return jsonify({
+                "Error": "Only pending orders can change items"}), 400
 
-    # Calculate the new order total
-    order.order_total = order.order_total - order_item.price_at_order_time \
-        + new_price_at_order_time
+    if new_quantity > old_quantity:
+        # Deduct the difference from the stock if enough is left
+        if not storage.reserve_stock(item.public_id,
+                                     new_quantity - old_quantity,
+                                     order.public_id):
+            storage.rollback()
+            return jsonify({"Error": "Insufficient stock"}), 400
+
+    elif new_quantity < old_quantity:
+        # Restock the difference
+        storage.restock({item.public_id: old_quantity - new_quantity},
+                        order.public_id)
 
     for key, value in data.items():
         if key not in ignored_fields:
@@ -167,6 +181,7 @@ def update_order_item(current_user, order_id, order_item_id):
         storage.save()
         return jsonify(order_item.to_dict()), 200
     except IntegrityError as e:
+        storage.rollback()
         if 'check_quantity_ordered_gt0' in str(e.orig):
             return jsonify({
                 'Error': 'Quantity ordered should be 1 or more'}), 400
@@ -180,20 +195,22 @@ def delete_order_item(current_user, order_id, item_id):
     """Delete an order item"""
     if current_user.role not in roles:
         return jsonify({'Error': 'Invalid role'})
-    order_item = storage.get(OrderItems, item_id)
+    order_item = storage.get(OrderItems, item_id, options=ORDER_ITEM_PLAN)
     if not order_item or order_item.order_id != order_id:
         return jsonify({"Error": "Order item not found"}), 404
 
-    order = storage.get(Orders, order_id)
+    order = order_item.order
     if not order:
         return jsonify({"Error": "Order not found"}), 404
 
-    item = storage.get(Items, order_item.item_id)
+    item = order_item.item
     if not item:
         return jsonify({"Error": "Item not found"}), 404
-    if order.status == 'Pending':
-        new_stock = item.initial_stock + order_item.quantity_ordered
-        item.initial_stock = new_stock
+    # Only a still pending order holds stock; the touch keeps the sweeper
+    # or a payment from cancelling it (and restocking) meanwhile
+    if storage.update_pending_order(order.public_id):
+        storage.restock({item.public_id: order_item.quantity_ordered},
+                        order.public_id)
     try:
         storage.delete(order_item)
         storage.save()
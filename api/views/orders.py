@@ -6,13 +6,19 @@ from models import storage
 from models.orders import Orders
 from models.client import Client
 from models.address import Address
+from models.items import Items
+from models.order_items import OrderItems
 from flask import jsonify, request
 from sqlalchemy.exc import IntegrityError
 from .token_auth import token_required
-import uuid
+from .pagination import paginated_response
+from models.ids import new_public_id
 
 roles = ['admin', 'client']
 
+# Most distinct items a single checkout may order
+MAX_CHECKOUT_LINES = 500
+
 
 @app_views.route('/orders', methods=['GET'], strict_slashes=False)
 @token_required
@@ -22,9 +28,7 @@ def get_all_orders(current_user):
     if current_user.role not in role:
         return jsonify({'Error': 'Invalid access'}), 403
 
-    all_orders = storage.all(Orders)
-    list_orders = [order.to_dict() for order in all_orders]
-    return jsonify(list_orders)
+    return paginated_response(Orders)
 
 
 @app_views.route('/clients/<client_id>/orders',
@@ -40,10 +44,7 @@ def get_client_orders(current_user, client_id):
             current_user.public_id != client_id):
         return jsonify({'Error': 'Invalid access'}), 403
 
-    all_orders = storage.all(Orders)
-    list_orders = [order.to_dict() for
-                   order in all_orders if order.client_id == client_id]
-    return jsonify(list_orders)
+    return paginated_response(Orders, client_id=client_id)
 
 
 @app_views.route('/orders/<order_id>', methods=['GET'], strict_slashes=False)
@@ -107,7 +108,7 @@ def add_order(current_user):
         return jsonify({"Error": "Order total cannot be set manually"}), 400
 
     data['status'] = 'pending'
-    data["public_id"] = str(uuid.uuid4())
+    data["public_id"] = new_public_id()
 
     instance = Orders(**data)
     try:
@@ -126,6 +127,93 @@ def add_order(current_user):
     return jsonify(instance.to_dict()), 201
 
 
+@app_views.route('/orders/checkout', methods=['POST'], strict_slashes=False)
+@token_required
+def checkout(current_user):
+    """Create an order with all its line items in one transaction"""
+    if current_user.role not in roles:
+        return jsonify({'Error': 'Invalid access'}), 403
+
+    data = request.get_json()
+    if not data:
+        return jsonify({"Error": "Not a valid JSON"}), 400
+    for field in ['shipping_address_id', 'items']:
+        if field not in data:
+            return jsonify({"Error": f"{field} is required"}), 400
+
+    lines = data['items']
+    if not isinstance(lines, list) or not lines:
+        return jsonify({"Error": "items must be a non-empty list"}), 400
+
+    # Quantities by item, adding up repeated items
+    quantities = {}
+    for line in lines:
+        if not isinstance(line, dict):
+            line = {}
+        quantity = line.get('quantity')
+        if (not line.get('item_id') or not isinstance(quantity, int) or
+                isinstance(quantity, bool) or quantity < 1):
+            return jsonify({
+                "Error": "Each item needs an item_id and a quantity "
+                         "of 1 or more"}), 400
+        quantities[line['item_id']] = \
+            quantities.get(line['item_id'], 0) + quantity
+    if len(quantities) > MAX_CHECKOUT_LINES:
+        return jsonify({
+            "Error": f"At most {MAX_CHECKOUT_LINES} items per order"}), 400
+
+    client_id = data.get('client_id', current_user.public_id)
+    # restrict unrestricted user access
+    if current_user.role == 'client' and current_user.public_id != client_id:
+        return jsonify({'Error': 'Invalid access'}), 403
+
+    # The address must belong to the client, which also proves it exists
+    address = storage.get(Address, data['shipping_address_id'])
+    if not address:
+        return jsonify({"Error": "Address not found"}), 400
+    if address.client_id != client_id:
+        return jsonify({"Error": "Address not associated with client"}), 400
+
+    # Validate every item with one query
+    items = storage.get_many(Items, quantities)
+    missing = [item_id for item_id in quantities if item_id not in items]
+    if missing:
+        return jsonify({"Error": "Item not found", "item_ids": missing}), 404
+
+    order = Orders(public_id=new_public_id(), client_id=client_id,
+                   shipping_address_id=address.public_id, status='Pending',
+                   order_total=sum(items[item_id].price * quantity
+                                   for item_id, quantity
+                                   in quantities.items()))
+    order.extend_reservation()
+    order_items = [{'public_id': new_public_id(),
+                    'order_id': order.public_id,
+                    'item_id': item_id,
+                    'quantity_ordered': quantity,
+                    'price_at_order_time': items[item_id].price * quantity}
+                   for item_id, quantity in quantities.items()]
+
+    try:
+        # Reserve all stock in one UPDATE; any shortfall cancels the order
+        if not storage.reserve_stocks(quantities, order.public_id):
+            storage.rollback()
+            short = [item_id for item_id, quantity in quantities.items()
+                     if items[item_id].initial_stock < quantity]
+            return jsonify({"Error": "Insufficient stock",
+                            "item_ids": short}), 400
+        storage.new(order)
+        storage.bulk_insert(OrderItems, order_items)
+        storage.save()
+    except IntegrityError as e:
+        storage.rollback()
+        return jsonify({'Error':
+                        'Integrity error occurred', 'Message': str(e)}), 400
+
+    result = order.to_dict()
+    result['order_items'] = order_items
+    return jsonify(result), 201
+
+
 @app_views.route('/orders/<order_id>', methods=['PUT'], strict_slashes=False)
 @token_required
 def update_order(current_user, order_id):
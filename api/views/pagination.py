@@ -0,0 +1,74 @@
+#!/usr/bin/python3
+"""Cursor pagination and streaming helpers for collection endpoints"""
+from flask import request, jsonify, json, Response, stream_with_context
+from models import storage
+
+DEFAULT_LIMIT = 100
+MAX_LIMIT = 1000
+# Rows serialized per chunk written to the client when streaming
+STREAM_CHUNK_SIZE = 500
+
+
+def paginated_response(cls, *conditions, **criteria):
+    """Serialize one keyset page of cls objects
+    Args:
+        cls: model class being listed
+        conditions, criteria: filters forwarded to storage.paginate
+    Returns:
+        json response with the page results and the next_cursor token
+        (plus an approximate total header for unfiltered lists),
+        the whole collection as a streamed array when ?stream=true,
+        or an error response on an invalid limit or cursor
+    """
+    if request.args.get('stream', '').lower() in ('1', 'true'):
+        return streamed_response(cls, *conditions, **criteria)
+
+    try:
+        limit = int(request.args.get('limit', DEFAULT_LIMIT))
+    except ValueError:
+        return jsonify({'Error': 'limit must be an integer'}), 400
+    if limit < 1 or limit > MAX_LIMIT:
+        return jsonify({
+            'Error': f'limit must be between 1 and {MAX_LIMIT}'}), 400
+
+    try:
+        page, next_cursor = storage.paginate(
+            cls, *conditions, limit=limit,
+            cursor=request.args.get('cursor'), **criteria)
+    except ValueError:
+        return jsonify({'Error': 'Invalid cursor'}), 400
+
+    response = jsonify({'results': [obj.to_dict() for obj in page],
+                        'next_cursor': next_cursor})
+    if not conditions and not criteria:
+        # Cached estimate; exact totals would scan the whole table
+        response.headers['X-Approximate-Total-Count'] = storage.count(
+            cls, approximate=True)
+    return response
+
+
+def streamed_response(cls, *conditions, **criteria):
+    """Stream every matching cls object as one JSON array
+    Args:
+        cls: model class being exported
+        conditions, criteria: filters forwarded to storage.stream
+    Returns:
+        response whose body is written chunk by chunk from a
+        server-side cursor, so memory does not grow with the result
+    """
+    def generate():
+        yield '['
+        chunk = []
+        first = True
+        for obj in storage.stream(cls, *conditions, **criteria):
+            chunk.append(json.dumps(obj.to_dict()))
+            if len(chunk) == STREAM_CHUNK_SIZE:
+                yield ('' if first else ',') + ','.join(chunk)
+                first = False
+                chunk = []
+        if chunk:
+            yield ('' if first else ',') + ','.join(chunk)
+        yield ']'
+
+    return Response(stream_with_context(generate()),
+                    mimetype='application/json')
@@ -6,14 +6,22 @@ from models import storage
 from models.payments import Payments
 from models.orders import Orders
 from models.client import Client
-from models.items import Items
 from flask import jsonify, request
 from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import joinedload, selectinload
 from datetime import datetime
-import uuid
+from models.ids import new_public_id
 from .token_auth import token_required
+from .pagination import paginated_response
 roles = ['client', 'admin']
 
+# Load plans: relationships each endpoint walks, loaded up front so the
+# number of queries does not grow with the number of order lines
+PAYMENT_ORDER_PLAN = (joinedload(Payments.order),)
+PAYMENT_ORDER_LINES_PLAN = (
+    joinedload(Payments.order).selectinload(Orders.order_items),)
+ORDER_LINES_PLAN = (selectinload(Orders.order_items),)
+
 
 @app_views.route('/clients/<client_id>/payments',
                  methods=['GET'], strict_slashes=False)
@@ -26,18 +34,9 @@ def get_client_payments(current_user, client_id):
     if current_user.role == 'client' and current_user.public_id != client_id:
         return jsonify({'Error': 'Invalid access'}), 403
 
-    # Retrieve all orders for the specified client
-    all_orders = storage.all(Orders)
-    client_orders = [order.public_id
-                     for order in all_orders
-                     if order.client_id == client_id]
-
-    # Retrieve all payments for the client's orders
-    all_payments = storage.all(Payments)
-    list_payments = [payment.to_dict()
-                     for payment in all_payments
-                     if payment.order_id in client_orders]
-    return jsonify(list_payments)
+    # Retrieve the payments for the client's orders in one query
+    return paginated_response(
+        Payments, Payments.order.has(Orders.client_id == client_id))
 
 
 @app_views.route('/payments', methods=['GET'], strict_slashes=False)
@@ -47,9 +46,7 @@ def get_all_payments(current_user):
     if current_user.role != 'admin':
         return jsonify({'Error': 'Invalid role'}), 403
 
-    all_payments = storage.all(Payments)
-    list_payments = [payment.to_dict() for payment in all_payments]
-    return jsonify(list_payments)
+    return paginated_response(Payments)
 
 
 @app_views.route('/orders/<order_id>/payments',
@@ -68,10 +65,7 @@ def get_order_payments(current_user, order_id):
             current_user.public_id != order.client_id:
         return jsonify({'Error': 'Invalid access'}), 403
 
-    all_payments = storage.all(Payments)
-    list_payments = [payment.to_dict() for
-                     payment in all_payments if payment.order_id == order_id]
-    return jsonify(list_payments)
+    return paginated_response(Payments, order_id=order_id)
 
 
 @app_views.route('/payments/<payment_id>',
@@ -82,12 +76,11 @@ def get_payment(current_user, payment_id):
     if current_user.role not in roles:
         return jsonify({'Error': 'Invalid role'}), 403
 
-    payment = storage.get(Payments, payment_id)
+    payment = storage.get(Payments, payment_id, options=PAYMENT_ORDER_PLAN)
     if not payment:
         return jsonify({'Error': 'Payment not found'}), 404
 
-    order_id = payment.order_id
-    order = storage.get(Orders, order_id)
+    order = payment.order
     if not order:
         return jsonify({'Error': 'Order not found'}), 404
     # restricts to ensure each user services his orders alone
@@ -112,7 +105,7 @@ def add_payment(current_user):
         return jsonify({"Error": "Not a valid JSON"}), 400
 
     # Check if order exist
-    order = storage.get(Orders, data['order_id'])
+    order = storage.get(Orders, data['order_id'], options=ORDER_LINES_PLAN)
     if not order:
         return jsonify({'Error': 'Order not found'}), 404
 
@@ -122,6 +115,13 @@ def add_payment(current_user):
             'Error': f'Invalid access {current_user.public_id} \
                 vs {order.client_id}'}), 403
 
+    # Cancelled orders (e.g. expired reservations) gave their stock back
+    if order.status == 'Cancelled':
+        return jsonify({
+            'Error': 'Cannot pay for a cancelled order'}), 400
+    if order.status != 'Pending':
+        return jsonify({'Error': 'Only pending orders can be paid'}), 400
+
     required_fields = ['order_id', 'amount_paid',
                        'transaction_reference_number']
 
@@ -133,11 +133,6 @@ def add_payment(current_user):
     if amount_paid < order.order_total:
         payment_status = 'Failed'
         order_status = 'Cancelled'
-        # Restock items
-        for order_item in order.order_items:
-            item = storage.get(Items, order_item.item_id)
-            if item:
-                item.initial_stock += order_item.quantity_ordered
     else:
         payment_status = 'Completed'
         order_status = 'Shipped'
@@ -151,7 +146,7 @@ def add_payment(current_user):
         data['currency'] = 'KES'
 
     instance = Payments(
-        public_id=str(uuid.uuid4()),
+        public_id=new_public_id(),
         order_id=data['order_id'],
         amount_paid=amount_paid,
         status=payment_status,
@@ -161,7 +156,18 @@ def add_payment(current_user):
         payment_date=datetime.utcnow()
     )
 
-    order.status = order_status
+    # Only the request that moves the order out of Pending ships it or
+    # gives its stock back; the sweeper or another payment may have won
+    if not storage.update_pending_order(order.public_id,
+                                        status=order_status,
+                                        reserved_until=None):
+        storage.rollback()
+        return jsonify({'Error': 'Only pending orders can be paid'}), 400
+    if order_status == 'Cancelled':
+        # Restock items in one UPDATE
+        storage.restock({order_item.item_id: order_item.quantity_ordered
+                         for order_item in order.order_items},
+                        order.public_id)
 
     try:
         storage.new(instance)
@@ -188,15 +194,13 @@ def update_payment(current_user, payment_id):
     ignored_fields = ['id', 'created_at', 'updated_at',
                       'client_id', 'order_id', 'payment_date']
 
-    payment = storage.get(Payments, payment_id)
+    payment = storage.get(Payments, payment_id,
+                          options=PAYMENT_ORDER_LINES_PLAN)
     if not payment:
         return jsonify({'Error': 'Payment not found'}), 404
 
-    # restricts to ensure each user services his orders alone
-    order_id = payment.order_id
-
     # Retrieve the associated order
-    order = storage.get(Orders, order_id)
+    order = payment.order
     if not order:
         return jsonify({'Error': 'Order not found'}), 404
     # restricts to ensure each user services his orders alone
@@ -215,29 +219,35 @@ def update_payment(current_user, payment_id):
         if key not in ignored_fields:
             setattr(payment, key, value)
 
-    # Update payment and order status if necessary
-    if 'amount_paid' in data:
-        amount_paid = data['amount_paid']
-        if amount_paid < order.order_total:
-            payment.status = 'Failed'
-            order.status = 'Cancelled'
-            # Restock items
-            for order_item in order.order_items:
-                item = storage.get(Items, order_item.item_id)
-                if item:
-                    new_stock = item.initial_stock + \
-                        order_item.quantity_ordered
-                    item.initial_stock = new_stock
-                else:
-                    payment.status = 'Completed'
-                    order.status = 'Shipped'
-
     # Validate payment method if it is being updated
     if 'payment_method' in data:
         valid_payment_methods = ['Credit Card', 'PayPal', 'M-Pesa']
         if data['payment_method'] not in valid_payment_methods:
+            storage.rollback()
             return jsonify({'Error': 'Invalid payment method'}), 400
 
+    # Update payment and order status if necessary
+    if 'amount_paid' in data:
+        amount_paid = data['amount_paid']
+        if amount_paid < order.order_total:
+            payment.status = 'Failed'
+            order_status = 'Cancelled'
+        else:
+            payment.status = 'Completed'
+            order_status = 'Shipped'
+        # Only the request that moves the order out of Pending ships it
+        # or gives its stock back
+        if not storage.update_pending_order(order.public_id,
+                                            status=order_status,
+                                            reserved_until=None):
+            storage.rollback()
+            return jsonify({'Error': 'The order is no longer pending'}), 400
+        if order_status == 'Cancelled':
+            # Restock items in one UPDATE
+            storage.restock({order_item.item_id: order_item.quantity_ordered
+                             for order_item in order.order_items},
+                            order.public_id)
+
     try:
         storage.save()
         return jsonify(payment.to_dict()), 200
@@ -255,13 +265,19 @@ def delete_payment(current_user, payment_id):
     if current_user.role not in roles:
         return jsonify({'Error': 'Invalid role'}), 403
 
-    payment = storage.get(Payments, payment_id)
+    payment = storage.get(Payments, payment_id,
+                          options=PAYMENT_ORDER_LINES_PLAN)
     if not payment:
         return jsonify({'Error': 'Payment not found'}), 404
 
+    # Retrieve the associated order
+    order = payment.order
+    if not order:
+        return jsonify({'Error': 'Order not found'}), 404
+
     # restricts to ensure each user services his orders alone
-    client = payment.order.client
-    if current_user.role == 'client' and current_user.public_id != client.id:
+    if current_user.role == 'client' and \
+            current_user.public_id != order.client_id:
         return jsonify(
             {'Error': 'Invalid access'}), 403
 
@@ -269,20 +285,13 @@ def delete_payment(current_user, payment_id):
     if payment.status == 'Completed':
         return jsonify({'Error': 'Completed payments cannot be deleted'}), 400
 
-    # Retrieve the associated order
-    order = storage.get(Orders, payment.order_id)
-    if not order:
-        return jsonify({'Error': 'Order not found'}), 404
-
-    # Update order status to 'Cancelled'
-    order.status = 'Cancelled'
-
-    # Restock items
-    for order_item in order.order_items:
-        item = storage.get(Items, order_item.item_id)
-        if item:
-            new_stock = item.initial_stock + order_item.quantity_ordered
-            item.initial_stock = new_stock
+    # Cancel the order, restocking its items in one UPDATE, unless it
+    # already left Pending (a cancelled order gave its stock back)
+    if storage.update_pending_order(order.public_id, status='Cancelled',
+                                    reserved_until=None):
+        storage.restock({order_item.item_id: order_item.quantity_ordered
+                         for order_item in order.order_items},
+                        order.public_id)
 
     try:
         # Delete the payment
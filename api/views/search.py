@@ -0,0 +1,214 @@
+#!/usr/bin/python3
+"""Search Module"""
+
+from api.views import app_views
+from models import storage
+from models.items import Items
+from models.search import SearchIndex, tokenize
+from flask import jsonify, request
+from datetime import datetime, timedelta
+import base64
+import binascii
+import json
+import os
+import threading
+import time
+from .token_auth import token_required
+
+# Results per page of a search, by default and at most
+SEARCH_DEFAULT_LIMIT = 20
+SEARCH_MAX_LIMIT = 100
+
+
+class StaleCursor(ValueError):
+    """A search cursor from an index generation that was replaced"""
+
+
+class ItemSearch:
+    """Items in an in-process SearchIndex, for databases without a
+    full-text index (SQLite)
+
+    The index is loaded on first use and every refresh_interval
+    seconds the items updated since the last merge are merged into a
+    copy, which then replaces it. Searches score the index of the
+    moment without a lock, and cost no I/O beyond loading the page of
+    results. Deleted items are dropped at the merge after a search
+    came across them. Each replacement is a new generation; cursors
+    carry theirs, since scores change between generations.
+    """
+
+    # Seconds re-read on each merge to absorb clock skew between workers
+    SYNC_OVERLAP = 5
+
+    def __init__(self, refresh_interval=5):
+        """Empty index, loaded from the items table on first use"""
+        self.refresh_interval = refresh_interval
+        # (generation, index), replaced as a whole and never changed
+        self.__current = (0, None)
+        self.__discarded = set()
+        # updated_at of the items indexed inside the sync overlap
+        self.__seen = {}
+        self.__synced_at = None
+        self.__next_sync = 0
+        # Serialises merges only
+        self.__lock = threading.Lock()
+
+    def __sync(self):
+        """Merge the items updated since the last sync into a new
+        generation of the index"""
+        generation, index = self.__current
+        if index is not None and time.monotonic() < self.__next_sync:
+            return
+        # Once loaded, searches keep using the current index rather
+        # than wait for a merge another thread is running
+        if not self.__lock.acquire(blocking=index is None):
+            return
+        try:
+            generation, index = self.__current
+            if index is not None and time.monotonic() < self.__next_sync:
+                return
+            started = datetime.utcnow()
+            criteria = {}
+            if index is not None:
+                criteria['updated_at__gte'] = (
+                    self.__synced_at - timedelta(seconds=self.SYNC_OVERLAP))
+            rows = storage.query(Items, **criteria).with_entities(
+                Items.public_id, Items.company_id, Items.name,
+                Items.description, Items.category, Items.SKU,
+                Items.updated_at)
+            merged = SearchIndex() if index is None else None
+            seen = {}
+            for row in rows.yield_per(1000):
+                seen[row.public_id] = row.updated_at
+                # Rows re-read for the overlap are already indexed
+                if self.__seen.get(row.public_id) == row.updated_at:
+                    continue
+                if merged is None:
+                    merged = index.copy()
+                merged.add(row.public_id, ' '.join(
+                    (row.name, row.description, row.category, row.SKU)),
+                    row.company_id)
+            discarded, self.__discarded = self.__discarded, set()
+            if discarded:
+                if merged is None:
+                    merged = index.copy()
+                for item_id in discarded:
+                    merged.remove(item_id)
+            if merged is not None:
+                self.__current = (generation + 1, merged)
+            # Only rows inside the next overlap can be read again
+            self.__seen = {item_id: updated_at
+                           for item_id, updated_at in seen.items()
+                           if updated_at >= started - timedelta(
+                               seconds=self.SYNC_OVERLAP)}
+            self.__synced_at = started
+            self.__next_sync = time.monotonic() + self.refresh_interval
+        finally:
+            self.__lock.release()
+
+    def search(self, query, company_id=None, limit=20, after=None,
+               generation=None):
+        """Index generation and best (score, item_id) matches of query,
+        best first
+
+        after is the (score, item_id) of the last result of the previous
+        page, which must come from the same generation (StaleCursor
+        otherwise).
+        """
+        self.__sync()
+        current, index = self.__current
+        if after is not None and generation != current:
+            raise StaleCursor(generation)
+        return current, index.search(query, company_id, limit, after)
+
+    def discard(self, item_id):
+        """Drop a deleted item from the index at the next merge"""
+        self.__discarded.add(item_id)
+
+
+item_search = ItemSearch(
+    refresh_interval=float(os.environ.get('SEARCH_REFRESH_INTERVAL', 5)))
+
+
+def encode_search_cursor(score, public_id, generation=None):
+    """Opaque cursor pointing just after the result (score, public_id)
+    of the given in-process index generation"""
+    key = json.dumps([score, public_id, generation])
+    return base64.urlsafe_b64encode(key.encode()).decode()
+
+
+def decode_search_cursor(cursor):
+    """Return the (score, public_id, generation) held by a search cursor"""
+    try:
+        score, public_id, generation = json.loads(
+            base64.urlsafe_b64decode(cursor.encode()))
+        if generation is not None:
+            generation = int(generation)
+        return float(score), str(public_id), generation
+    except (binascii.Error, TypeError, ValueError) as e:
+        raise ValueError(f"Invalid cursor: {cursor}") from e
+
+
+@app_views.route('/items/search', methods=['GET'], strict_slashes=False)
+@token_required
+def search_items(current_user):
+    """Search items by name, description, category and SKU, best first
+
+    Uses the FULLTEXT index on MySQL and the in-process index otherwise.
+    ?company_id= restricts the search to one company's catalogue.
+    """
+    all_roles = ['admin', 'client', 'company']
+    if current_user.role not in all_roles:
+        return jsonify({'Error': 'Invalid access'}), 403
+
+    query = request.args.get('q', '')
+    if not tokenize(query):
+        return jsonify({'Error': 'q is required'}), 400
+
+    try:
+        limit = int(request.args.get('limit', SEARCH_DEFAULT_LIMIT))
+    except ValueError:
+        return jsonify({'Error': 'limit must be an integer'}), 400
+    if limit < 1 or limit > SEARCH_MAX_LIMIT:
+        return jsonify({
+            'Error': f'limit must be between 1 and {SEARCH_MAX_LIMIT}'}), 400
+
+    after = generation = None
+    if request.args.get('cursor'):
+        try:
+            score, public_id, generation = decode_search_cursor(
+                request.args['cursor'])
+        except ValueError:
+            return jsonify({'Error': 'Invalid cursor'}), 400
+        after = (score, public_id)
+
+    company_id = request.args.get('company_id')
+    # One extra result tells whether there is a next page
+    if storage.full_text_search:
+        found = [(score, item.public_id, item) for score, item in
+                 storage.search_items(tokenize(query), company_id,
+                                      limit + 1, after)]
+        generation = None
+    else:
+        try:
+            generation, ranked = item_search.search(
+                query, company_id, limit + 1, after, generation)
+        except StaleCursor:
+            return jsonify({
+                'Error': 'The index changed, repeat the search'}), 400
+        items = storage.get_many(Items, [item_id for _, item_id in ranked])
+        found = [(score, item_id, items.get(item_id))
+                 for score, item_id in ranked]
+
+    next_cursor = None
+    if len(found) > limit:
+        found = found[:limit]
+        next_cursor = encode_search_cursor(*found[-1][:2], generation)
+
+    results = []
+    for score, item_id, item in found:
+        if item is None:
+            item_search.discard(item_id)
+            continue
+        results.append(dict(item.to_dict(), score=score))
+    return jsonify({'results': results, 'next_cursor': next_cursor})
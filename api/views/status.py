@@ -0,0 +1,50 @@
+#!/usr/bin/python3
+"""Status Module"""
+
+from api.views import app_views
+from models import storage
+from flask import jsonify
+from .token_auth import token_required, principal_cache
+from .hash_password import password_pool
+
+
+@app_views.route('/status/pool', methods=['GET'], strict_slashes=False)
+@token_required
+def get_pool_status(current_user):
+    """Retrieve live database connection pool statistics"""
+    if current_user.role != 'admin':
+        return jsonify({'Error': 'Invalid access'}), 403
+
+    return jsonify(storage.pool_status())
+
+
+@app_views.route('/status/counts', methods=['GET'], strict_slashes=False)
+@token_required
+def get_counts(current_user):
+    """Retrieve approximate object counts per class for dashboards"""
+    if current_user.role != 'admin':
+        return jsonify({'Error': 'Invalid access'}), 403
+
+    return jsonify(storage.counts(approximate=True))
+
+
+@app_views.route('/status/principal_cache',
+                 methods=['GET'], strict_slashes=False)
+@token_required
+def get_principal_cache_status(current_user):
+    """Retrieve size and hit ratio of the authenticated principal cache"""
+    if current_user.role != 'admin':
+        return jsonify({'Error': 'Invalid access'}), 403
+
+    return jsonify(principal_cache.stats())
+
+
+@app_views.route('/status/password_pool',
+                 methods=['GET'], strict_slashes=False)
+@token_required
+def get_password_pool_status(current_user):
+    """Retrieve load and rejections of the password hashing pool"""
+    if current_user.role != 'admin':
+        return jsonify({'Error': 'Invalid access'}), 403
+
+    return jsonify(password_pool.stats())
@@ -3,10 +3,198 @@
 from functools import wraps
 from flask import request, jsonify, make_response, current_app as app
 import jwt
+import os
+import threading
+import time
+from collections import namedtuple
+from datetime import datetime, timedelta
+from sqlalchemy.exc import IntegrityError
+from models.bloom import BloomFilter
+from models.cache import TTLCache
 from models.client import Client
 from models.company import Company
+from models.revoked_token import RevokedToken
 from models import storage
 
+# Principal classes by token role
+principal_classes = {'client': Client, 'company': Company}
+
+# Columns of a user row needed to authenticate its tokens
+PrincipalRecord = namedtuple('PrincipalRecord', ['public_id', 'role'])
+
+# PrincipalRecords of authenticated users by (role, public_id): plain
+# values, safe to share between threads, unlike ORM objects
+principal_cache = TTLCache(
+    maxsize=int(os.environ.get('PRINCIPAL_CACHE_SIZE', 10000)),
+    ttl=float(os.environ.get('PRINCIPAL_CACHE_TTL', 60)))
+
+
+# Seconds a token's role claim is trusted without looking at the user row
+# (0 checks the row on every request)
+max_staleness = float(os.environ.get('PRINCIPAL_MAX_STALENESS', 300))
+
+# Time each user was last changed or deleted by this worker, by
+# (role, public_id); older tokens of those users are checked at once
+revocations = TTLCache(maxsize=principal_cache.maxsize, ttl=max_staleness)
+
+
+class Principal:
+    """Authenticated user built from verified token claims
+
+    public_id and role come from the claims (or the cached
+    PrincipalRecord); any other attribute loads the user's row in the
+    request's session on first access. Rows are never cached.
+    """
+
+    def __init__(self, kind, public_id, role):
+        """Principal of the kind ('client' or 'company') token role"""
+        self.kind = kind
+        self.public_id = public_id
+        self.role = role
+        self._row = None
+
+    def __getattr__(self, name):
+        """Read attributes missing from the claims off the user row"""
+        if name.startswith('_'):
+            raise AttributeError(name)
+        if self._row is None:
+            self._row = storage.get(principal_classes[self.kind],
+                                    self.public_id)
+            if self._row is None:
+                raise AttributeError(
+                    f"{name}: user {self.public_id} no longer exists")
+        return getattr(self._row, name)
+
+
+def load_principal(role, public_id):
+    """Return the PrincipalRecord of the user behind a token, from the
+    cache when possible, or None if there is no such user"""
+    key = (role, public_id)
+    user = principal_cache.get(key)
+    if user is None and role in principal_classes:
+        cls = principal_classes[role]
+        row = storage.query(cls, public_id=public_id)\
+            .with_entities(*(getattr(cls, field)
+                             for field in PrincipalRecord._fields)).first()
+        if row:
+            user = PrincipalRecord(*row)
+            principal_cache.set(key, user)
+    return user
+
+
+def invalidate_principal(role, public_id):
+    """Forget a cached user after its row changed or was deleted"""
+    principal_cache.invalidate((role, public_id))
+    revocations.set((role, public_id), time.time())
+
+
+class RevocationList:
+    """Revoked token ids in the revoked_tokens table behind a Bloom filter
+
+    Each worker keeps a Bloom filter of the unexpired revoked jtis and
+    merges in rows revoked elsewhere every refresh_interval seconds, so
+    checking a token that was never revoked costs no I/O. Only filter
+    hits (revoked tokens and rare false positives) query the table.
+    """
+
+    # Seconds re-read on each merge to absorb clock skew between workers
+    SYNC_OVERLAP = 5
+
+    def __init__(self, capacity=100000, error_rate=0.001,
+                 refresh_interval=30):
+        """Empty list, loaded from the table on first use"""
+        self.capacity = capacity
+        self.error_rate = error_rate
+        self.refresh_interval = refresh_interval
+        self.__filter = None
+        self.__synced_at = None
+        self.__next_sync = 0
+        self.__lock = threading.Lock()
+
+    def __sync(self):
+        """Merge rows revoked since the last sync into the filter
+
+        The filter is rebuilt from every unexpired row on first use and
+        once it holds more keys than it was sized for.
+        """
+        if self.__filter is not None and time.monotonic() < self.__next_sync:
+            return
+        with self.__lock:
+            if (self.__filter is not None and
+                    time.monotonic() < self.__next_sync):
+                return
+            started = datetime.utcnow()
+            rebuild = (self.__filter is None or
+                       self.__filter.count > self.__filter.capacity)
+            criteria = {'expires_at__gt': started}
+            if not rebuild:
+                criteria['created_at__gte'] = (
+                    self.__synced_at - timedelta(seconds=self.SYNC_OVERLAP))
+            jtis = [jti for jti, in storage.query(RevokedToken, **criteria)
+                    .with_entities(RevokedToken.public_id)]
+            bloom = self.__filter
+            if rebuild:
+                bloom = BloomFilter(max(self.capacity, 2 * len(jtis)),
+                                    self.error_rate)
+            for jti in jtis:
+                bloom.add(jti)
+            self.__filter = bloom
+            self.__synced_at = started
+            self.__next_sync = time.monotonic() + self.refresh_interval
+
+    def is_revoked(self, jti):
+        """Whether the token with this jti claim was revoked"""
+        if not jti:
+            return False
+        self.__sync()
+        if jti not in self.__filter:
+            return False
+        return storage.get(RevokedToken, jti) is not None
+
+    def revoke(self, jti, token_type, expires_at):
+        """Record a token as revoked until it expires
+
+        Returns whether this call revoked it: the insert is the only
+        check a concurrent revocation of the same token cannot pass too.
+        """
+        storage.new(RevokedToken(public_id=jti, token_type=token_type,
+                                 expires_at=expires_at))
+        try:
+            storage.save()
+            revoked = True
+        except IntegrityError:
+            storage.rollback()  # Already revoked
+            revoked = False
+        self.__sync()
+        with self.__lock:
+            self.__filter.add(jti)
+        return revoked
+
+
+revocation_list = RevocationList(
+    capacity=int(os.environ.get('REVOCATION_FILTER_CAPACITY', 100000)),
+    refresh_interval=float(os.environ.get('REVOCATION_REFRESH_INTERVAL', 30)))
+
+
+def authenticate(claims):
+    """Principal for verified token claims, or None if the user is gone
+
+    Tokens carrying the user's role and issued less than max_staleness
+    seconds ago, after the user last changed, need no query at all.
+    Other tokens are checked against the (cached) user row.
+    """
+    kind, public_id = claims.get('role'), claims.get('public_id')
+    if kind not in principal_classes:
+        return None
+    issued = claims.get('iat', 0)
+    revoked = revocations.get((kind, public_id))
+    if (claims.get('user_role') and time.time() - issued <= max_staleness
+            and (revoked is None or revoked < issued)):
+        return Principal(kind, public_id, claims['user_role'])
+
+    user = load_principal(kind, public_id)
+    return Principal(kind, public_id, user.role) if user else None
+
 
 def token_required(fn):
     """wrapper fn to secure routes
@@ -31,19 +219,20 @@ def token_required(fn):
             decoded_token = jwt.decode(token,
                                        app.config['SECRET_KEY'],
                                        algorithms=['HS256'])
+            # Refresh tokens can only be exchanged for access tokens
+            if decoded_token.get('type', 'access') != 'access':
+                return jsonify({'Message': 'Invalid Token'}), 401
+            if revocation_list.is_revoked(decoded_token.get('jti')):
+                return jsonify({'Message': 'Token Revoked'}), 401
+
             # Obtain user role
             role = decoded_token.get('role')
             roles = ['client', 'company', 'admin']
             if not role or role not in roles:
                 return jsonify({'Error': 'Invalid role'}), 403
 
-            # Get current user in the database based on the public_id
-            if role == 'client':
-                current_user = storage.get(Client,
-                                           decoded_token.get('public_id'))
-            elif role == 'company':
-                current_user = storage.get(Company,
-                                           decoded_token.get('public_id'))
+            # Get current user from the claims, loading its row lazily
+            current_user = authenticate(decoded_token)
 
             if not current_user:  # Token is valid but user doesn't exist
                 return jsonify({'Error': 'User not found'}), 404
@@ -0,0 +1,110 @@
+#!/usr/bin/python3
+"""Tokens Module"""
+
+from api.views import app_views
+from flask import jsonify, request, current_app
+from datetime import datetime, timedelta
+from models.ids import new_public_id
+import jwt
+import os
+from .token_auth import token_required, load_principal, revocation_list
+
+# Lifetimes of access tokens and of the refresh tokens that renew them
+ACCESS_TOKEN_MINUTES = int(os.environ.get('ACCESS_TOKEN_MINUTES', 120))
+REFRESH_TOKEN_DAYS = int(os.environ.get('REFRESH_TOKEN_DAYS', 30))
+
+
+def encode_token(claims):
+    """Signed JWT holding claims, as text"""
+    token = jwt.encode(claims, current_app.config['SECRET_KEY'],
+                       algorithm='HS256')
+    return token if isinstance(token, str) else token.decode('utf-8')
+
+
+def issue_tokens(user, kind):
+    """Access and refresh token for user, logged in as kind"""
+    now = datetime.utcnow()
+    access_token = encode_token({
+        'public_id': user.public_id,
+        'user_role': user.role,
+        'jti': new_public_id(),
+        'iat': now,
+        'role': kind,
+        'exp': now + timedelta(minutes=ACCESS_TOKEN_MINUTES)
+    })
+    refresh_token = encode_token({
+        'public_id': user.public_id,
+        'type': 'refresh',
+        'jti': new_public_id(),
+        'iat': now,
+        'role': kind,
+        'exp': now + timedelta(days=REFRESH_TOKEN_DAYS)
+    })
+    return {'token': access_token, 'refresh_token': refresh_token}
+
+
+def decode_token(token):
+    """Verified claims of token"""
+    return jwt.decode(token, current_app.config['SECRET_KEY'],
+                      algorithms=['HS256'])
+
+
+def revoke(claims):
+    """Revoke the token holding claims until it expires
+
+    Returns whether this call revoked it (False if it already was).
+    """
+    if not claims.get('jti'):
+        return False
+    return revocation_list.revoke(claims['jti'], claims.get('type', 'access'),
+                                  datetime.utcfromtimestamp(claims['exp']))
+
+
+@app_views.route('/tokens/refresh', methods=['POST'], strict_slashes=False)
+def refresh_token():
+    """Exchange a refresh token for a new token pair, without a password"""
+    data = request.get_json(silent=True)
+    if not data or not data.get('refresh_token'):
+        return jsonify({'message': 'refresh_token is required'}), 400
+
+    try:
+        claims = decode_token(data.get('refresh_token'))
+    except jwt.ExpiredSignatureError:
+        return jsonify({'Message': 'Token Expired'}), 401
+    except jwt.InvalidTokenError:
+        return jsonify({'Message': 'Invalid Token'}), 401
+
+    if claims.get('type') != 'refresh':
+        return jsonify({'Message': 'Invalid Token'}), 401
+    if revocation_list.is_revoked(claims.get('jti')):
+        return jsonify({'Message': 'Token Revoked'}), 401
+
+    user = load_principal(claims.get('role'), claims.get('public_id'))
+    if not user:
+        return jsonify({'Error': 'User not found'}), 404
+
+    # Refresh tokens are single use: the new pair replaces this one, and
+    # only the request whose revocation lands gets it
+    if not revoke(claims):
+        return jsonify({'Message': 'Token Revoked'}), 401
+    return jsonify({'message': 'Token refreshed',
+                    **issue_tokens(user, claims.get('role'))})
+
+
+@app_views.route('/tokens/revoke', methods=['POST'], strict_slashes=False)
+@token_required
+def revoke_tokens(current_user):
+    """Log out: revoke the access token and, if sent, its refresh token"""
+    revoke(decode_token(request.headers.get('access-token')))
+
+    data = request.get_json(silent=True) or {}
+    if data.get('refresh_token'):
+        try:
+            claims = decode_token(data.get('refresh_token'))
+        except jwt.InvalidTokenError:
+            return jsonify({'Message': 'Invalid Token'}), 401
+        if claims.get('public_id') != current_user.public_id:
+            return jsonify({'Error': 'Invalid access'}), 403
+        revoke(claims)
+
+    return jsonify({'message': 'Tokens revoked'}), 200
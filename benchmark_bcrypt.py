@@ -0,0 +1,34 @@
+#!/usr/bin/env python3
+"""Script to benchmark bcrypt verification at each work factor
+
+Reports the verification latency and the logins per second one core
+can sustain at every cost, and the cost calibration picks on this
+machine for the target latency.
+"""
+
+import argparse
+from api.views.hash_password import (time_rounds, calibrate_rounds,
+                                     MIN_ROUNDS, MAX_ROUNDS)
+
+# Set up argument parser
+parser = argparse.ArgumentParser(
+    description='Measure bcrypt cost on this machine.')
+parser.add_argument('--min', type=int, default=MIN_ROUNDS,
+                    help='lowest work factor to measure')
+parser.add_argument('--max', type=int, default=14,
+                    help='highest work factor to measure')
+parser.add_argument('--samples', type=int, default=3,
+                    help='hashes timed per work factor (fastest is kept)')
+parser.add_argument('--target-ms', type=float, default=250,
+                    help='verification latency to calibrate for')
+args = parser.parse_args()
+
+print(f"{'cost':>4}  {'ms/login':>10}  {'logins/s/core':>13}")
+for rounds in range(args.min, args.max + 1):
+    seconds = time_rounds(rounds, args.samples)
+    print(f"{rounds:>4}  {seconds * 1000:>10.1f}  {1 / seconds:>13.1f}")
+
+rounds = calibrate_rounds(args.target_ms)
+print(f"Calibrated cost for {args.target_ms:g} ms: {rounds} "
+      f"(bounded to {MIN_ROUNDS}-{MAX_ROUNDS}); "
+      f"pin it with BCRYPT_ROUNDS={rounds}")
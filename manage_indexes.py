@@ -0,0 +1,41 @@
+#!/usr/bin/env python3
+"""Script to check and apply the columns and indexes declared on the
+models"""
+
+import argparse
+import sys
+from models import storage
+
+# Set up argument parser
+parser = argparse.ArgumentParser(
+    description='Report or create columns and indexes missing from the '
+                'database.')
+parser.add_argument('action', choices=['check', 'apply'],
+                    help='check: list missing columns and indexes, '
+                         'apply: add them to the existing database')
+args = parser.parse_args()
+
+missing_columns = storage.missing_columns()
+missing = storage.missing_indexes()
+if not missing_columns and not missing:
+    print("All declared columns and indexes are present.")
+    sys.exit(0)
+
+for column in missing_columns:
+    print(f"Missing column {column.table.name}.{column.name}")
+
+for index in missing:
+    columns = ', '.join(column.name for column in index.columns)
+    kind = 'unique index' if index.unique else 'index'
+    print(f"Missing {kind} {index.name} on {index.table.name}({columns})")
+
+if args.action == 'check':
+    # Non-zero exit status so the check can gate deployments
+    sys.exit(1)
+
+# Columns first: the missing indexes may cover them
+for column in storage.add_missing_columns():
+    print(f"Added {column.table.name}.{column.name}")
+
+for index in storage.create_missing_indexes():
+    print(f"Created {index.name}")
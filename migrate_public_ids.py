@@ -0,0 +1,99 @@
+#!/usr/bin/env python3
+"""Script to convert public ids of a MySQL database to BINARY(16)
+
+Every column of type PublicId (public ids, the foreign keys referencing
+them and the ids kept without a foreign key) is rewritten from its
+VARCHAR(255) canonical string to the 16 raw UUID bytes. Start the
+application with BINARY_PUBLIC_IDS=true once the conversion is done.
+MySQL DDL is not transactional: back the database up first.
+"""
+
+import argparse
+import sys
+from sqlalchemy import create_engine, inspect, text
+from models.basemodel import Base, DATABASE_URI, PublicId
+
+UUID_PATTERN = ('^[0-9a-fA-F]{8}-[0-9a-fA-F]{4}-[0-9a-fA-F]{4}-'
+                '[0-9a-fA-F]{4}-[0-9a-fA-F]{12}$')
+
+
+def id_columns(table):
+    """Columns of table declared with the PublicId type"""
+    return [column for column in table.columns if column.type is PublicId]
+
+
+def invalid_ids(connection):
+    """(table, column, count) of ids that are not canonical UUIDs"""
+    invalid = []
+    for table in Base.metadata.sorted_tables:
+        for column in id_columns(table):
+            count = connection.execute(text(
+                f"SELECT COUNT(*) FROM `{table.name}` "
+                f"WHERE `{column.name}` NOT REGEXP :pattern"),
+                {'pattern': UUID_PATTERN}).scalar()
+            if count:
+                invalid.append((table.name, column.name, count))
+    return invalid
+
+
+def migration_statements(connection):
+    """DDL and DML converting every id column, in execution order"""
+    inspector = inspect(connection)
+    foreign_keys = {table.name: inspector.get_foreign_keys(table.name)
+                    for table in Base.metadata.sorted_tables}
+    drop, convert, restore = [], [], []
+
+    for table in Base.metadata.sorted_tables:
+        for fk in foreign_keys[table.name]:
+            drop.append(f"ALTER TABLE `{table.name}` "
+                        f"DROP FOREIGN KEY `{fk['name']}`")
+            restore.append(
+                f"ALTER TABLE `{table.name}` ADD CONSTRAINT `{fk['name']}` "
+                f"FOREIGN KEY ({', '.join(fk['constrained_columns'])}) "
+                f"REFERENCES `{fk['referred_table']}` "
+                f"({', '.join(fk['referred_columns'])})")
+
+        columns = id_columns(table)
+        null = {column.name: 'NULL' if column.nullable else 'NOT NULL'
+                for column in columns}
+        # Keep the bytes of the string while the type changes
+        convert.append(f"ALTER TABLE `{table.name}` " + ', '.join(
+            f"MODIFY `{column.name}` VARBINARY(255) {null[column.name]}"
+            for column in columns))
+        convert.append(f"UPDATE `{table.name}` SET " + ', '.join(
+            f"`{column.name}` = UNHEX(REPLACE(`{column.name}`, '-', ''))"
+            for column in columns))
+        convert.append(f"ALTER TABLE `{table.name}` " + ', '.join(
+            f"MODIFY `{column.name}` BINARY(16) {null[column.name]}"
+            for column in columns))
+
+    return drop + convert + restore
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+        description='Convert public ids to BINARY(16).')
+    parser.add_argument('--apply', action='store_true',
+                        help='run the migration instead of printing it')
+    args = parser.parse_args()
+
+    engine = create_engine(DATABASE_URI)
+    if engine.dialect.name != 'mysql':
+        sys.exit("This migration only supports MySQL databases.")
+
+    with engine.begin() as connection:
+        invalid = invalid_ids(connection)
+        for table, column, count in invalid:
+            print(f"{table}.{column}: {count} ids are not UUIDs")
+        if invalid:
+            sys.exit("Fix or remove the ids above before migrating.")
+
+        statements = migration_statements(connection)
+        if not args.apply:
+            print(';\n'.join(statements) + ';')
+            sys.exit(0)
+
+        for statement in statements:
+            print(statement)
+            connection.execute(text(statement))
+    print("Public ids converted. Restart with BINARY_PUBLIC_IDS=true.")
@@ -1,12 +1,12 @@
-from .basemodel import BaseModel
-from sqlalchemy import Column, Integer, String, ForeignKey
+from .basemodel import BaseModel, PublicId
+from sqlalchemy import Column, Integer, String, ForeignKey, Index
 from sqlalchemy.orm import relationship
 
 
 class Address(BaseModel):
     """Address Model"""
     __tablename__ = 'address'
-    client_id = Column(String(255), ForeignKey('client.public_id'),
+    client_id = Column(PublicId, ForeignKey('client.public_id'),
                        nullable=False)
     address_line1 = Column(String(255), nullable=False)
     address_line2 = Column(String(255), nullable=True)
@@ -15,6 +15,11 @@ class Address(BaseModel):
     postal_code = Column(String(255), nullable=False)
     country = Column(String(255), nullable=False)
 
+    __table_args__ = (
+        # Client address book, paginated by created_at
+        Index('ix_address_client_id_created_at', 'client_id', 'created_at'),
+    )
+
     # Relationship to Client
     client = relationship("Client", back_populates="addresses")
 
@@ -0,0 +1,42 @@
+#!/usr/bin/python3
+"""In-memory Bloom filter"""
+
+import hashlib
+import math
+
+
+class BloomFilter:
+    """Set membership test without false negatives
+
+    Sized for capacity keys at the given false positive rate; a key
+    that was never added is reported present with at most that
+    probability while the filter holds no more than capacity keys.
+    """
+
+    def __init__(self, capacity=100000, error_rate=0.001):
+        """Empty filter"""
+        self.capacity = capacity
+        self.error_rate = error_rate
+        self.size = max(8, int(-capacity * math.log(error_rate)
+                               / math.log(2) ** 2))
+        self.hashes = max(1, round(self.size / capacity * math.log(2)))
+        self.__bits = bytearray((self.size + 7) // 8)
+        self.count = 0
+
+    def __positions(self, key):
+        """Bit positions of key, by double hashing one blake2b digest"""
+        digest = hashlib.blake2b(str(key).encode(), digest_size=16).digest()
+        first = int.from_bytes(digest[:8], 'big')
+        second = int.from_bytes(digest[8:], 'big') | 1
+        return [(first + i * second) % self.size for i in range(self.hashes)]
+
+    def add(self, key):
+        """Add key to the filter"""
+        for position in self.__positions(key):
+            self.__bits[position >> 3] |= 1 << (position & 7)
+        self.count += 1
+
+    def __contains__(self, key):
+        """Whether key may have been added"""
+        return all(self.__bits[position >> 3] & (1 << (position & 7))
+                   for position in self.__positions(key))
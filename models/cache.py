@@ -0,0 +1,77 @@
+#!/usr/bin/python3
+"""In-process TTL cache with LRU eviction"""
+
+import threading
+import time
+from collections import OrderedDict
+
+
+class TTLCache:
+    """Thread-safe mapping whose entries expire after ttl seconds
+
+    Holds at most maxsize entries, evicting the least recently used
+    one first. Listeners added with subscribe(fn) are called as
+    fn(hit) after every get, for hit ratio instrumentation.
+    """
+
+    def __init__(self, maxsize=10000, ttl=60):
+        """Empty cache"""
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.__entries = OrderedDict()
+        self.__lock = threading.Lock()
+        self.__listeners = []
+        self.hits = 0
+        self.misses = 0
+
+    def subscribe(self, listener):
+        """Call listener(hit) after every lookup"""
+        self.__listeners.append(listener)
+
+    def get(self, key):
+        """Cached value of key, or None when missing or expired"""
+        now = time.monotonic()
+        with self.__lock:
+            entry = self.__entries.get(key)
+            if entry and entry[0] <= now:
+                del self.__entries[key]
+                entry = None
+            if entry:
+                self.__entries.move_to_end(key)
+                self.hits += 1
+            else:
+                self.misses += 1
+        for listener in self.__listeners:
+            listener(entry is not None)
+        return entry[1] if entry else None
+
+    def set(self, key, value):
+        """Cache value under key for ttl seconds"""
+        with self.__lock:
+            self.__entries[key] = (time.monotonic() + self.ttl, value)
+            self.__entries.move_to_end(key)
+            while len(self.__entries) > self.maxsize:
+                self.__entries.popitem(last=False)
+
+    def invalidate(self, key):
+        """Drop key from the cache"""
+        with self.__lock:
+            self.__entries.pop(key, None)
+
+    def clear(self):
+        """Drop every entry and reset the statistics"""
+        with self.__lock:
+            self.__entries.clear()
+            self.hits = 0
+            self.misses = 0
+
+    def stats(self):
+        """Size, hits, misses and hit ratio"""
+        with self.__lock:
+            lookups = self.hits + self.misses
+            return {'size': len(self.__entries),
+                    'maxsize': self.maxsize,
+                    'ttl': self.ttl,
+                    'hits': self.hits,
+                    'misses': self.misses,
+                    'hit_ratio': self.hits / lookups if lookups else 0.0}
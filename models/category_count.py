@@ -0,0 +1,27 @@
+#!/usr/bin/python3
+"""Category Count Module"""
+
+from sqlalchemy import Column, Integer, String, Index
+from .basemodel import BaseModel, PublicId
+
+
+class CategoryCount(BaseModel):
+    """Items and in-stock items of a company in one category
+
+    Rows without a company_id hold the totals across companies. The
+    table is rebuilt by refresh_category_counts.py; created_at is when
+    a row was counted and generation identifies the rebuild that wrote
+    it.
+    """
+    __tablename__ = 'category_counts'
+    company_id = Column(PublicId, nullable=True)
+    category = Column(String(255), nullable=False)
+    item_count = Column(Integer, nullable=False)
+    in_stock_count = Column(Integer, nullable=False)
+    generation = Column(PublicId, nullable=False)
+
+    __table_args__ = (
+        # Facets of one company, or the global ones (company_id NULL)
+        Index('ix_category_counts_company_id_category',
+              'company_id', 'category'),
+    )
@@ -0,0 +1,68 @@
+#!/usr/bin/python3
+"""Public id generation and column types"""
+
+import os
+import time
+import uuid
+from sqlalchemy.types import TypeDecorator, BINARY, String
+
+
+def uuid7():
+    """Time-ordered UUID: 48-bit unix milliseconds, then random bits
+
+    Ids generated later sort after earlier ones, so inserts append to
+    the end of the primary key index instead of splitting random pages.
+    """
+    milliseconds = time.time_ns() // 1000000
+    rand = int.from_bytes(os.urandom(10), 'big')
+    value = ((milliseconds & 0xFFFFFFFFFFFF) << 80 |
+             0x7 << 76 |                           # version 7
+             (rand >> 68 & 0xFFF) << 64 |
+             0b10 << 62 |                          # RFC 4122 variant
+             rand & 0x3FFFFFFFFFFFFFFF)
+    return uuid.UUID(int=value)
+
+
+def new_public_id():
+    """Canonical string form of a new time-ordered public id"""
+    return str(uuid7())
+
+
+class UUIDBinary(TypeDecorator):
+    """UUID stored as BINARY(16), exposed as its canonical string"""
+    impl = BINARY
+    cache_ok = True
+
+    def __init__(self):
+        """BINARY(16) column"""
+        super().__init__(length=16)
+
+    def process_bind_param(self, value, dialect):
+        """Canonical string (or UUID) to 16 bytes"""
+        if value is None or isinstance(value, bytes):
+            return value
+        if isinstance(value, uuid.UUID):
+            return value.bytes
+        try:
+            return uuid.UUID(value).bytes
+        except (ValueError, TypeError, AttributeError):
+            # Not a UUID, so it cannot match any stored id
+            return None
+
+    def process_result_value(self, value, dialect):
+        """16 bytes to canonical string"""
+        if value is None:
+            return None
+        return str(uuid.UUID(bytes=bytes(value)))
+
+
+def public_id_type():
+    """Column type of public ids and the foreign keys referencing them
+
+    BINARY_PUBLIC_IDS=true in the environment selects the compact
+    BINARY(16) representation; run migrate_public_ids.py to convert an
+    existing database before switching.
+    """
+    if os.environ.get('BINARY_PUBLIC_IDS', '').lower() in ('1', 'true'):
+        return UUIDBinary()
+    return String(255)
@@ -3,17 +3,17 @@
 
 from sqlalchemy import (
     Column, String, Integer, ForeignKey,
-    CheckConstraint, Float
+    CheckConstraint, Float, Index, Boolean, Computed
 )
 from sqlalchemy.orm import relationship
-from .basemodel import BaseModel
+from .basemodel import BaseModel, PublicId
 from models import storage
 
 
 class Items(BaseModel):
     """Items Model"""
     __tablename__ = 'items'
-    company_id = Column(String(255),
+    company_id = Column(PublicId,
                         ForeignKey('company.public_id'),
                         nullable=False)
     name = Column(String(255), nullable=False)
@@ -24,6 +24,10 @@ class Items(BaseModel):
     description = Column(String(255), nullable=False)
     category = Column(String(255), nullable=False)
     SKU = Column(String(255), nullable=False, unique=True)
+    # Stored by the database so the reorder report can use an index
+    needs_reorder = Column(Boolean,
+                           Computed('initial_stock <= reorder_level',
+                                    persisted=True))
 
     # Add CheckConstraints to ensure no negative values
     __table_args__ = (
@@ -33,6 +37,18 @@ class Items(BaseModel):
                         name='check_initial_stock_non_negative'),
         CheckConstraint('reorder_level >= 0',
                         name='check_reorder_level_non_negative'),
+        # Company catalogue listing, paginated by created_at
+        Index('ix_items_company_id_created_at', 'company_id', 'created_at'),
+        # Reorder reports per company and catalogue-wide, by created_at
+        Index('ix_items_company_id_needs_reorder_created_at',
+              'company_id', 'needs_reorder', 'created_at'),
+        Index('ix_items_needs_reorder_created_at',
+              'needs_reorder', 'created_at'),
+        # Catalogue search on MySQL; a plain index elsewhere
+        Index('ix_items_fulltext', 'name', 'description', 'category',
+              'SKU', mysql_prefix='FULLTEXT'),
+        # Items changed since the in-process search index was synced
+        Index('ix_items_updated_at', 'updated_at'),
     )
 
     # Relationship to Company and OrderItems
@@ -0,0 +1,74 @@
+#!/usr/bin/python3
+"""Background delivery of low-stock events"""
+
+import json
+import logging
+import queue
+import threading
+import urllib.request
+
+logger = logging.getLogger('picknest.low_stock')
+
+
+class LowStockNotifier:
+    """Delivers low-stock events from a background thread
+
+    publish(events) only queues them, so the request that took an item
+    below its reorder level never waits on delivery. Every event is
+    logged and, with a webhook_url, POSTed there as JSON. Events that
+    do not fit in a full queue are dropped and counted.
+    """
+
+    def __init__(self, webhook_url=None, maxsize=10000, timeout=5):
+        """Notifier with an empty queue; call start() to deliver"""
+        self.webhook_url = webhook_url
+        self.timeout = timeout
+        self.__queue = queue.Queue(maxsize)
+        self.__thread = None
+        self.delivered = 0
+        self.dropped = 0
+
+    def start(self):
+        """Start the delivery thread"""
+        if self.__thread is None:
+            self.__thread = threading.Thread(target=self.__run,
+                                             name='low-stock-notifier',
+                                             daemon=True)
+            self.__thread.start()
+
+    def publish(self, events):
+        """Queue events for delivery"""
+        for event in events:
+            try:
+                self.__queue.put_nowait(event)
+            except queue.Full:
+                self.dropped += 1
+
+    def __run(self):
+        """Deliver queued events forever"""
+        while True:
+            event = self.__queue.get()
+            try:
+                self.deliver(event)
+                self.delivered += 1
+            except Exception:
+                logger.exception("Could not deliver low-stock event %s",
+                                 event)
+            finally:
+                self.__queue.task_done()
+
+    def deliver(self, event):
+        """Log event and send it to the webhook, if any"""
+        logger.warning("Item %s of company %s is at %s, reorder level %s",
+                       event['item_id'], event['company_id'],
+                       event['initial_stock'], event['reorder_level'])
+        if self.webhook_url:
+            request = urllib.request.Request(
+                self.webhook_url, data=json.dumps(event).encode(),
+                headers={'Content-Type': 'application/json'})
+            with urllib.request.urlopen(request, timeout=self.timeout):
+                pass
+
+    def join(self):
+        """Wait until every queued event was handled"""
+        self.__queue.join()
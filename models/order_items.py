@@ -4,9 +4,9 @@
 from sqlalchemy.orm import relationship
 from sqlalchemy import (
     ForeignKey, Column, Integer,
-    String, Float, CheckConstraint
+    Float, CheckConstraint, Index
 )
-from .basemodel import BaseModel
+from .basemodel import BaseModel, PublicId
 
 
 class OrderItems(BaseModel):
@@ -14,12 +14,12 @@ class OrderItems(BaseModel):
     """
     __tablename__ = 'order_items'
 
-    order_id = Column(String(255),
+    order_id = Column(PublicId,
                       ForeignKey('orders.public_id'),
                       nullable=False)
-    item_id = Column(String(255),
+    item_id = Column(PublicId,
                      ForeignKey('items.public_id'),
-                     nullable=False)
+                     nullable=False, index=True)
     quantity_ordered = Column(Integer, nullable=False)
     price_at_order_time = Column(Float, nullable=False)
 
@@ -27,6 +27,9 @@ class OrderItems(BaseModel):
     __table_args__ = (
         CheckConstraint('quantity_ordered >= 1',
                         name='check_quantity_ordered_gt0'),
+        # An item appears at most once per order; also serves order_id
+        Index('uq_order_items_order_id_item_id',
+              'order_id', 'item_id', unique=True),
     )
     # Relationship to Orders and Items
     order = relationship("Orders", back_populates="order_items")
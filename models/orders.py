@@ -1,27 +1,43 @@
 #!/usr/bin/python3
 """Items Module"""
 
+from datetime import datetime, timedelta
 from sqlalchemy import (
-    Column, ForeignKey, Enum, String, Float
+    Column, ForeignKey, Enum, Float, Index, DateTime
 )
 from sqlalchemy.orm import relationship
-from .basemodel import BaseModel
+from .basemodel import BaseModel, PublicId
+import os
+
+# Minutes a pending order holds its stock before the sweeper releases it
+RESERVATION_MINUTES = float(os.environ.get('RESERVATION_MINUTES', 30))
 
 
 class Orders(BaseModel):
     """Orders Model"""
     __tablename__ = 'orders'
-    client_id = Column(String(255),
+    client_id = Column(PublicId,
                        ForeignKey('client.public_id'),
                        nullable=False)
-    shipping_address_id = Column(String(255),
+    shipping_address_id = Column(PublicId,
                                  ForeignKey('address.public_id'),
-                                 nullable=False)
+                                 nullable=False, index=True)
     status = Column(Enum('Pending',
                          'Shipped',
                          'Delivered',
                          'Cancelled'), nullable=False)
     order_total = Column(Float, nullable=False, default=0)
+    # Until when the stock taken by a pending order stays reserved
+    reserved_until = Column(DateTime, nullable=True)
+
+    __table_args__ = (
+        # Client order history, paginated by created_at
+        Index('ix_orders_client_id_created_at', 'client_id', 'created_at'),
+        # Orders by status (e.g. pending orders), oldest first
+        Index('ix_orders_status_created_at', 'status', 'created_at'),
+        # Pending orders whose stock reservation expired, for the sweeper
+        Index('ix_orders_status_reserved_until', 'status', 'reserved_until'),
+    )
 
     # Relationship to Client, Address, OrderItems, and Payments
     client = relationship("Client", back_populates="orders")
@@ -31,3 +47,12 @@ class Orders(BaseModel):
     payment = relationship("Payments",
                            back_populates="order",
                            cascade="all, delete-orphan")
+
+    def extend_reservation(self):
+        """Hold the order's stock for another RESERVATION_MINUTES"""
+        self.reserved_until = reservation_deadline()
+
+
+def reservation_deadline():
+    """When a reservation made or extended now expires"""
+    return datetime.utcnow() + timedelta(minutes=RESERVATION_MINUTES)
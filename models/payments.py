@@ -1,13 +1,15 @@
-from sqlalchemy import Column, String, Enum, Integer, ForeignKey, DateTime
+from sqlalchemy import (
+    Column, String, Enum, Integer, ForeignKey, DateTime, Index
+)
 from sqlalchemy.orm import relationship
-from .basemodel import BaseModel
+from .basemodel import BaseModel, PublicId
 
 
 class Payments(BaseModel):
     """payment class implementation"""
     __tablename__ = 'payments'
 
-    order_id = Column(String(255),
+    order_id = Column(PublicId,
                       ForeignKey('orders.public_id'),
                       nullable=False)
     payment_date = Column(String(255), nullable=False)
@@ -16,8 +18,14 @@ class Payments(BaseModel):
     payment_method = Column(Enum('Credit Card', 'PayPal', 'M-Pesa'),
                             nullable=False, default='Credit Card')
     status = Column(Enum('Completed', 'Failed', 'Flagged'))
-    transaction_reference_number = Column(String(255), nullable=False)
+    transaction_reference_number = Column(String(255), nullable=False,
+                                          index=True)
     Currency = Column(String(255), nullable='False')
 
+    __table_args__ = (
+        # Order payments, paginated by created_at
+        Index('ix_payments_order_id_created_at', 'order_id', 'created_at'),
+    )
+
     # Relationship to Orders
     order = relationship("Orders", back_populates="payment")
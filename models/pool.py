@@ -0,0 +1,106 @@
+#!/usr/bin/python3
+"""Connection pool configuration and instrumentation"""
+
+import os
+import threading
+import time
+from sqlalchemy.exc import TimeoutError
+from sqlalchemy.pool import QueuePool
+
+# Engine pool settings: (create_engine argument, type, default).
+# Each is read from the app config or the environment under its key.
+POOL_SETTINGS = {
+    'DB_POOL_SIZE': ('pool_size', int, 5),
+    'DB_MAX_OVERFLOW': ('max_overflow', int, 10),
+    'DB_POOL_TIMEOUT': ('pool_timeout', float, 30),
+    'DB_POOL_RECYCLE': ('pool_recycle', int, 3600),
+    'DB_POOL_PRE_PING': ('pool_pre_ping', bool, True),
+}
+
+# Upper bounds (in milliseconds) of the checkout wait time buckets
+WAIT_BUCKETS_MS = (1, 5, 10, 50, 100, 500, 1000, 5000)
+
+
+def _parse(kind, value):
+    """Convert a config or environment value to kind"""
+    if kind is bool and isinstance(value, str):
+        return value.strip().lower() in ('1', 'true', 'yes', 'on')
+    return kind(value)
+
+
+def pool_options(config=None):
+    """create_engine pool arguments from config, environment or defaults"""
+    config = config or {}
+    options = {}
+    for key, (argument, kind, default) in POOL_SETTINGS.items():
+        value = config.get(key, os.environ.get(key))
+        options[argument] = default if value is None else _parse(kind, value)
+    return options
+
+
+class PoolStats:
+    """Thread-safe histogram of connection checkout wait times"""
+
+    def __init__(self):
+        """Empty histogram"""
+        self.__lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        """Clear all recorded waits"""
+        with self.__lock:
+            self.__buckets = [0] * (len(WAIT_BUCKETS_MS) + 1)
+            self.__waits = 0
+            self.__total_wait = 0.0
+            self.__timeouts = 0
+
+    def observe(self, seconds, timed_out=False):
+        """Record one checkout that waited seconds"""
+        milliseconds = seconds * 1000
+        index = next((i for i, bound in enumerate(WAIT_BUCKETS_MS)
+                      if milliseconds <= bound), len(WAIT_BUCKETS_MS))
+        with self.__lock:
+            self.__buckets[index] += 1
+            self.__waits += 1
+            self.__total_wait += seconds
+            if timed_out:
+                self.__timeouts += 1
+
+    def to_dict(self):
+        """Dictionary representation of the histogram"""
+        with self.__lock:
+            labels = [f'<={bound}ms' for bound in WAIT_BUCKETS_MS]
+            labels.append(f'>{WAIT_BUCKETS_MS[-1]}ms')
+            return {
+                'checkouts': self.__waits,
+                'timeouts': self.__timeouts,
+                'mean_wait_ms': (self.__total_wait * 1000 / self.__waits
+                                 if self.__waits else 0.0),
+                'wait_histogram': dict(zip(labels, self.__buckets)),
+            }
+
+
+class InstrumentedQueuePool(QueuePool):
+    """QueuePool that records how long each checkout waits"""
+
+    def __init__(self, *args, **kwargs):
+        """QueuePool with an empty PoolStats"""
+        super().__init__(*args, **kwargs)
+        self.stats = PoolStats()
+
+    def _do_get(self):
+        """Time the checkout, including waits for a free connection"""
+        start = time.perf_counter()
+        try:
+            connection = super()._do_get()
+        except TimeoutError:
+            self.stats.observe(time.perf_counter() - start, timed_out=True)
+            raise
+        self.stats.observe(time.perf_counter() - start)
+        return connection
+
+    def recreate(self):
+        """Keep the statistics when the engine is disposed"""
+        pool = super().recreate()
+        pool.stats = self.stats
+        return pool
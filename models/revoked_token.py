@@ -0,0 +1,15 @@
+#!/usr/bin/python3
+"""Revoked Token Module"""
+
+from sqlalchemy import Column, DateTime, String
+from .basemodel import BaseModel
+
+
+class RevokedToken(BaseModel):
+    """Revoked access or refresh token, keyed by its jti claim
+
+    Rows are only needed until the token would have expired anyway.
+    """
+    __tablename__ = 'revoked_tokens'
+    token_type = Column(String(20), nullable=False)
+    expires_at = Column(DateTime, nullable=False, index=True)
@@ -0,0 +1,55 @@
+#!/usr/bin/python3
+"""Session routing reads to replica engines"""
+
+import random
+from sqlalchemy import text
+from sqlalchemy.exc import DBAPIError
+from sqlalchemy.orm import Session
+
+# Statements reporting replication lag, newest MySQL spelling first
+LAG_STATUS = (('SHOW REPLICA STATUS', 'Seconds_Behind_Source'),
+              ('SHOW SLAVE STATUS', 'Seconds_Behind_Master'))
+
+
+def replica_lag(engine):
+    """Seconds the database behind engine trails its source, or None
+
+    Read from SHOW REPLICA STATUS (SHOW SLAVE STATUS before MySQL
+    8.0.22). None when replication is stopped or not reported, so such
+    a replica is not read from. Other databases (e.g. SQLite in tests)
+    do not replicate and report no lag.
+    """
+    if engine.dialect.name != 'mysql':
+        return 0.0
+    with engine.connect() as connection:
+        for statement, column in LAG_STATUS:
+            try:
+                row = connection.execute(text(statement)).mappings().first()
+            except DBAPIError:
+                continue
+            if row is None or row.get(column) is None:
+                return None
+            return float(row[column])
+    return None
+
+
+class RoutingSession(Session):
+    """Session that reads from a replica once marked read-only
+
+    Replica engines are given through info['replicas']. Reads go to the
+    primary engine unless Storage.use_replica() marked the session
+    read-only, and every flush or DML statement sends the rest of the
+    session to the primary so it reads its own writes.
+    """
+
+    def get_bind(self, mapper=None, clause=None, **kwargs):
+        """Pick the engine the next statement runs on"""
+        if self._flushing or getattr(clause, 'is_dml', False):
+            self.info['wrote'] = True
+        elif (self.info.get('read_only') and self.info.get('replicas') and
+                not self.info.get('wrote')):
+            # Stick to one replica for the whole session
+            if 'replica' not in self.info:
+                self.info['replica'] = random.choice(self.info['replicas'])
+            return self.info['replica']
+        return super().get_bind(mapper, clause, **kwargs)
@@ -0,0 +1,171 @@
+#!/usr/bin/python3
+"""In-memory full-text index"""
+
+import bisect
+import heapq
+import math
+import re
+
+TOKEN = re.compile(r'\w+')
+
+
+def tokenize(text):
+    """Lower-cased words of text"""
+    return TOKEN.findall(str(text).lower())
+
+
+class SearchIndex:
+    """Inverted index ranking documents by BM25
+
+    Documents are indexed by id, optionally in a group (e.g. their
+    company) that searches can be restricted to. A search matches the
+    documents holding every query word; the last word also matches
+    longer words it is a prefix of, for search as you type.
+    """
+
+    K1 = 1.2
+    B = 0.75
+    # Shortest last word that is also matched as a prefix
+    MIN_PREFIX = 3
+
+    def __init__(self):
+        """Empty index"""
+        self.__postings = {}
+        self.__words = {}
+        self.__lengths = {}
+        self.__groups = {}
+        self.__doc_groups = {}
+        self.__total_length = 0
+        # Indexed words in order, for prefix matching
+        self.__vocabulary = []
+
+    def __len__(self):
+        """Number of documents indexed"""
+        return len(self.__lengths)
+
+    def __contains__(self, doc_id):
+        """Whether a document is indexed"""
+        return doc_id in self.__lengths
+
+    def copy(self):
+        """Independent copy, which can be changed while this one is
+        searched"""
+        other = SearchIndex()
+        other.__postings = {word: dict(postings)
+                            for word, postings in self.__postings.items()}
+        other.__words = dict(self.__words)
+        other.__lengths = dict(self.__lengths)
+        other.__groups = {group: set(members)
+                          for group, members in self.__groups.items()}
+        other.__doc_groups = dict(self.__doc_groups)
+        other.__total_length = self.__total_length
+        other.__vocabulary = list(self.__vocabulary)
+        return other
+
+    def add(self, doc_id, text, group=None):
+        """Index (or re-index) a document"""
+        self.remove(doc_id)
+        words = tokenize(text)
+        counts = {}
+        for word in words:
+            counts[word] = counts.get(word, 0) + 1
+        for word, count in counts.items():
+            postings = self.__postings.get(word)
+            if postings is None:
+                postings = self.__postings[word] = {}
+                bisect.insort(self.__vocabulary, word)
+            postings[doc_id] = count
+        self.__words[doc_id] = tuple(counts)
+        self.__lengths[doc_id] = len(words)
+        self.__total_length += len(words)
+        if group is not None:
+            self.__groups.setdefault(group, set()).add(doc_id)
+            self.__doc_groups[doc_id] = group
+
+    def remove(self, doc_id):
+        """Drop a document, if indexed"""
+        if doc_id not in self.__lengths:
+            return
+        for word in self.__words.pop(doc_id):
+            postings = self.__postings[word]
+            del postings[doc_id]
+            if not postings:
+                del self.__postings[word]
+                del self.__vocabulary[
+                    bisect.bisect_left(self.__vocabulary, word)]
+        self.__total_length -= self.__lengths.pop(doc_id)
+        group = self.__doc_groups.pop(doc_id, None)
+        if group is not None:
+            members = self.__groups[group]
+            members.discard(doc_id)
+            if not members:
+                del self.__groups[group]
+
+    def __frequencies(self, word, prefix=False):
+        """{doc_id: occurrences} of word, or of every indexed word it
+        is a prefix of"""
+        if not prefix:
+            return self.__postings.get(word, {})
+        start = bisect.bisect_left(self.__vocabulary, word)
+        end = bisect.bisect_left(self.__vocabulary, word + '\uffff')
+        words = self.__vocabulary[start:end]
+        if len(words) == 1:
+            return self.__postings[words[0]]
+        merged = {}
+        for word in words:
+            for doc_id, count in self.__postings[word].items():
+                merged[doc_id] = merged.get(doc_id, 0) + count
+        return merged
+
+    def search(self, query, group=None, limit=20, after=None):
+        """Best (score, doc_id) matches of query, best first
+
+        Ties are broken by doc_id. after is the (score, doc_id) of the
+        last result of the previous page.
+        """
+        words = tokenize(query)
+        if not words or not self.__lengths:
+            return []
+        frequencies = [self.__frequencies(word) for word in words[:-1]]
+        frequencies.append(self.__frequencies(
+            words[-1], prefix=len(words[-1]) >= self.MIN_PREFIX))
+
+        # Documents holding every word, intersected from the rarest
+        frequencies.sort(key=len)
+        if group is not None:
+            candidates = self.__groups.get(group, set()) & \
+                frequencies[0].keys()
+        else:
+            candidates = frequencies[0].keys()
+        for other in frequencies[1:]:
+            candidates = candidates & other.keys()
+
+        # BM25, with the constant factors hoisted out of the loop
+        count = len(self.__lengths)
+        k1, b = self.K1, self.B
+        fixed = k1 * (1 - b)
+        scaled = k1 * b * count / (self.__total_length or 1)
+        terms = [((k1 + 1) * math.log(1 + (count - len(found) + 0.5)
+                                      / (len(found) + 0.5)), found)
+                 for found in frequencies]
+        lengths = self.__lengths
+        if len(terms) == 1:
+            # One word: the common case for broad queries, kept tight
+            (idf, found), = terms
+            scores = [(-idf * found[doc_id]
+                       / (found[doc_id] + fixed + scaled * lengths[doc_id]),
+                       doc_id) for doc_id in candidates]
+        else:
+            scores = []
+            for doc_id in candidates:
+                norm = fixed + scaled * lengths[doc_id]
+                score = 0.0
+                for idf, found in terms:
+                    occurrences = found[doc_id]
+                    score += idf * occurrences / (occurrences + norm)
+                scores.append((-score, doc_id))
+        if after is not None:
+            after = (-after[0], after[1])
+            scores = [key for key in scores if key > after]
+        return [(-score, doc_id)
+                for score, doc_id in heapq.nsmallest(limit, scores)]
@@ -0,0 +1,53 @@
+#!/usr/bin/python3
+"""Stock Movement Module"""
+
+from sqlalchemy import BigInteger, Column, DDL, Integer, String, Index, event
+from .basemodel import BaseModel, PublicId
+
+# Kinds of stock movement: goods received, stock held by an order,
+# stock an order gave back, and downward corrections
+MOVEMENT_KINDS = ['receive', 'reserve', 'release', 'adjust']
+
+
+class StockMovement(BaseModel):
+    """One change to an item's available stock (initial_stock)
+
+    Rows are only ever inserted, in the transaction that changed the
+    stock; an item's stock is its latest snapshot plus the quantities
+    recorded since. Rows outlive deleted items, so item_id has no
+    foreign key.
+
+    sequence is assigned by the database on insert. The stock update
+    before it holds the item's row lock until commit, so an item's
+    movements are numbered in commit order, unlike their ids, which
+    come from each worker's clock.
+    """
+    __tablename__ = 'stock_movements'
+    sequence = Column(BigInteger, unique=True)
+    item_id = Column(PublicId, nullable=False)
+    quantity = Column(Integer, nullable=False)
+    kind = Column(String(20), nullable=False)
+    order_id = Column(PublicId, nullable=True)
+
+    __table_args__ = (
+        # Movements of an item over a time range
+        Index('ix_stock_movements_item_id_created_at',
+              'item_id', 'created_at'),
+        # Latest movement of an item, and the movements after it
+        Index('ix_stock_movements_item_id_sequence',
+              'item_id', 'sequence'),
+    )
+
+
+# SQLAlchemy only numbers primary keys, and public_id is ours
+event.listen(StockMovement.__table__, 'after_create', DDL(
+    "ALTER TABLE stock_movements "
+    "MODIFY sequence BIGINT NOT NULL AUTO_INCREMENT"
+).execute_if(dialect='mysql'))
+# SQLite writes one transaction at a time: its rowid is in commit order
+event.listen(StockMovement.__table__, 'after_create', DDL(
+    "CREATE TRIGGER stock_movements_sequence AFTER INSERT ON "
+    "stock_movements WHEN NEW.sequence IS NULL BEGIN "
+    "UPDATE stock_movements SET sequence = NEW.rowid "
+    "WHERE rowid = NEW.rowid; END"
+).execute_if(dialect='sqlite'))
@@ -0,0 +1,26 @@
+#!/usr/bin/python3
+"""Stock Snapshot Module"""
+
+from sqlalchemy import BigInteger, Column, Integer, Index
+from .basemodel import BaseModel, PublicId
+
+
+class StockSnapshot(BaseModel):
+    """Available stock of an item when the snapshot was taken
+
+    Taken periodically by snapshot_stock.py so that stock at a past time
+    only needs the movements since the snapshot before it.
+    last_sequence is the sequence of the latest movement the stock
+    includes (None if the item had none): movements committed later
+    have greater sequences, whatever the precision of created_at.
+    """
+    __tablename__ = 'stock_snapshots'
+    item_id = Column(PublicId, nullable=False)
+    stock = Column(Integer, nullable=False)
+    last_sequence = Column(BigInteger, nullable=True)
+
+    __table_args__ = (
+        # Latest snapshot of an item before a given time
+        Index('ix_stock_snapshots_item_id_created_at',
+              'item_id', 'created_at'),
+    )
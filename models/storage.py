@@ -1,6 +1,23 @@
 #!/usr/bin/python3
-from sqlalchemy import create_engine
+import base64
+import binascii
+import json
+import os
+import time
+from datetime import datetime
+from sqlalchemy import (
+    create_engine, and_, or_, inspect, select, func, text, bindparam,
+    update, case, insert, event
+)
+from sqlalchemy.engine import make_url
+from sqlalchemy.schema import CreateColumn
+from sqlalchemy.exc import DBAPIError
+from sqlalchemy.dialects.mysql import match
+from sqlalchemy.pool import QueuePool
 from .basemodel import BaseModel, Base, DATABASE_URI
+from .pool import InstrumentedQueuePool, pool_options
+from .routing import RoutingSession, replica_lag
+from .ids import new_public_id
 from sqlalchemy.orm import sessionmaker, scoped_session
 from .address import Address
 from .client import Client
@@ -9,6 +26,69 @@ from .items import Items
 from .order_items import OrderItems
 from .orders import Orders
 from .payments import Payments
+from .revoked_token import RevokedToken
+from .stock_movement import StockMovement
+from .stock_snapshot import StockSnapshot
+from .category_count import CategoryCount
+
+# Classes covered by all() and count() without a class
+CLASSES = [Address, Client, Company, Items, OrderItems, Orders, Payments]
+
+# Maximum number of ids bound in one get_many IN query
+GET_MANY_CHUNK = 1000
+
+# Lookups accepted as suffixes of keyword criteria in Storage.query
+OPERATORS = {
+    'eq': lambda column, value: column == value,
+    'ne': lambda column, value: column != value,
+    'lt': lambda column, value: column < value,
+    'lte': lambda column, value: column <= value,
+    'gt': lambda column, value: column > value,
+    'gte': lambda column, value: column >= value,
+    'in': lambda column, value: column.in_(value),
+    'between': lambda column, value: column.between(*value),
+}
+
+
+def encode_cursor(obj):
+    """Opaque keyset cursor pointing just after obj"""
+    key = json.dumps([obj.created_at.isoformat(), obj.public_id])
+    return base64.urlsafe_b64encode(key.encode()).decode()
+
+
+def decode_cursor(cursor):
+    """Return the (created_at, public_id) key held by a cursor"""
+    try:
+        created_at, public_id = json.loads(
+            base64.urlsafe_b64decode(cursor.encode()))
+        return datetime.fromisoformat(created_at), public_id
+    except (binascii.Error, TypeError, ValueError) as e:
+        raise ValueError(f"Invalid cursor: {cursor}") from e
+
+
+def build_engine(database_uri, config):
+    """Engine for database_uri with the configured, instrumented pool"""
+    options = {}
+    if make_url(database_uri).get_backend_name() != 'sqlite':
+        options = pool_options(config)
+        options['poolclass'] = InstrumentedQueuePool
+    return create_engine(database_uri, **options)
+
+
+def pool_status(engine):
+    """Connection pool usage and checkout wait statistics of engine"""
+    pool = engine.pool
+    status = {'pool': type(pool).__name__}
+    if isinstance(pool, QueuePool):
+        status.update(size=pool.size(),
+                      checked_in=pool.checkedin(),
+                      checked_out=pool.checkedout(),
+                      # QueuePool counts up from -size to 0
+                      overflow=max(pool.overflow(), 0))
+    stats = getattr(pool, 'stats', None)
+    if stats:
+        status.update(stats.to_dict())
+    return status
 
 
 class Storage:
@@ -16,22 +96,115 @@ class Storage:
 
     def __init__(self):
         """Engine creation and Scoped Session"""
-        self.__engine = create_engine(DATABASE_URI)
+        self.__engine = None
+        self.__replicas = []
+        self.__count_cache = {}
+        self.__replica_lags = {}
+        self.__low_stock_listeners = []
+        self.configure()
+
+    def configure(self, config=None):
+        """(Re)create the engine and scoped session
+
+        DATABASE_URI, DATABASE_REPLICA_URIS (comma separated read
+        replicas), REPLICA_MAX_LAG and the pool settings in
+        models.pool.POOL_SETTINGS are read from config (e.g. the Flask
+        app config), falling back to environment variables and then to
+        the defaults.
+        """
+        config = config or {}
+
+        def setting(key, default):
+            return config.get(key, os.environ.get(key, default))
+
+        engine = build_engine(config.get('DATABASE_URI', DATABASE_URI),
+                              config)
+        replicas = [build_engine(uri.strip(), config) for uri in
+                    setting('DATABASE_REPLICA_URIS', '').split(',')
+                    if uri.strip()]
+        # Seconds a replica may trail the primary; replicas further
+        # behind are not read from, and a client that wrote more
+        # recently than this reads from the primary
+        self.replica_max_lag = float(setting('REPLICA_MAX_LAG', 5))
+        # Seconds a measured replica lag is reused
+        self.replica_lag_ttl = float(setting('REPLICA_LAG_CHECK_INTERVAL', 1))
+        self.__replica_lags.clear()
+        self.count_cache_ttl = float(setting('COUNT_CACHE_TTL', 60))
+        self.__count_cache.clear()
+
+        if self.__engine is not None:
+            self.__session.remove()
+            for old in [self.__engine] + self.__replicas:
+                old.dispose()
+        self.__engine = engine
+        self.__replicas = replicas
         self.__session_factory = sessionmaker(bind=self.__engine,
+                                              class_=RoutingSession,
+                                              info={'replicas': replicas},
                                               expire_on_commit=False)
         self.__session = scoped_session(self.__session_factory)
+        event.listen(self.__session_factory, 'before_flush',
+                     self.__track_stock_movements)
+
+    @property
+    def has_replicas(self):
+        """Whether read replicas are configured"""
+        return bool(self.__replicas)
+
+    @property
+    def full_text_search(self):
+        """Whether search_items can use the database's FULLTEXT index"""
+        return self.__engine.dialect.name == 'mysql'
+
+    def current_replicas(self):
+        """Replicas trailing the primary by at most replica_max_lag
+
+        Each replica's lag is measured at most every replica_lag_ttl
+        seconds; a replica that cannot be reached counts as behind.
+        """
+        now = time.monotonic()
+        current = []
+        for replica in self.__replicas:
+            checked = self.__replica_lags.get(replica)
+            if checked is None or checked[0] <= now:
+                try:
+                    lag = replica_lag(replica)
+                except DBAPIError:
+                    lag = None
+                checked = (now + self.replica_lag_ttl, lag)
+                self.__replica_lags[replica] = checked
+            if checked[1] is not None and checked[1] <= self.replica_max_lag:
+                current.append(replica)
+        return current
+
+    def use_replica(self, enabled=True):
+        """Let the current session read from a replica until it writes
+
+        Only replicas within replica_max_lag of the primary are used.
+        Returns whether the session will read from one.
+        """
+        if enabled:
+            replicas = self.current_replicas()
+            self.__session.info['replicas'] = replicas
+            enabled = bool(replicas)
+        self.__session.info['read_only'] = enabled
+        return enabled
+
+    def pool_status(self):
+        """Live connection pool statistics of the primary and replicas"""
+        status = pool_status(self.__engine)
+        if self.__replicas:
+            status['replicas'] = [pool_status(replica)
+                                  for replica in self.__replicas]
+        return status
 
     def all(self, cls=None):
         """Return all objects in storage"""
         if cls:
             return self.__session.query(cls).all()
         else:
-            classes = [Address, Client,
-                       Company, Items,
-                       OrderItems, Orders,
-                       Payments]
             results = {}
-            for c in classes:
+            for c in CLASSES:
                 results[c.__name__] = self.__session.query(c).all()
             return results
 
@@ -40,8 +213,95 @@ class Storage:
         self.__session.add(obj)
 
     def save(self):
-        """Commit all changes to storage"""
+        """Commit all changes to storage
+
+        The stock movements of the transaction are written to the ledger
+        with one executemany just before the commit. Low-stock listeners
+        are then told about the items this transaction took to or below
+        their reorder level.
+        """
+        if self.__low_stock_listeners:
+            self.__track_low_stock_changes()
+        # Flush first: ORM changes to stock queue movements as they flush
+        self.__session.flush()
+        movements = self.__session.info.pop('stock_movements', None)
+        if movements:
+            self.__session.execute(insert(StockMovement.__table__),
+                                   movements)
         self.__session.commit()
+        events = self.__session.info.pop('low_stock', None)
+        if events:
+            for listener in self.__low_stock_listeners:
+                listener(events)
+
+    def subscribe_low_stock(self, listener):
+        """Call listener(events) after commits that cross reorder levels
+
+        Each event is a dict with the item_id, company_id, initial_stock
+        and reorder_level of an item whose stock fell to or below its
+        reorder level. Listeners run on the committing thread.
+        """
+        self.__low_stock_listeners.append(listener)
+
+    def unsubscribe_low_stock(self, listener):
+        """Stop calling listener"""
+        self.__low_stock_listeners.remove(listener)
+
+    def __record_low_stock(self, item_id, company_id, stock, reorder_level):
+        """Queue a low-stock event until the transaction commits"""
+        self.__session.info.setdefault('low_stock', []).append(
+            {'item_id': item_id, 'company_id': company_id,
+             'initial_stock': stock, 'reorder_level': reorder_level})
+
+    def __track_low_stock_changes(self):
+        """Record items whose stock or reorder level the ORM changed so
+        that they crossed the reorder level"""
+        for obj in self.__session.dirty:
+            if not isinstance(obj, Items):
+                continue
+            state = inspect(obj)
+            before = []
+            for name in ('initial_stock', 'reorder_level'):
+                history = state.attrs[name].history
+                before.append(history.deleted[0] if history.deleted
+                              else getattr(obj, name))
+            try:
+                was_low = int(before[0]) <= int(before[1])
+                stock, level = int(obj.initial_stock), int(obj.reorder_level)
+            except (TypeError, ValueError):
+                continue
+            if stock <= level and not was_low:
+                self.__record_low_stock(obj.public_id, obj.company_id,
+                                        stock, level)
+
+    def __record_movements(self, changes, kind=None, order_id=None):
+        """Queue ledger rows for changes ({item_id: delta}) until save()
+
+        Without a kind, stock added is received and stock taken away
+        is an adjustment.
+        """
+        self.__session.info.setdefault('stock_movements', []).extend(
+            {'item_id': item_id, 'quantity': quantity,
+             'kind': kind or ('receive' if quantity > 0 else 'adjust'),
+             'order_id': order_id}
+            for item_id, quantity in changes.items() if quantity)
+
+    def __track_stock_movements(self, session, flush_context, instances):
+        """Queue ledger rows for the stock of items the ORM is flushing"""
+        changes = {}
+        for obj in session.new:
+            if isinstance(obj, Items) and isinstance(obj.initial_stock, int):
+                changes[obj.public_id] = obj.initial_stock
+        for obj in session.dirty:
+            if not isinstance(obj, Items):
+                continue
+            history = inspect(obj).attrs.initial_stock.history
+            if (history.added and history.deleted and
+                    isinstance(history.added[0], int) and
+                    isinstance(history.deleted[0], int)):
+                changes[obj.public_id] = (history.added[0]
+                                          - history.deleted[0])
+        self.__record_movements(changes)
 
     def delete(self, obj=None):
         """Delete object from storage"""
@@ -52,30 +312,656 @@ class Storage:
         """Reload storage"""
         Base.metadata.create_all(self.__engine)
 
+    def missing_columns(self):
+        """Return the declared columns existing tables do not have yet
+
+        create_all() only creates missing tables, so columns added to a
+        model later must be added with add_missing_columns().
+        """
+        inspector = inspect(self.__engine)
+        existing_tables = set(inspector.get_table_names())
+        missing = []
+        for table in Base.metadata.sorted_tables:
+            if table.name not in existing_tables:
+                continue
+            existing = {column['name']
+                        for column in inspector.get_columns(table.name)}
+            missing.extend(column for column in table.columns
+                           if column.name not in existing)
+        return missing
+
+    def add_missing_columns(self):
+        """ALTER TABLE ... ADD COLUMN each declared column that is missing
+
+        Run before create_missing_indexes(), whose indexes may cover the
+        new columns. Returns the columns added.
+        """
+        dialect = self.__engine.dialect
+        added = []
+        with self.__engine.begin() as connection:
+            for column in self.missing_columns():
+                table = dialect.identifier_preparer.format_table(
+                    column.table)
+                definition = CreateColumn(column).compile(dialect=dialect)
+                connection.execute(text(
+                    f"ALTER TABLE {table} ADD COLUMN {definition}"))
+                added.append(column)
+        return added
+
+    def missing_indexes(self):
+        """Return the declared indexes the database does not have yet
+
+        An index counts as present when the database has one with the
+        same name, or one over the same columns that is at least as
+        unique (MySQL, for example, names foreign key indexes itself).
+        """
+        inspector = inspect(self.__engine)
+        existing_tables = set(inspector.get_table_names())
+        missing = []
+        for table in Base.metadata.sorted_tables:
+            if table.name not in existing_tables:
+                continue
+            existing = inspector.get_indexes(table.name) + [
+                dict(constraint, unique=True) for constraint in
+                inspector.get_unique_constraints(table.name)]
+            for index in sorted(table.indexes, key=lambda i: i.name):
+                columns = [column.name for column in index.columns]
+                if not any(found['name'] == index.name or
+                           (found['column_names'] == columns and
+                            (found.get('unique') or not index.unique))
+                           for found in existing):
+                    missing.append(index)
+        return missing
+
+    def create_missing_indexes(self):
+        """Create the declared indexes missing from an existing database"""
+        created = []
+        for index in self.missing_indexes():
+            index.create(bind=self.__engine)
+            created.append(index)
+        return created
+
     def close(self):
         """Close storage"""
         self.__session.remove()
 
-    def get(self, cls, public_id):
-        """Get object by class and id"""
-        return self.__session.query(cls).filter_by(public_id=public_id).first()
+    def query(self, cls, *conditions, options=(), **criteria):
+        """Build a query for cls restricted by conditions and criteria
+
+        Keyword criteria are column names, optionally suffixed with
+        one of the lookups in OPERATORS (e.g. created_at__gte=...,
+        public_id__in=[...]). Positional conditions are passed to
+        the WHERE clause as-is. options are loader options such as
+        selectinload(...) deciding how relationships are loaded.
+        """
+        query = self.__session.query(cls).options(*options)
+        clauses = list(conditions)
+        for key, value in criteria.items():
+            name, _, lookup = key.partition('__')
+            lookup = lookup or 'eq'
+            if lookup not in OPERATORS:
+                raise ValueError(f"Unsupported lookup '{lookup}' in {key}")
+            column = getattr(cls, name, None)
+            if column is None:
+                raise AttributeError(
+                    f"{cls.__name__} has no attribute '{name}'")
+            clauses.append(OPERATORS[lookup](column, value))
+        if clauses:
+            query = query.filter(*clauses)
+        return query
+
+    def filter(self, cls, *conditions, **criteria):
+        """Return all objects of cls matching conditions and criteria"""
+        return self.query(cls, *conditions, **criteria).all()
+
+    def paginate(self, cls, *conditions, limit=100, cursor=None, **criteria):
+        """Return a page of cls objects and the cursor of the next page
+
+        Pages are ordered by (created_at, public_id) and resumed with a
+        keyset condition rather than OFFSET, so every page costs the
+        same. The returned cursor is None on the last page.
+        """
+        if limit < 1:
+            raise ValueError("limit must be a positive integer")
+        query = self.query(cls, *conditions, **criteria)
+        if cursor:
+            created_at, public_id = decode_cursor(cursor)
+            query = query.filter(or_(
+                cls.created_at > created_at,
+                and_(cls.created_at == created_at,
+                     cls.public_id > public_id)))
+        page = query.order_by(cls.created_at, cls.public_id)\
+            .limit(limit + 1).all()
+        if len(page) > limit:
+            page = page[:limit]
+            return page, encode_cursor(page[-1])
+        return page, None
+
+    def stream(self, cls, *conditions, batch_size=1000, **criteria):
+        """Iterate over matching cls objects through a server-side cursor
+
+        Rows are fetched batch_size at a time in (created_at, public_id)
+        order, so memory stays flat however many rows match.
+        """
+        query = self.query(cls, *conditions, **criteria)\
+            .order_by(cls.created_at, cls.public_id)
+        return query.execution_options(stream_results=True)\
+            .yield_per(batch_size)
+
+    def get(self, cls, public_id, options=()):
+        """Get object by class and id, applying loader options"""
+        return self.__session.query(cls).options(*options)\
+            .filter_by(public_id=public_id).first()
+
+    def get_by(self, cls, options=(), **unique):
+        """Get object by the value of one unique column, e.g. username
+
+        Raises ValueError unless exactly one column is given and it is
+        unique or the primary key, so the lookup is always an index seek.
+        """
+        if len(unique) != 1:
+            raise ValueError("get_by expects exactly one column")
+        (name, value), = unique.items()
+        column = cls.__table__.columns.get(name)
+        if column is None:
+            raise AttributeError(f"{cls.__name__} has no column '{name}'")
+        if not (column.unique or column.primary_key):
+            raise ValueError(f"{cls.__name__}.{name} is not unique")
+        return self.__session.query(cls).options(*options)\
+            .filter(column == value).first()
+
+    def get_many(self, cls, public_ids, options=()):
+        """Get objects by class and ids, keyed by public_id
+
+        Ids are resolved with IN queries of at most GET_MANY_CHUNK ids;
+        ids that do not exist are left out of the result.
+        """
+        public_ids = list(dict.fromkeys(public_ids))
+        objects = {}
+        for start in range(0, len(public_ids), GET_MANY_CHUNK):
+            chunk = public_ids[start:start + GET_MANY_CHUNK]
+            for obj in self.__session.query(cls).options(*options)\
+                    .filter(cls.public_id.in_(chunk)):
+                objects[obj.public_id] = obj
+        return objects
+
+    def update_pending_order(self, order_id, **values):
+        """Update an order only while it is still Pending
+
+        One conditional UPDATE, which also holds the order row until
+        the transaction ends, so a payment or the reservation sweeper
+        cannot move the order out of Pending at the same time (the
+        sweeper skips locked orders). Returns whether the order was
+        updated; only then may the caller reserve or give back its
+        stock.
+        """
+        result = self.__session.execute(
+            update(Orders)
+            .where(Orders.public_id == order_id, Orders.status == 'Pending')
+            .values(**values)
+            .execution_options(synchronize_session=False))
+        # A loaded order must read the new values from the database
+        for obj in list(self.__session.identity_map.values()):
+            if isinstance(obj, Orders) and obj.public_id == order_id:
+                self.__session.expire(obj, list(values) + ['updated_at'])
+        return result.rowcount == 1
+
+    def reserve_stock(self, item_id, quantity, order_id=None):
+        """Take quantity off an item's stock if enough is left
+
+        One conditional UPDATE, so concurrent orders cannot both pass
+        the check and oversell. Returns whether the stock was taken; the
+        change is part of the session's transaction until saved.
+        """
+        return self.reserve_stocks({item_id: quantity}, order_id)
+
+    def reserve_stocks(self, quantities, order_id=None):
+        """Take quantities ({item_id: quantity}) off item stock at once
+
+        A single UPDATE decrements every item that has enough stock
+        left. Returns whether all of them had; if not, the caller must
+        roll back so the order is all or nothing. The ledger records
+        the reservation for order_id.
+        """
+        changes = {item_id: -quantity
+                   for item_id, quantity in quantities.items()}
+        self.__record_movements(changes, 'reserve', order_id)
+        return self.__adjust_stock(changes, reserve=True) == len(changes)
+
+    def restock(self, quantities, order_id=None):
+        """Add quantities ({item_id: quantity}) back to item stock
+
+        All items are updated in one UPDATE, relative to the stock in
+        the database; returns the number of items restocked. The ledger
+        records the stock released by order_id.
+        """
+        quantities = {item_id: quantity for item_id, quantity
+                      in quantities.items() if quantity}
+        if not quantities:
+            return 0
+        self.__record_movements(quantities, 'release', order_id)
+        return self.__adjust_stock(quantities)
+
+    def __adjust_stock(self, changes, reserve=False):
+        """Add changes ({item_id: delta}) to initial_stock in SQL
+
+        With reserve, items the change would take below zero are left
+        untouched. Returns the number of items updated.
+        """
+        if len(changes) == 1:
+            (item_id, delta), = changes.items()
+            new_stock = Items.initial_stock + delta
+        else:
+            # Compared through the column so each id binds as its type
+            new_stock = Items.initial_stock + case(
+                *[(Items.public_id == item_id, delta)
+                  for item_id, delta in changes.items()])
+        conditions = [Items.public_id.in_(list(changes))]
+        if reserve:
+            conditions.append(new_stock >= 0)
+        result = self.__session.execute(
+            update(Items).where(*conditions)
+            .values(initial_stock=new_stock)
+            .execution_options(synchronize_session=False))
+        # Items already loaded must read the new stock from the database
+        for obj in list(self.__session.identity_map.values()):
+            if isinstance(obj, Items) and obj.public_id in changes:
+                self.__session.expire(obj, ['initial_stock'])
+
+        taken = [item_id for item_id, delta in changes.items() if delta < 0]
+        if taken and result.rowcount and self.__low_stock_listeners:
+            for item_id, company_id, stock, level in self.__session.query(
+                    Items.public_id, Items.company_id,
+                    Items.initial_stock, Items.reorder_level)\
+                    .filter(Items.public_id.in_(taken),
+                            Items.needs_reorder):
+                # Only items that were above the level before this change
+                if stock - changes[item_id] > level:
+                    self.__record_low_stock(item_id, company_id,
+                                            stock, level)
+        return result.rowcount
+
+    def reserved_quantities(self, item_ids):
+        """Stock held by unexpired pending orders, by item id
+
+        initial_stock already excludes these holds, so it is the
+        quantity available; this reports how much of the rest would come
+        back if the holds expired.
+        """
+        rows = self.__session.query(
+            OrderItems.item_id, func.sum(OrderItems.quantity_ordered))\
+            .join(Orders, Orders.public_id == OrderItems.order_id)\
+            .filter(OrderItems.item_id.in_(list(item_ids)),
+                    Orders.status == 'Pending',
+                    Orders.reserved_until > datetime.utcnow())\
+            .group_by(OrderItems.item_id)
+        return {item_id: int(quantity) for item_id, quantity in rows}
+
+    def purge_revoked_tokens(self, now=None):
+        """Delete the revoked_tokens rows of tokens that have expired
+
+        An expired token is rejected anyway, so its row is no longer
+        needed. Returns the number of rows deleted.
+        """
+        deleted = self.__session.query(RevokedToken)\
+            .filter(RevokedToken.expires_at < (now or datetime.utcnow()))\
+            .delete(synchronize_session=False)
+        self.__session.commit()
+        return deleted
+
+    def release_expired_reservations(self, batch_size=500, now=None):
+        """Cancel one batch of pending orders whose reservation expired
+
+        Expired orders are found through ix_orders_status_reserved_until
+        and locked with SKIP LOCKED where supported, so several sweepers
+        can run at once. The stock of all their lines goes back in one
+        UPDATE and the batch is committed. Returns the number of orders
+        cancelled; 0 means nothing is left to release.
+        """
+        now = now or datetime.utcnow()
+        order_ids = [order_id for order_id, in self.__session.query(
+            Orders.public_id)
+            .filter(Orders.status == 'Pending', Orders.reserved_until < now)
+            .order_by(Orders.reserved_until)
+            .limit(batch_size)
+            .with_for_update(skip_locked=True)]
+        if not order_ids:
+            self.__session.rollback()
+            return 0
+
+        quantities = {}
+        for order_id, item_id, quantity in self.__session.query(
+                OrderItems.order_id, OrderItems.item_id,
+                OrderItems.quantity_ordered)\
+                .filter(OrderItems.order_id.in_(order_ids)):
+            quantities[item_id] = quantities.get(item_id, 0) + quantity
+            self.__record_movements({item_id: quantity}, 'release',
+                                    order_id)
+        if quantities:
+            self.__adjust_stock(quantities)
+        self.__session.execute(
+            update(Orders)
+            .where(Orders.public_id.in_(order_ids))
+            .values(status='Cancelled', reserved_until=None)
+            .execution_options(synchronize_session=False))
+        self.save()
+        return len(order_ids)
+
+    def bulk_insert(self, cls, rows):
+        """Insert rows (dicts of column values) with one executemany
+
+        Objects added with new() are flushed first so the rows can
+        reference them; the stock of new items is received in the
+        ledger. Not committed until save().
+        """
+        if not rows:
+            return
+        self.__session.flush()
+        self.__session.execute(insert(cls.__table__), rows)
+        if cls is Items:
+            self.__record_movements({row['public_id']: row['initial_stock']
+                                     for row in rows})
+
+    def update_catalogue(self, rows):
+        """Update existing items from catalogue rows with one executemany
+
+        Each row holds the public_id, name, price, description,
+        category, reorder_level and stockamount of an item. As in
+        update_item, the stockamount is received: it is added to
+        initial_stock, so stock held by pending orders stays reserved.
+        The items are locked and read once so rows whose item is gone
+        are skipped and the ledger gets each change. Returns the
+        public_ids of the skipped rows; not committed until save().
+        """
+        if not rows:
+            return []
+        current = {item_id for item_id, in self.__session.query(
+            Items.public_id).filter(Items.public_id.in_(
+                [row['public_id'] for row in rows])).with_for_update()}
+        valid = [row for row in rows if row['public_id'] in current]
+        skipped = [row['public_id'] for row in rows
+                   if row['public_id'] not in current]
+        if not valid:
+            return skipped
+        self.__record_movements({row['public_id']: row['stockamount']
+                                 for row in valid})
+        table = Items.__table__
+        statement = update(table).where(
+            table.c.public_id == bindparam('_public_id'),
+        ).values(
+            initial_stock=table.c.initial_stock + bindparam('_stockamount'),
+            stockamount=bindparam('_stockamount'),
+            name=bindparam('_name'),
+            price=bindparam('_price'),
+            description=bindparam('_description'),
+            category=bindparam('_category'),
+            reorder_level=bindparam('_reorder_level'),
+            updated_at=datetime.utcnow(),
+        )
+        self.__session.execute(statement, [
+            {'_' + key: value for key, value in row.items()}
+            for row in valid])
+        return skipped
+
+    def update_items(self, rows):
+        """Update items from rows of {'public_id': id, column: value}
+
+        Rows are grouped by the columns they set and each group is
+        written with one executemany UPDATE. As in update_item, a
+        stockamount is also added to initial_stock, and received in the
+        ledger; rows must name existing items. Returns the number of
+        items updated; not committed until save().
+        """
+        groups = {}
+        for row in rows:
+            columns = tuple(sorted(key for key in row if key != 'public_id'))
+            groups.setdefault(columns, []).append(row)
+        item_ids = [row['public_id'] for row in rows]
+        self.__record_movements({row['public_id']: row['stockamount']
+                                 for row in rows if 'stockamount' in row})
+        # Only a higher reorder level can take an item to low stock here
+        watch = self.__low_stock_listeners and any(
+            'reorder_level' in columns for columns in groups)
+        if watch:
+            was_low = {item_id for item_id, in self.__session.query(
+                Items.public_id).filter(Items.public_id.in_(item_ids),
+                                        Items.needs_reorder)}
+
+        table = Items.__table__
+        now = datetime.utcnow()
+        updated = 0
+        for columns, group in groups.items():
+            values = {column: bindparam('_' + column) for column in columns}
+            if 'stockamount' in values:
+                values['initial_stock'] = (table.c.initial_stock
+                                           + bindparam('_stockamount'))
+            values['updated_at'] = now
+            result = self.__session.execute(
+                update(table)
+                .where(table.c.public_id == bindparam('_public_id'))
+                .values(values),
+                [{'_' + key: value for key, value in row.items()}
+                 for row in group])
+            updated += result.rowcount
+        # Items already loaded must read the new values from the database
+        changed = set(item_ids)
+        for obj in list(self.__session.identity_map.values()):
+            if isinstance(obj, Items) and obj.public_id in changed:
+                self.__session.expire(obj)
+
+        if watch:
+            for item_id, company_id, stock, level in self.__session.query(
+                    Items.public_id, Items.company_id,
+                    Items.initial_stock, Items.reorder_level)\
+                    .filter(Items.public_id.in_(item_ids),
+                            Items.needs_reorder):
+                if item_id not in was_low:
+                    self.__record_low_stock(item_id, company_id,
+                                            stock, level)
+        return updated
+
+    def take_stock_snapshots(self, batch_size=1000):
+        """Record the stock of every item in stock_snapshots
+
+        Items are read batch_size at a time in public_id order with a
+        locking read, so each snapshot falls between two movements, and
+        each batch is inserted with one executemany and committed. Each
+        snapshot records the sequence of the last movement it includes.
+        Returns the number of snapshots taken.
+        """
+        last_movement = select(func.max(StockMovement.sequence))\
+            .where(StockMovement.item_id == Items.public_id)\
+            .scalar_subquery()
+        taken, last_id = 0, None
+        while True:
+            query = self.__session.query(Items.public_id,
+                                         Items.initial_stock, last_movement)
+            if last_id is not None:
+                query = query.filter(Items.public_id > last_id)
+            batch = query.order_by(Items.public_id).limit(batch_size)\
+                .with_for_update().all()
+            if batch:
+                self.__session.execute(
+                    insert(StockSnapshot.__table__),
+                    [{'item_id': item_id, 'stock': stock,
+                      'last_sequence': sequence,
+                      'created_at': datetime.utcnow()}
+                     for item_id, stock, sequence in batch])
+            self.__session.commit()
+            taken += len(batch)
+            if len(batch) < batch_size:
+                return taken
+            last_id = batch[-1][0]
+
+    def refresh_category_counts(self, batch_size=500):
+        """Rebuild category_counts from the items table
+
+        Companies are counted batch_size at a time with one GROUP BY over
+        ix_items_company_id_created_at, and each batch replaces their
+        rows in one transaction, so readers never see a half-counted
+        company. The global rows are then summed from the company rows,
+        and rows not recounted (e.g. of deleted companies) are removed.
+        Each rebuild tags its rows with a new generation id, so neither
+        depends on clock precision. Returns the number of company rows
+        written.
+        """
+        generation = new_public_id()
+        in_stock = func.sum(case((Items.initial_stock > 0, 1), else_=0))
+        written, last_id = 0, None
+        while True:
+            query = self.__session.query(Company.public_id)
+            if last_id is not None:
+                query = query.filter(Company.public_id > last_id)
+            company_ids = [company_id for company_id, in query.order_by(
+                Company.public_id).limit(batch_size)]
+            if not company_ids:
+                break
+            rows = [{'company_id': company_id, 'category': category,
+                     'item_count': count, 'in_stock_count': int(stocked),
+                     'generation': generation}
+                    for company_id, category, count, stocked
+                    in self.__session.query(
+                        Items.company_id, Items.category, func.count(),
+                        in_stock)
+                    .filter(Items.company_id.in_(company_ids))
+                    .group_by(Items.company_id, Items.category)]
+            self.__session.query(CategoryCount)\
+                .filter(CategoryCount.company_id.in_(company_ids))\
+                .delete(synchronize_session=False)
+            self.bulk_insert(CategoryCount, rows)
+            self.__session.commit()
+            written += len(rows)
+            last_id = company_ids[-1]
+
+        totals = self.__session.query(
+            CategoryCount.category, func.sum(CategoryCount.item_count),
+            func.sum(CategoryCount.in_stock_count))\
+            .filter(CategoryCount.company_id.isnot(None),
+                    CategoryCount.generation == generation)\
+            .group_by(CategoryCount.category).all()
+        self.__session.query(CategoryCount)\
+            .filter(CategoryCount.generation != generation)\
+            .delete(synchronize_session=False)
+        self.__session.query(CategoryCount)\
+            .filter(CategoryCount.company_id.is_(None))\
+            .delete(synchronize_session=False)
+        self.bulk_insert(CategoryCount, [
+            {'company_id': None, 'category': category,
+             'item_count': int(count), 'in_stock_count': int(stocked),
+             'generation': generation}
+            for category, count, stocked in totals])
+        self.__session.commit()
+        return written
+
+    def latest_snapshot(self, item_id, at=None):
+        """The last StockSnapshot of an item taken at or before at"""
+        query = self.__session.query(StockSnapshot)\
+            .filter(StockSnapshot.item_id == item_id)
+        if at is not None:
+            query = query.filter(StockSnapshot.created_at <= at)
+        return query.order_by(StockSnapshot.created_at.desc()).first()
+
+    def stock_at(self, item_id, at):
+        """Available stock of an item at time at, from the ledger
+
+        The latest snapshot before at plus the movements after the last
+        one it includes, both range scans of an item_id index. Items
+        without a snapshot add up their movements from creation.
+        """
+        snapshot = self.latest_snapshot(item_id, at)
+        query = self.__session.query(func.sum(StockMovement.quantity))\
+            .filter(StockMovement.item_id == item_id,
+                    StockMovement.created_at <= at)
+        if snapshot and snapshot.last_sequence:
+            query = query.filter(
+                StockMovement.sequence > snapshot.last_sequence)
+        moved = query.scalar() or 0
+        return (snapshot.stock if snapshot else 0) + int(moved)
+
+    def search_items(self, words, company_id=None, limit=20, after=None):
+        """Best (score, item) matches of words, from the FULLTEXT index
+
+        MySQL only. Items must hold every word of at least
+        innodb_ft_min_token_size (3) characters; the last word also
+        matches longer words it starts. Results are ranked by relevance,
+        then public_id; after is the (score, public_id) of the last
+        result of the previous page.
+        """
+        words = [word for word in words if len(word) >= 3]
+        if not words:
+            return []
+        relevance = match(Items.name, Items.description, Items.category,
+                          Items.SKU,
+                          against=' '.join('+' + word for word in words)
+                          + '*').in_boolean_mode()
+        query = self.__session.query(Items, relevance).filter(relevance)
+        if company_id is not None:
+            query = query.filter(Items.company_id == company_id)
+        if after is not None:
+            score, public_id = after
+            query = query.filter(or_(
+                relevance < score,
+                and_(relevance == score, Items.public_id > public_id)))
+        return [(score, item) for item, score in query.order_by(
+            relevance.desc(), Items.public_id).limit(limit)]
 
     def rollback(self):
         """Rollback the session"""
+        self.__session.info.pop('low_stock', None)
+        self.__session.info.pop('stock_movements', None)
         self.__session.rollback()
 
-    def count(self, cls=None):
-        """Count objects in storage"""
-        if cls:
-            return self.__session.query(cls).count()
+    def count(self, cls=None, approximate=False):
+        """Count objects in storage
+
+        With approximate=True the count may be estimated (see counts)
+        and up to count_cache_ttl seconds old.
+        """
+        return sum(self.counts([cls] if cls else None,
+                               approximate).values())
+
+    def counts(self, classes=None, approximate=False):
+        """Count objects per class name in a single statement
+
+        Approximate counts come from the table statistics on MySQL and
+        from exact counts elsewhere; either way they are cached for
+        count_cache_ttl seconds.
+        """
+        classes = classes or CLASSES
+        if not approximate:
+            return self.__exact_counts(classes)
+
+        key = tuple(cls.__name__ for cls in classes)
+        cached = self.__count_cache.get(key)
+        if cached and cached[0] > time.monotonic():
+            return dict(cached[1])
+        if self.__engine.dialect.name == 'mysql':
+            counts = self.__estimated_counts(classes)
         else:
-            classes = [Address, Client,
-                       Company, Items, OrderItems,
-                       Orders, Payments]
-            count = 0
-            for c in classes:
-                count += self.__session.query(c).count()
-            return count
+            counts = self.__exact_counts(classes)
+        self.__count_cache[key] = (time.monotonic() + self.count_cache_ttl,
+                                   counts)
+        return dict(counts)
+
+    def __exact_counts(self, classes):
+        """SELECT (SELECT COUNT(*) FROM a), (SELECT COUNT(*) FROM b), ..."""
+        statement = select(*[
+            select(func.count()).select_from(cls.__table__)
+            .scalar_subquery().label(cls.__name__) for cls in classes])
+        row = self.__session.execute(statement).one()
+        return dict(zip((cls.__name__ for cls in classes), row))
+
+    def __estimated_counts(self, classes):
+        """Row estimates from the InnoDB table statistics"""
+        statement = text(
+            "SELECT TABLE_NAME, TABLE_ROWS FROM information_schema.TABLES "
+            "WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME IN :names"
+        ).bindparams(bindparam('names', expanding=True))
+        rows = dict(self.__session.execute(
+            statement,
+            {'names': [cls.__tablename__ for cls in classes]}).all())
+        return {cls.__name__: int(rows.get(cls.__tablename__) or 0)
+                for cls in classes}
 
 
 # Initialize the storage instance for use throughout the project
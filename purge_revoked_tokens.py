@@ -0,0 +1,27 @@
+#!/usr/bin/env python3
+"""Script to delete the revoked_tokens rows of expired tokens
+
+Expired tokens are rejected whether or not they were revoked, so their
+rows only grow the table. Run it once (e.g. daily from cron) or with
+--interval to keep purging.
+"""
+
+import argparse
+import time
+from models import storage
+
+# Set up argument parser
+parser = argparse.ArgumentParser(
+    description='Delete revoked tokens that have expired.')
+parser.add_argument('--interval', type=float, default=0,
+                    help='seconds between purges; 0 purges once and exits')
+args = parser.parse_args()
+
+while True:
+    deleted = storage.purge_revoked_tokens()
+    storage.close()
+    if deleted:
+        print(f"Purged {deleted} expired revoked tokens")
+    if not args.interval:
+        break
+    time.sleep(args.interval)
@@ -0,0 +1,29 @@
+#!/usr/bin/env python3
+"""Script to recount the items of every category into category_counts
+
+The category facet endpoints read these counts, so they never aggregate
+the items table per request. Run it periodically (e.g. every few minutes
+from cron) or with --interval to keep the counts fresh.
+"""
+
+import argparse
+import time
+from models import storage
+
+# Set up argument parser
+parser = argparse.ArgumentParser(
+    description='Refresh the per-category item counts.')
+parser.add_argument('--batch-size', type=int, default=500,
+                    help='companies recounted per transaction')
+parser.add_argument('--interval', type=float, default=0,
+                    help='seconds between refreshes; 0 refreshes once '
+                         'and exits')
+args = parser.parse_args()
+
+while True:
+    written = storage.refresh_category_counts(args.batch_size)
+    storage.close()
+    print(f"Refreshed {written} category counts")
+    if not args.interval:
+        break
+    time.sleep(args.interval)
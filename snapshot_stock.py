@@ -0,0 +1,28 @@
+#!/usr/bin/env python3
+"""Script to record the stock of every item in the stock ledger
+
+Each run adds one snapshot row per item, so stock at a past time only
+needs the movements since the snapshot before it. Run it periodically
+(e.g. nightly from cron) or with --interval to keep snapshotting.
+"""
+
+import argparse
+import time
+from models import storage
+
+# Set up argument parser
+parser = argparse.ArgumentParser(
+    description='Snapshot the available stock of every item.')
+parser.add_argument('--batch-size', type=int, default=1000,
+                    help='items snapshotted per transaction')
+parser.add_argument('--interval', type=float, default=0,
+                    help='seconds between snapshots; 0 takes one and exits')
+args = parser.parse_args()
+
+while True:
+    taken = storage.take_stock_snapshots(args.batch_size)
+    storage.close()
+    print(f"Snapshotted the stock of {taken} items")
+    if not args.interval:
+        break
+    time.sleep(args.interval)
@@ -0,0 +1,34 @@
+#!/usr/bin/env python3
+"""Script to release the stock of pending orders whose reservation expired
+
+Expired orders are cancelled and their items restocked, batch by batch.
+Run it once (e.g. from cron) or with --interval to keep sweeping; several
+sweepers can run side by side.
+"""
+
+import argparse
+import time
+from models import storage
+
+# Set up argument parser
+parser = argparse.ArgumentParser(
+    description='Cancel pending orders whose stock reservation expired.')
+parser.add_argument('--batch-size', type=int, default=500,
+                    help='orders released per transaction')
+parser.add_argument('--interval', type=float, default=0,
+                    help='seconds between sweeps; 0 sweeps once and exits')
+args = parser.parse_args()
+
+while True:
+    released = 0
+    while True:
+        batch = storage.release_expired_reservations(args.batch_size)
+        released += batch
+        if batch < args.batch_size:
+            break
+    storage.close()
+    if released:
+        print(f"Released {released} expired reservations")
+    if not args.interval:
+        break
+    time.sleep(args.interval)
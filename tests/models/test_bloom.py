@@ -0,0 +1,37 @@
+#!/usr/bin/env python3
+"""Unittest Module for BloomFilter"""
+
+import sys
+import os
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '../../')))
+
+import unittest
+from models.bloom import BloomFilter
+from models.ids import new_public_id
+
+
+class BloomFilterTestCase(unittest.TestCase):
+    def test_added_keys_are_present(self):
+        """Test that the filter has no false negatives"""
+        bloom = BloomFilter(capacity=1000)
+        keys = [new_public_id() for _ in range(1000)]
+        for key in keys:
+            bloom.add(key)
+        self.assertTrue(all(key in bloom for key in keys))
+        self.assertEqual(bloom.count, 1000)
+
+    def test_false_positive_rate(self):
+        """Test that unknown keys are rarely reported present"""
+        bloom = BloomFilter(capacity=1000, error_rate=0.01)
+        for _ in range(1000):
+            bloom.add(new_public_id())
+        false_positives = sum(new_public_id() in bloom for _ in range(10000))
+        self.assertLess(false_positives, 300)
+
+    def test_empty_filter(self):
+        """Test that an empty filter holds nothing"""
+        self.assertNotIn('token', BloomFilter())
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,65 @@
+#!/usr/bin/env python3
+"""Unittest Module for TTLCache"""
+
+import sys
+import os
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '../../')))
+
+import unittest
+from unittest import mock
+from models.cache import TTLCache
+
+
+class TTLCacheTestCase(unittest.TestCase):
+    def test_get_and_set(self):
+        """Test caching and reading back a value"""
+        cache = TTLCache()
+        self.assertIsNone(cache.get('key'))
+        cache.set('key', 'value')
+        self.assertEqual(cache.get('key'), 'value')
+
+    def test_expiry(self):
+        """Test that entries expire after ttl seconds"""
+        cache = TTLCache(ttl=10)
+        with mock.patch('models.cache.time.monotonic', return_value=100):
+            cache.set('key', 'value')
+        with mock.patch('models.cache.time.monotonic', return_value=109):
+            self.assertEqual(cache.get('key'), 'value')
+        with mock.patch('models.cache.time.monotonic', return_value=111):
+            self.assertIsNone(cache.get('key'))
+
+    def test_lru_eviction(self):
+        """Test that the least recently used entry is evicted first"""
+        cache = TTLCache(maxsize=2)
+        cache.set('a', 1)
+        cache.set('b', 2)
+        cache.get('a')
+        cache.set('c', 3)
+        self.assertIsNone(cache.get('b'))
+        self.assertEqual(cache.get('a'), 1)
+        self.assertEqual(cache.get('c'), 3)
+
+    def test_invalidate(self):
+        """Test dropping a single entry"""
+        cache = TTLCache()
+        cache.set('key', 'value')
+        cache.invalidate('key')
+        self.assertIsNone(cache.get('key'))
+
+    def test_stats_and_listeners(self):
+        """Test hit ratio reporting and the lookup hook"""
+        cache = TTLCache()
+        lookups = []
+        cache.subscribe(lookups.append)
+        cache.get('key')
+        cache.set('key', 'value')
+        cache.get('key')
+        cache.get('key')
+        self.assertEqual(lookups, [False, True, True])
+        stats = cache.stats()
+        self.assertEqual((stats['hits'], stats['misses']), (2, 1))
+        self.assertAlmostEqual(stats['hit_ratio'], 2 / 3)
+
+
+if __name__ == '__main__':
+    unittest.main()
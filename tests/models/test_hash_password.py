@@ -0,0 +1,152 @@
+#!/usr/bin/env python3
+"""Unittest Module for the password pool and bcrypt helpers"""
+
+import sys
+import os
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '../../')))
+
+import importlib
+import threading
+import time
+import unittest
+from unittest import mock
+import bcrypt
+from api.app import app
+from api.views.hash_password import (
+    PasswordPool, PasswordPoolBusy, password_pool, hash_password,
+    verify_password, hash_rounds, needs_rehash, calibrate_rounds,
+    bcrypt_rounds, MIN_ROUNDS, MAX_ROUNDS
+)
+
+# The module, which api.views shadows with its hash_password function
+hashing = importlib.import_module('api.views.hash_password')
+
+
+def wait_for(condition, timeout=5):
+    """Wait until condition() holds, failing after timeout seconds"""
+    deadline = time.monotonic() + timeout
+    while not condition():
+        if time.monotonic() > deadline:
+            raise AssertionError('Timed out waiting')
+        time.sleep(0.01)
+
+
+class PasswordPoolTestCase(unittest.TestCase):
+    def test_runs_on_worker_threads(self):
+        """Test that calls run on the pool's threads and return results"""
+        pool = PasswordPool(workers=2, queue_depth=0)
+        self.assertEqual(pool.run(lambda: threading.current_thread().name)
+                         [:6], 'bcrypt')
+        self.assertEqual(pool.run(pow, 2, 10), 1024)
+        wait_for(lambda: pool.stats()['completed'] == 2)
+        self.assertEqual(pool.stats()['in_flight'], 0)
+
+    def test_rejects_beyond_capacity(self):
+        """Test that calls beyond workers + queue_depth are rejected"""
+        pool = PasswordPool(workers=1, queue_depth=1)
+        release = threading.Event()
+        callers = [threading.Thread(target=pool.run, args=(release.wait,))
+                   for _ in range(2)]
+        for caller in callers:
+            caller.start()
+        try:
+            wait_for(lambda: pool.stats()['in_flight'] == 2)
+            self.assertEqual(pool.stats()['queued'], 1)
+            with self.assertRaises(PasswordPoolBusy):
+                pool.run(release.wait)
+            self.assertEqual(pool.stats()['rejected'], 1)
+        finally:
+            release.set()
+            for caller in callers:
+                caller.join()
+        # Finished calls free their slots
+        wait_for(lambda: pool.stats()['in_flight'] == 0)
+        self.assertTrue(pool.run(release.wait))
+
+    def test_errors_free_the_slot(self):
+        """Test that an exception reaches the caller and frees its slot"""
+        pool = PasswordPool(workers=1, queue_depth=0)
+        with self.assertRaises(ZeroDivisionError):
+            pool.run(divmod, 1, 0)
+        wait_for(lambda: pool.stats()['in_flight'] == 0)
+        self.assertEqual(pool.run(divmod, 7, 2), (3, 1))
+
+    def test_hash_and_verify(self):
+        """Test that passwords hashed on the pool verify on it"""
+        with mock.patch('api.views.hash_password.bcrypt_rounds',
+                        return_value=4):
+            hashed = hash_password('s3cret')
+        self.assertTrue(verify_password('s3cret', hashed))
+        self.assertFalse(verify_password('wrong', hashed))
+
+    def test_busy_pool_answers_503(self):
+        """Test that sign-ups are turned away quickly when saturated"""
+        with mock.patch.object(password_pool, 'run',
+                               side_effect=PasswordPoolBusy('full')), \
+                app.test_request_context(
+                    '/api/clients/sign_up', method='POST', json={
+                        'username': 'busy', 'password': 'pw',
+                        'firstname': 'B', 'lastname': 'Usy',
+                        'email': 'busy@example.com',
+                        'phone': '0700000000'}):
+            response = app.full_dispatch_request()
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(response.headers['Retry-After'], '1')
+
+
+class BcryptRoundsTestCase(unittest.TestCase):
+    def setUp(self):
+        """Forget the work factor this process settled on"""
+        self.saved = hashing._rounds
+        hashing._rounds = None
+
+    def tearDown(self):
+        """Restore the process work factor"""
+        hashing._rounds = self.saved
+
+    def test_hash_rounds(self):
+        """Test reading the work factor out of a hash"""
+        hashed = bcrypt.hashpw(b'pw', bcrypt.gensalt(5))
+        self.assertEqual(hash_rounds(hashed), 5)
+        self.assertEqual(hash_rounds(hashed.decode()), 5)
+        self.assertIsNone(hash_rounds('not a hash'))
+
+    def test_needs_rehash_only_upgrades(self):
+        """Test that only hashes below our work factor are rehashed"""
+        with mock.patch('api.views.hash_password.bcrypt_rounds',
+                        return_value=12):
+            self.assertTrue(needs_rehash('$2b$11$' + 'x' * 53))
+            self.assertFalse(needs_rehash('$2b$12$' + 'x' * 53))
+            # Another worker calibrated one round higher: kept
+            self.assertFalse(needs_rehash('$2b$13$' + 'x' * 53))
+            self.assertTrue(needs_rehash('garbage'))
+
+    def test_calibrate_rounds(self):
+        """Test that each doubling of the target buys one round"""
+        with mock.patch('api.views.hash_password.time_rounds',
+                        return_value=0.010):
+            self.assertEqual(calibrate_rounds(10), MIN_ROUNDS)
+            self.assertEqual(calibrate_rounds(19), MIN_ROUNDS)
+            self.assertEqual(calibrate_rounds(40), MIN_ROUNDS + 2)
+            self.assertEqual(calibrate_rounds(10 ** 9), MAX_ROUNDS)
+        with mock.patch('api.views.hash_password.time_rounds',
+                        return_value=1.0):
+            self.assertEqual(calibrate_rounds(250), MIN_ROUNDS)
+
+    def test_bcrypt_rounds(self):
+        """Test that BCRYPT_ROUNDS pins the work factor, calibrated once
+        otherwise"""
+        with mock.patch.dict(os.environ, {'BCRYPT_ROUNDS': '11'}):
+            self.assertEqual(bcrypt_rounds(), 11)
+        hashing._rounds = None
+        with mock.patch.dict(os.environ, {'BCRYPT_ROUNDS': '',
+                                          'BCRYPT_TARGET_MS': '80'}), \
+                mock.patch('api.views.hash_password.calibrate_rounds',
+                           return_value=13) as calibrate:
+            self.assertEqual(bcrypt_rounds(), 13)
+            self.assertEqual(bcrypt_rounds(), 13)
+        calibrate.assert_called_once_with(80.0)
+
+
+if __name__ == '__main__':
+    unittest.main()
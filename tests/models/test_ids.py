@@ -0,0 +1,87 @@
+#!/usr/bin/env python3
+"""Unittest Module for public ids"""
+
+import sys
+import os
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '../../')))
+
+import time
+import unittest
+import uuid
+from sqlalchemy import create_engine, Column, MetaData, Table, select
+from models import storage  # noqa: F401 (maps every model)
+from models.basemodel import Base
+from models.ids import uuid7, new_public_id, UUIDBinary
+from migrate_public_ids import id_columns
+
+
+class Uuid7TestCase(unittest.TestCase):
+    def test_version_and_variant(self):
+        """Test that generated ids are RFC 4122 version 7 UUIDs"""
+        value = uuid7()
+        self.assertEqual(value.version, 7)
+        self.assertEqual(value.variant, uuid.RFC_4122)
+
+    def test_time_ordered(self):
+        """Test that later ids sort after earlier ones"""
+        first = new_public_id()
+        time.sleep(0.002)
+        second = new_public_id()
+        self.assertLess(first, second)
+        self.assertEqual(str(uuid.UUID(second)), second)
+
+
+class UUIDBinaryTestCase(unittest.TestCase):
+    def setUp(self):
+        """Set up a table keyed by a BINARY(16) id"""
+        self.engine = create_engine('sqlite:///:memory:')
+        self.table = Table('things', MetaData(),
+                           Column('public_id', UUIDBinary(), primary_key=True))
+        self.table.metadata.create_all(self.engine)
+
+    def tearDown(self):
+        """Tear down test database"""
+        self.engine.dispose()
+
+    def test_round_trip(self):
+        """Test that ids are stored as 16 bytes and read back as strings"""
+        public_id = new_public_id()
+        with self.engine.begin() as connection:
+            connection.execute(self.table.insert(), {'public_id': public_id})
+            stored = connection.exec_driver_sql(
+                'SELECT public_id FROM things').scalar()
+            loaded = connection.execute(select(self.table.c.public_id).where(
+                self.table.c.public_id == public_id)).scalar()
+        self.assertEqual(len(stored), 16)
+        self.assertEqual(loaded, public_id)
+
+    def test_invalid_id_matches_nothing(self):
+        """Test that a non-UUID lookup finds no row instead of failing"""
+        with self.engine.begin() as connection:
+            connection.execute(self.table.insert(),
+                               {'public_id': new_public_id()})
+            found = connection.execute(select(self.table.c.public_id).where(
+                self.table.c.public_id == 'not-a-uuid')).all()
+        self.assertEqual(found, [])
+
+
+class IdColumnsTestCase(unittest.TestCase):
+    def test_every_public_id_column(self):
+        """Test that ids without a foreign key are migrated too"""
+        tables = Base.metadata.tables
+        self.assertEqual(
+            [column.name for column in id_columns(tables['stock_movements'])],
+            ['public_id', 'item_id', 'order_id'])
+        self.assertEqual(
+            [column.name for column in id_columns(tables['category_counts'])],
+            ['public_id', 'company_id', 'generation'])
+        self.assertEqual(
+            [column.name for column in id_columns(tables['orders'])],
+            ['public_id', 'client_id', 'shipping_address_id'])
+        # Other strings keep their type
+        self.assertNotIn('name', [column.name for column in
+                                  id_columns(tables['items'])])
+
+
+if __name__ == '__main__':
+    unittest.main()
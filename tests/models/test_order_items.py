@@ -142,5 +142,29 @@ class OrderItemsTestCase(unittest.TestCase):
             self.session.add(order_item)
             self.session.commit()
 
+    def test_order_items_unique_item_per_order(self):
+        """Test that an item can only appear once in an order"""
+        self.session.add(OrderItems(
+            public_id='orderitem125',
+            order_id=self.order.public_id,
+            item_id=self.item.public_id,
+            quantity_ordered=1,
+            price_at_order_time=self.item.price
+        ))
+        self.session.commit()
+
+        duplicate = OrderItems(
+            public_id='orderitem126',
+            order_id=self.order.public_id,
+            item_id=self.item.public_id,
+            quantity_ordered=2,
+            price_at_order_time=self.item.price
+        )
+        # The composite unique index should reject the second line
+        with self.assertRaises(Exception):
+            self.session.add(duplicate)
+            self.session.commit()
+
+
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,64 @@
+#!/usr/bin/env python3
+"""Unittest Module for the connection pool helpers"""
+
+import sys
+import os
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '../../')))
+
+import sqlite3
+import unittest
+from unittest import mock
+from sqlalchemy.exc import TimeoutError
+from models.pool import PoolStats, InstrumentedQueuePool, pool_options
+
+
+class PoolOptionsTestCase(unittest.TestCase):
+    def test_defaults(self):
+        """Test the defaults used without config or environment"""
+        with mock.patch.dict(os.environ, {}, clear=True):
+            options = pool_options()
+        self.assertEqual(options['pool_size'], 5)
+        self.assertTrue(options['pool_pre_ping'])
+
+    def test_environment_and_config(self):
+        """Test that app config takes precedence over the environment"""
+        environ = {'DB_POOL_SIZE': '20', 'DB_POOL_PRE_PING': 'false',
+                   'DB_POOL_RECYCLE': '600'}
+        with mock.patch.dict(os.environ, environ, clear=True):
+            options = pool_options({'DB_POOL_SIZE': 8})
+        self.assertEqual(options['pool_size'], 8)
+        self.assertEqual(options['pool_recycle'], 600)
+        self.assertFalse(options['pool_pre_ping'])
+
+
+class PoolStatsTestCase(unittest.TestCase):
+    def test_histogram(self):
+        """Test that waits land in the right buckets"""
+        stats = PoolStats()
+        stats.observe(0.0005)
+        stats.observe(0.02)
+        stats.observe(10, timed_out=True)
+        result = stats.to_dict()
+        self.assertEqual(result['checkouts'], 3)
+        self.assertEqual(result['timeouts'], 1)
+        self.assertEqual(result['wait_histogram']['<=1ms'], 1)
+        self.assertEqual(result['wait_histogram']['<=50ms'], 1)
+        self.assertEqual(result['wait_histogram']['>5000ms'], 1)
+
+    def test_instrumented_pool(self):
+        """Test that checkouts and timeouts are recorded by the pool"""
+        pool = InstrumentedQueuePool(lambda: sqlite3.connect(':memory:'),
+                                     pool_size=1, max_overflow=0,
+                                     timeout=0.01)
+        connection = pool.connect()
+        with self.assertRaises(TimeoutError):
+            pool.connect()
+        connection.close()
+        result = pool.stats.to_dict()
+        self.assertEqual(result['checkouts'], 2)
+        self.assertEqual(result['timeouts'], 1)
+        self.assertIs(pool.recreate().stats, pool.stats)
+
+
+if __name__ == '__main__':
+    unittest.main()
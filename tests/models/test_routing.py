@@ -0,0 +1,108 @@
+#!/usr/bin/env python3
+"""Unittest Module for RoutingSession"""
+
+import sys
+import os
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '../../')))
+
+import tempfile
+import unittest
+from unittest import mock
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from models.basemodel import Base
+from models.company import Company
+from models.routing import RoutingSession
+from models.storage import Storage
+
+
+def make_company(public_id):
+    """Company with the required fields filled in"""
+    return Company(public_id=public_id, name=public_id, username=public_id,
+                   hashed_password='hashedpassword',
+                   email=f'{public_id}@example.com', phone_number=public_id,
+                   address1='123 Corporate Ave', city='Test City',
+                   state='Test State', zip='54321', country='Test Country',
+                   role='company')
+
+
+class RoutingSessionTestCase(unittest.TestCase):
+    def setUp(self):
+        """Set up a primary and a replica holding different rows"""
+        self.primary = create_engine('sqlite:///:memory:')
+        self.replica = create_engine('sqlite:///:memory:')
+        for engine, public_id in ((self.primary, 'primary'),
+                                  (self.replica, 'replica')):
+            Base.metadata.create_all(engine)
+            session = sessionmaker(bind=engine)()
+            session.add(make_company(public_id))
+            session.commit()
+            session.close()
+        self.Session = sessionmaker(bind=self.primary, class_=RoutingSession,
+                                    info={'replicas': [self.replica]})
+
+    def tearDown(self):
+        """Tear down test databases"""
+        self.primary.dispose()
+        self.replica.dispose()
+
+    def names(self, session):
+        """Company names visible to session"""
+        return [company.name for company in session.query(Company)]
+
+    def test_reads_primary_by_default(self):
+        """Test that unmarked sessions read from the primary"""
+        session = self.Session()
+        self.assertEqual(self.names(session), ['primary'])
+        session.close()
+
+    def test_read_only_session_uses_replica(self):
+        """Test that read-only sessions read from a replica"""
+        session = self.Session()
+        session.info['read_only'] = True
+        self.assertEqual(self.names(session), ['replica'])
+        session.close()
+
+    def test_reads_own_writes(self):
+        """Test that a session returns to the primary once it writes"""
+        session = self.Session()
+        session.info['read_only'] = True
+        session.add(make_company('written'))
+        session.commit()
+        self.assertEqual(sorted(self.names(session)), ['primary', 'written'])
+        session.close()
+
+
+class ReplicaLagTestCase(unittest.TestCase):
+    def setUp(self):
+        """Set up a storage with one replica"""
+        self.directory = tempfile.TemporaryDirectory()
+        primary, replica = (f'sqlite:///{self.directory.name}/{name}.db'
+                            for name in ('primary', 'replica'))
+        self.storage = Storage()
+        self.storage.configure({'DATABASE_URI': primary,
+                                'DATABASE_REPLICA_URIS': replica,
+                                'REPLICA_MAX_LAG': 5,
+                                'REPLICA_LAG_CHECK_INTERVAL': 60})
+
+    def tearDown(self):
+        """Tear down test databases"""
+        self.storage.close()
+        self.directory.cleanup()
+
+    def test_lagging_replica_is_skipped(self):
+        """Test that reads stay on the primary while replicas lag"""
+        with mock.patch('models.storage.replica_lag', return_value=30):
+            self.assertFalse(self.storage.use_replica())
+
+    def test_lag_is_cached(self):
+        """Test that the lag is measured once per check interval"""
+        with mock.patch('models.storage.replica_lag',
+                        return_value=1) as lag:
+            self.assertTrue(self.storage.use_replica())
+            self.assertTrue(self.storage.use_replica())
+        self.assertEqual(lag.call_count, 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
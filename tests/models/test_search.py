@@ -0,0 +1,76 @@
+#!/usr/bin/env python3
+"""Unittest Module for SearchIndex"""
+
+import sys
+import os
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '../../')))
+
+import unittest
+from models.search import SearchIndex, tokenize
+
+
+class SearchIndexTestCase(unittest.TestCase):
+    def setUp(self):
+        """Index a small catalogue of two companies"""
+        self.index = SearchIndex()
+        self.index.add('1', 'Red apple Fresh fruit Grocery SKU-1', 'a')
+        self.index.add('2', 'Apple pie Baked apple dessert Bakery SKU-2', 'a')
+        self.index.add('3', 'Applesauce jar Grocery SKU-3', 'b')
+        self.index.add('4', 'Banana bread Bakery SKU-4', 'b')
+
+    def test_tokenize(self):
+        """Test that text is split into lower-cased words"""
+        self.assertEqual(tokenize('Apple-pie, 2 PCS'),
+                         ['apple', 'pie', '2', 'pcs'])
+
+    def test_ranked_matches(self):
+        """Test that every word must match and better matches come first"""
+        results = self.index.search('apple')
+        self.assertEqual([doc for _, doc in results][0], '2')
+        self.assertEqual({doc for _, doc in results}, {'1', '2', '3'})
+        self.assertEqual(results, sorted(results, key=lambda r: -r[0]))
+        self.assertEqual([doc for _, doc in self.index.search('bakery pie')],
+                         ['2'])
+        self.assertEqual(self.index.search('apple banana'), [])
+
+    def test_prefix_and_group(self):
+        """Test search as you type and restricting to a group"""
+        self.assertEqual({doc for _, doc in self.index.search('gro')},
+                         {'1', '3'})
+        # Words shorter than MIN_PREFIX only match whole words
+        self.assertEqual(self.index.search('ap'), [])
+        self.assertEqual([doc for _, doc in self.index.search('app', 'b')],
+                         ['3'])
+
+    def test_pages(self):
+        """Test that pages resume after the last result"""
+        first = self.index.search('sku', limit=3)
+        rest = self.index.search('sku', limit=3, after=first[-1])
+        self.assertEqual(len(first), 3)
+        self.assertEqual(len(rest), 1)
+        self.assertNotIn(rest[0], first)
+
+    def test_reindex_and_remove(self):
+        """Test that changed and removed documents are searched as such"""
+        self.index.add('4', 'Banana apple bread Bakery SKU-4', 'b')
+        self.assertIn('4', [doc for _, doc in self.index.search('apple')])
+        self.assertEqual(self.index.search('banana bread')[0][1], '4')
+        self.index.remove('4')
+        self.assertEqual(self.index.search('banana'), [])
+        self.assertNotIn('4', self.index)
+        self.assertEqual(len(self.index), 3)
+
+    def test_copy(self):
+        """Test that a copy changes without changing the original"""
+        copy = self.index.copy()
+        copy.remove('1')
+        copy.add('5', 'Apple juice Drinks SKU-5', 'a')
+        self.assertEqual({doc for _, doc in self.index.search('apple')},
+                         {'1', '2', '3'})
+        self.assertEqual({doc for _, doc in copy.search('apple', 'a')},
+                         {'2', '5'})
+        self.assertEqual(self.index.search('juice'), [])
+
+
+if __name__ == '__main__':
+    unittest.main()
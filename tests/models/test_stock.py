@@ -0,0 +1,410 @@
+#!/usr/bin/env python3
+"""Unittest Module for atomic stock reservation"""
+
+import sys
+import os
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '../../')))
+
+import subprocess
+import tempfile
+import threading
+import time
+import unittest
+from datetime import datetime, timedelta
+from models import storage
+from models.address import Address
+from models.category_count import CategoryCount
+from models.client import Client
+from models.company import Company
+from models.items import Items
+from models.order_items import OrderItems
+from models.orders import Orders
+from models.stock_movement import StockMovement
+from models.stock_snapshot import StockSnapshot
+from models.ids import new_public_id
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '../../'))
+
+# Reserves and restocks two items with storage built on BINARY(16) ids
+BINARY_ID_SCRIPT = '''
+from models import storage
+from models.company import Company
+from models.items import Items
+from models.ids import new_public_id
+storage.reload()
+suffix = new_public_id()
+storage.new(Company(public_id=suffix, name=suffix, username=suffix,
+                    hashed_password='x', email=suffix, phone_number=suffix,
+                    address1='1 Main St', city='Nairobi', state='Nairobi',
+                    zip='00100', country='Kenya', role='company'))
+ids = [new_public_id() for _ in range(2)]
+for item_id in ids:
+    storage.new(Items(public_id=item_id, company_id=suffix, name='Item',
+                      stockamount=10, initial_stock=10, reorder_level=1,
+                      price=1.0, description='x', category='Deals',
+                      SKU=item_id))
+storage.save()
+print(storage.reserve_stocks({ids[0]: 4, ids[1]: 6}))
+storage.save()
+print(storage.reserve_stocks({ids[0]: 1, ids[1]: 5}))
+storage.rollback()
+print(storage.restock({ids[0]: 2, ids[1]: 3}))
+storage.save()
+storage.close()
+print(*[storage.get(Items, item_id).initial_stock for item_id in ids])
+'''
+
+THREADS = 16
+ATTEMPTS = 10
+STOCK = 50
+
+
+class StockReservationTestCase(unittest.TestCase):
+    def setUp(self):
+        """Set up a company with two items in stock"""
+        storage.reload()
+        suffix = new_public_id()
+        self.company = Company(public_id=suffix, name=suffix,
+                               username=suffix, hashed_password='x',
+                               email=f'{suffix}@example.com',
+                               phone_number=suffix[-30:],
+                               address1='1 Main St', city='Nairobi',
+                               state='Nairobi', zip='00100',
+                               country='Kenya', role='company')
+        storage.new(self.company)
+        self.items = [Items(public_id=new_public_id(),
+                            company_id=self.company.public_id,
+                            name='Hot item', stockamount=STOCK,
+                            initial_stock=STOCK, reorder_level=1,
+                            price=10.0, description='Popular',
+                            category='Deals', SKU=new_public_id())
+                      for _ in range(2)]
+        for item in self.items:
+            storage.new(item)
+        storage.save()
+        self.company_id = self.company.public_id
+        self.item_ids = [item.public_id for item in self.items]
+
+    def tearDown(self):
+        """Remove the test rows"""
+        storage.close()
+        for item_id in self.item_ids:
+            storage.delete(storage.get(Items, item_id))
+        storage.delete(storage.get(Company, self.company_id))
+        storage.save()
+        storage.close()
+
+    def stock(self, item_id):
+        """Stock of an item as stored in the database"""
+        storage.close()
+        return storage.get(Items, item_id).initial_stock
+
+    def test_reserve_and_restock(self):
+        """Test reserving within stock, refusing beyond it and restocking"""
+        first, second = self.item_ids
+        self.assertTrue(storage.reserve_stock(first, STOCK - 5))
+        self.assertFalse(storage.reserve_stock(first, 6))
+        storage.save()
+        self.assertEqual(self.stock(first), 5)
+        self.assertEqual(storage.restock({first: 3, second: 2}), 2)
+        storage.save()
+        self.assertEqual(self.stock(first), 8)
+        self.assertEqual(self.stock(second), STOCK + 2)
+
+    def test_reserve_several_items(self):
+        """Test that several items are reserved together or not at all"""
+        first, second = self.item_ids
+        self.assertTrue(storage.reserve_stocks({first: 10, second: 20}))
+        storage.save()
+        self.assertFalse(storage.reserve_stocks({first: 1, second: STOCK}))
+        storage.rollback()
+        self.assertEqual(self.stock(first), STOCK - 10)
+        self.assertEqual(self.stock(second), STOCK - 20)
+
+    def test_update_catalogue_keeps_reservations(self):
+        """Test that an imported stockamount is added to the stock"""
+        first, second = self.item_ids
+        storage.reserve_stock(first, 5)
+        storage.save()
+        row = {'name': 'Renamed', 'price': 12.5, 'description': 'New',
+               'category': 'Deals', 'reorder_level': 3}
+        missing = new_public_id()
+        skipped = storage.update_catalogue([
+            dict(row, public_id=first, stockamount=10),
+            dict(row, public_id=second, stockamount=0),
+            # Deleted since the lookup: skipped
+            dict(row, public_id=missing, stockamount=10)])
+        storage.save()
+        self.assertEqual(skipped, [missing])
+        storage.close()
+        item = storage.get(Items, first)
+        self.assertEqual((item.name, item.stockamount, item.initial_stock),
+                         ('Renamed', 10, STOCK + 5))
+        item = storage.get(Items, second)
+        self.assertEqual((item.name, item.initial_stock),
+                         ('Renamed', STOCK))
+        self.assertEqual(storage.query(StockMovement, item_id=missing)
+                         .count(), 0)
+
+    def test_update_items_by_field_set(self):
+        """Test that rows are updated in groups, adding stockamount"""
+        first, second = self.item_ids
+        updated = storage.update_items([
+            {'public_id': first, 'price': 12.5},
+            {'public_id': second, 'stockamount': 5, 'name': 'Restocked'},
+            {'public_id': 'missing', 'price': 1.0}])
+        storage.save()
+        self.assertEqual(updated, 2)
+        storage.close()
+        self.assertEqual(storage.get(Items, first).price, 12.5)
+        item = storage.get(Items, second)
+        self.assertEqual((item.name, item.stockamount, item.initial_stock),
+                         ('Restocked', 5, STOCK + 5))
+
+    def test_ledger_rebuilds_stock(self):
+        """Test that snapshots plus movements give the stock at any time"""
+        first, second = self.item_ids
+        order_id = new_public_id()
+        storage.reserve_stocks({first: 5, second: 2}, order_id)
+        storage.save()
+        # Rolled back changes leave no movement
+        storage.reserve_stock(second, 1)
+        storage.rollback()
+        before_snapshot = datetime.utcnow()
+        self.assertGreaterEqual(storage.take_stock_snapshots(batch_size=1),
+                                2)
+        storage.restock({first: 2}, order_id)
+        storage.save()
+
+        self.assertEqual(storage.stock_at(first, before_snapshot), STOCK - 5)
+        now = datetime.utcnow()
+        self.assertEqual(storage.stock_at(first, now), STOCK - 3)
+        self.assertEqual(storage.stock_at(second, now), STOCK - 2)
+        self.assertEqual(storage.latest_snapshot(second).stock, STOCK - 2)
+
+        # A worker whose clock is behind gives its movement a lower id
+        storage.new(StockMovement(public_id='00000000-0000-7000-8000-'
+                                  + new_public_id()[-12:],
+                                  item_id=second, quantity=-1,
+                                  kind='adjust'))
+        storage.save()
+        self.assertEqual(storage.stock_at(second, datetime.utcnow()),
+                         STOCK - 3)
+        movements = storage.query(StockMovement, item_id=second)\
+            .order_by(StockMovement.sequence)
+        self.assertEqual([movement.kind for movement in movements],
+                         ['receive', 'reserve', 'adjust'])
+
+        # Whole-second created_at (as on MySQL) must not move a movement
+        # to the wrong side of the snapshot
+        second_start = now.replace(microsecond=0)
+        for cls in (StockMovement, StockSnapshot):
+            storage.query(cls, item_id=first).update(
+                {'created_at': second_start}, synchronize_session=False)
+        storage.save()
+        self.assertEqual(storage.stock_at(first, now), STOCK - 3)
+        movements = storage.query(StockMovement, item_id=first)\
+            .order_by(StockMovement.created_at, StockMovement.sequence)
+        self.assertEqual([(movement.kind, movement.quantity, movement.order_id)
+                          for movement in movements],
+                         [('receive', STOCK, None), ('reserve', -5, order_id),
+                          ('release', 2, order_id)])
+
+    def test_refresh_category_counts(self):
+        """Test that categories are counted per company and overall"""
+        first, second = self.item_ids
+        storage.reserve_stock(first, STOCK)
+        storage.save()
+        self.assertGreaterEqual(storage.refresh_category_counts(batch_size=1),
+                                1)
+        counts = storage.filter(CategoryCount, company_id=self.company_id)
+        self.assertEqual([(count.category, count.item_count,
+                           count.in_stock_count) for count in counts],
+                         [('Deals', 2, 1)])
+        overall = storage.filter(CategoryCount, company_id=None,
+                                 category='Deals')
+        self.assertEqual(len(overall), 1)
+        self.assertGreaterEqual(overall[0].item_count, 2)
+
+        # Recounting at once (within the same second) replaces the rows
+        storage.refresh_category_counts()
+        self.assertEqual(len(storage.filter(
+            CategoryCount, company_id=self.company_id)), 1)
+        overall = storage.filter(CategoryCount, company_id=None,
+                                 category='Deals')
+        self.assertEqual(len(overall), 1)
+        self.assertEqual(len({count.generation for count in
+                              storage.all(CategoryCount)}), 1)
+
+    def test_low_stock_events(self):
+        """Test that crossing the reorder level is reported after commit"""
+        first, second = self.item_ids
+        events = []
+        storage.subscribe_low_stock(events.extend)
+        try:
+            storage.reserve_stocks({first: STOCK - 1, second: 1})
+            self.assertEqual(events, [])
+            storage.save()
+            self.assertEqual([event['item_id'] for event in events], [first])
+            self.assertEqual(events[0]['initial_stock'], 1)
+
+            # Already below the level: no second event
+            storage.reserve_stock(first, 1)
+            storage.save()
+            self.assertEqual(len(events), 1)
+
+            # Rolled back changes are not reported
+            storage.reserve_stock(second, STOCK - 1)
+            storage.rollback()
+            storage.save()
+            self.assertEqual(len(events), 1)
+        finally:
+            storage.unsubscribe_low_stock(events.extend)
+        self.assertEqual([item.public_id for item in storage.filter(
+            Items, company_id=self.company_id, needs_reorder=True)], [first])
+
+    def add_client(self):
+        """Add a client with an address; return both ids"""
+        client_id, address_id = new_public_id(), new_public_id()
+        storage.new(Client(public_id=client_id, firstname='Ria',
+                           lastname='Hold', username=client_id,
+                           hashedpassword='x', email=client_id,
+                           phone=client_id[-30:], role='client'))
+        storage.new(Address(public_id=address_id, client_id=client_id,
+                            address_line1='1 Main St', city='Nairobi',
+                            state='Nairobi', postal_code='00100',
+                            country='Kenya'))
+        return client_id, address_id
+
+    def remove_client(self, client_id, address_id):
+        """Remove a client added by add_client"""
+        storage.delete(storage.get(Address, address_id))
+        storage.delete(storage.get(Client, client_id))
+        storage.save()
+
+    def test_update_pending_order(self):
+        """Test that only one request moves an order out of Pending"""
+        client_id, address_id = self.add_client()
+        order = Orders(public_id=new_public_id(), client_id=client_id,
+                       shipping_address_id=address_id, status='Pending',
+                       order_total=30)
+        storage.new(order)
+        storage.save()
+        order_id = order.public_id
+
+        self.assertTrue(storage.update_pending_order(
+            order_id, order_total=Orders.order_total + 10))
+        storage.save()
+        self.assertEqual(order.order_total, 40)
+        self.assertTrue(storage.update_pending_order(
+            order_id, status='Cancelled', reserved_until=None))
+        storage.save()
+        self.assertEqual(order.status, 'Cancelled')
+        # The loser of the race must not ship (or restock) it again
+        self.assertFalse(storage.update_pending_order(
+            order_id, status='Shipped'))
+        storage.rollback()
+        storage.close()
+        self.assertEqual(storage.get(Orders, order_id).status,
+                         'Cancelled')
+
+        storage.delete(storage.get(Orders, order_id))
+        storage.save()
+        self.remove_client(client_id, address_id)
+
+    def test_release_expired_reservations(self):
+        """Test that expired pending orders are cancelled and restocked"""
+        first, second = self.item_ids
+        client_id, address_id = self.add_client()
+        now = datetime.utcnow()
+        orders = {}
+        for minutes in (-2, -1, 10):
+            order = Orders(public_id=new_public_id(), client_id=client_id,
+                           shipping_address_id=address_id, status='Pending',
+                           order_total=30,
+                           reserved_until=now + timedelta(minutes=minutes))
+            storage.new(order)
+            orders[minutes] = order.public_id
+            storage.reserve_stocks({first: 2, second: 1})
+            for item_id, quantity in ((first, 2), (second, 1)):
+                storage.new(OrderItems(public_id=new_public_id(),
+                                       order_id=order.public_id,
+                                       item_id=item_id,
+                                       quantity_ordered=quantity,
+                                       price_at_order_time=10 * quantity))
+        storage.save()
+
+        self.assertEqual(storage.reserved_quantities([first, second]),
+                         {first: 2, second: 1})
+        self.assertEqual(storage.release_expired_reservations(batch_size=1),
+                         1)
+        self.assertEqual(storage.release_expired_reservations(), 1)
+        self.assertEqual(storage.release_expired_reservations(), 0)
+
+        self.assertEqual(self.stock(first), STOCK - 2)
+        self.assertEqual(self.stock(second), STOCK - 1)
+        self.assertEqual([storage.get(Orders, orders[minutes]).status
+                          for minutes in (-2, -1, 10)],
+                         ['Cancelled', 'Cancelled', 'Pending'])
+
+        for order_id in orders.values():
+            for line in storage.filter(OrderItems, order_id=order_id):
+                storage.delete(line)
+            storage.delete(storage.get(Orders, order_id))
+        storage.save()
+        self.remove_client(client_id, address_id)
+
+    def test_no_oversell_under_concurrency(self):
+        """Test that parallel orders never take more than the stock"""
+        item_id = self.item_ids[0]
+        reserved = []
+        errors = []
+        start = threading.Barrier(THREADS)
+
+        def buyer():
+            start.wait()
+            try:
+                for _ in range(ATTEMPTS):
+                    if storage.reserve_stock(item_id, 1):
+                        storage.save()
+                        reserved.append(1)
+                    else:
+                        storage.rollback()
+            except Exception as e:
+                errors.append(e)
+            finally:
+                storage.close()
+
+        threads = [threading.Thread(target=buyer) for _ in range(THREADS)]
+        began = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - began
+
+        self.assertEqual(errors, [])
+        self.assertEqual(len(reserved), STOCK)
+        self.assertEqual(self.stock(item_id), 0)
+        print(f"\n{THREADS * ATTEMPTS} reservations by {THREADS} threads "
+              f"in {elapsed:.3f}s "
+              f"({THREADS * ATTEMPTS / elapsed:.0f} per second)")
+
+
+class BinaryIdStockTestCase(unittest.TestCase):
+    def test_reserve_and_restock_several_items(self):
+        """Test multi-item stock updates with BINARY_PUBLIC_IDS=true"""
+        # The id column type is chosen at import: use a fresh interpreter
+        with tempfile.TemporaryDirectory() as directory:
+            env = dict(os.environ, BINARY_PUBLIC_IDS='true',
+                       DATABASE_URI='sqlite:///' +
+                       os.path.join(directory, 'binary.db'))
+            result = subprocess.run(
+                [sys.executable, '-c', BINARY_ID_SCRIPT], cwd=ROOT,
+                env=env, capture_output=True, text=True, check=True)
+        self.assertEqual(result.stdout.split('\n')[-5:],
+                         ['True', 'False', '2', '8 7', ''])
+
+
+if __name__ == '__main__':
+    unittest.main()
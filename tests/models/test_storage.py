@@ -5,11 +5,15 @@ import sys
 import os
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '../../')))
 
+import tempfile
 import unittest
-from models.storage import storage
+from datetime import datetime
+from models.storage import Storage, storage
 from models.address import Address
 from models.client import Client
-from sqlalchemy.orm import scoped_session
+from models.payments import Payments
+from sqlalchemy import inspect, text
+from sqlalchemy.orm import scoped_session, selectinload
 
 
 class TestStorage(unittest.TestCase):
@@ -89,6 +93,225 @@ class TestStorage(unittest.TestCase):
         storage.save()
         self.assertIsNone(storage.get(Client, "client127"))
 
+    def test_filter(self):
+        """Test filtering objects with equality criteria"""
+        address = Address(public_id="address128", client_id="client128",
+                          address_line1="1 Main St", city="Nairobi",
+                          state="Nairobi", postal_code="00100",
+                          country="Kenya")
+        client = Client(public_id="client128", firstname="Amos", lastname="Kip",
+                        username="amoskip", hashedpassword="hashedpwd",
+                        email="amos@example.com", phone="5566778899", role="customer")
+        storage.new(client)
+        storage.new(address)
+        storage.save()
+        addresses = storage.filter(Address, client_id="client128")
+        self.assertEqual([a.public_id for a in addresses], ["address128"])
+        self.assertEqual(storage.filter(Address, client_id="missing"), [])
+
+    def test_filter_lookups(self):
+        """Test filtering objects with IN and range lookups"""
+        for suffix in ("129", "130"):
+            storage.new(Client(public_id="client" + suffix, firstname="Eve",
+                               lastname="Moss", username="evemoss" + suffix,
+                               hashedpassword="hashedpwd",
+                               email=f"eve{suffix}@example.com",
+                               phone="44332211" + suffix, role="customer"))
+        storage.save()
+        clients = storage.filter(Client,
+                                 public_id__in=["client129", "client130"])
+        self.assertEqual(len(clients), 2)
+        clients = storage.filter(Client,
+                                 public_id__in=["client129", "client130"],
+                                 username__gt="evemoss129")
+        self.assertEqual([c.public_id for c in clients], ["client130"])
+
+    def test_filter_invalid_lookup(self):
+        """Test filtering with an unknown lookup or column"""
+        with self.assertRaises(ValueError):
+            storage.filter(Client, username__like="x")
+        with self.assertRaises(AttributeError):
+            storage.filter(Client, nickname="x")
+
+    def test_paginate(self):
+        """Test walking a filtered collection page by page"""
+        ids = ["client13{}".format(i) for i in range(1, 6)]
+        for i, public_id in enumerate(ids):
+            storage.new(Client(public_id=public_id, firstname="Ann",
+                               lastname="Page", username="annpage" + public_id,
+                               hashedpassword="hashedpwd",
+                               email=f"{public_id}@example.com",
+                               phone="77665544" + str(i),
+                               created_at=datetime(2024, 1, 1, 0, 0, i // 2),
+                               role="customer"))
+        storage.save()
+        seen = []
+        cursor = None
+        while True:
+            page, cursor = storage.paginate(Client, public_id__in=ids,
+                                            limit=2, cursor=cursor)
+            self.assertLessEqual(len(page), 2)
+            seen.extend(client.public_id for client in page)
+            if cursor is None:
+                break
+        self.assertEqual(seen, ids)
+
+    def test_paginate_invalid_arguments(self):
+        """Test paginating with a bad cursor or limit"""
+        with self.assertRaises(ValueError):
+            storage.paginate(Client, cursor="not-a-cursor")
+        with self.assertRaises(ValueError):
+            storage.paginate(Client, limit=0)
+
+    def test_missing_indexes(self):
+        """Test reporting and creating indexes missing from the database"""
+        self.assertEqual(storage.missing_indexes(), [])
+        index = next(index for index in Payments.__table__.indexes
+                     if index.name ==
+                     'ix_payments_transaction_reference_number')
+        index.drop(bind=storage._Storage__engine)
+        self.assertEqual([index.name for index in storage.missing_indexes()],
+                         ['ix_payments_transaction_reference_number'])
+        created = storage.create_missing_indexes()
+        self.assertEqual([index.name for index in created],
+                         ['ix_payments_transaction_reference_number'])
+        self.assertEqual(storage.missing_indexes(), [])
+
+    def test_count_all_classes(self):
+        """Test that the total count is the sum of the per-class counts"""
+        counts = storage.counts()
+        self.assertIn("Client", counts)
+        self.assertEqual(storage.count(), sum(counts.values()))
+        self.assertEqual(counts["Client"], storage.count(Client))
+
+    def test_count_approximate_is_cached(self):
+        """Test that approximate counts are served from the cache"""
+        estimate = storage.count(Client, approximate=True)
+        exact = storage.count(Client)
+        storage.new(Client(public_id="client140", firstname="Tom",
+                           lastname="Cache", username="tomcache",
+                           hashedpassword="hashedpwd",
+                           email="tom@example.com", phone="6655443322",
+                           role="customer"))
+        storage.save()
+        self.assertEqual(storage.count(Client, approximate=True), estimate)
+        self.assertEqual(storage.count(Client), exact + 1)
+
+    def test_stream(self):
+        """Test iterating over a filtered collection in batches"""
+        ids = ["client15{}".format(i) for i in range(5)]
+        for i, public_id in enumerate(ids):
+            storage.new(Client(public_id=public_id, firstname="Sam",
+                               lastname="Stream", username="sam" + public_id,
+                               hashedpassword="hashedpwd",
+                               email=f"{public_id}@example.com",
+                               phone="99887766" + str(i),
+                               created_at=datetime(2024, 2, 1, 0, 0, i),
+                               role="customer"))
+        storage.save()
+        streamed = storage.stream(Client, public_id__in=ids, batch_size=2)
+        self.assertEqual([client.public_id for client in streamed], ids)
+
+    def test_get_many(self):
+        """Test retrieving several objects by id in one call"""
+        for suffix in ("160", "161"):
+            storage.new(Client(public_id="client" + suffix, firstname="Meg",
+                               lastname="Many", username="megmany" + suffix,
+                               hashedpassword="hashedpwd",
+                               email=f"meg{suffix}@example.com",
+                               phone="33221100" + suffix, role="customer"))
+        storage.save()
+        clients = storage.get_many(Client, ["client160", "client161",
+                                            "client160", "missing"])
+        self.assertEqual(sorted(clients), ["client160", "client161"])
+        self.assertEqual(clients["client161"].username, "megmany161")
+        self.assertEqual(storage.get_many(Client, []), {})
+
+    def test_get_by_unique_column(self):
+        """Test retrieving an object by username, email or phone"""
+        storage.new(Client(public_id="client165", firstname="Una",
+                           lastname="Unique", username="unaunique",
+                           hashedpassword="hashedpwd",
+                           email="una@example.com", phone="5454545454",
+                           role="customer"))
+        storage.save()
+        for column, value in (("username", "unaunique"),
+                              ("email", "una@example.com"),
+                              ("phone", "5454545454")):
+            client = storage.get_by(Client, **{column: value})
+            self.assertEqual(client.public_id, "client165")
+        self.assertIsNone(storage.get_by(Client, username="missing"))
+
+    def test_get_by_rejects_non_unique_columns(self):
+        """Test that get_by only accepts a single unique column"""
+        with self.assertRaises(ValueError):
+            storage.get_by(Client, firstname="Una")
+        with self.assertRaises(ValueError):
+            storage.get_by(Client, username="una", email="una@example.com")
+        with self.assertRaises(AttributeError):
+            storage.get_by(Client, nickname="una")
+
+    def test_get_with_loader_options(self):
+        """Test that loader options eagerly load relationships"""
+        client = Client(public_id="client170", firstname="Eli",
+                        lastname="Eager", username="elieager",
+                        hashedpassword="hashedpwd",
+                        email="eli@example.com", phone="1212121212",
+                        role="customer")
+        client.addresses.append(Address(
+            public_id="address170", address_line1="2 Main St",
+            city="Nairobi", state="Nairobi", postal_code="00100",
+            country="Kenya"))
+        storage.new(client)
+        storage.save()
+        storage.close()
+
+        lazy = storage.get(Client, "client170")
+        self.assertIn("addresses", inspect(lazy).unloaded)
+        storage.close()
+
+        eager = storage.get(Client, "client170",
+                            options=(selectinload(Client.addresses),))
+        self.assertNotIn("addresses", inspect(eager).unloaded)
+        self.assertEqual([a.public_id for a in eager.addresses],
+                         ["address170"])
+
+
+class MissingColumnsTestCase(unittest.TestCase):
+    def setUp(self):
+        """Set up a database created before orders.reserved_until"""
+        self.directory = tempfile.TemporaryDirectory()
+        self.storage = Storage()
+        self.storage.configure({
+            'DATABASE_URI': f'sqlite:///{self.directory.name}/old.db'})
+        self.storage.reload()
+        engine = self.storage._Storage__engine
+        with engine.begin() as connection:
+            connection.execute(text(
+                "DROP INDEX ix_orders_status_reserved_until"))
+            connection.execute(text(
+                "ALTER TABLE orders DROP COLUMN reserved_until"))
+
+    def tearDown(self):
+        """Tear down the test database"""
+        self.storage.close()
+        self.directory.cleanup()
+
+    def test_add_missing_columns(self):
+        """Test adding new columns before the indexes that cover them"""
+        self.assertEqual([f"{column.table.name}.{column.name}"
+                          for column in self.storage.missing_columns()],
+                         ['orders.reserved_until'])
+        self.assertEqual([index.name for index in
+                          self.storage.missing_indexes()],
+                         ['ix_orders_status_reserved_until'])
+        added = self.storage.add_missing_columns()
+        self.assertEqual([column.name for column in added],
+                         ['reserved_until'])
+        self.storage.create_missing_indexes()
+        self.assertEqual(self.storage.missing_columns(), [])
+        self.assertEqual(self.storage.missing_indexes(), [])
+
 
 if __name__ == "__main__":
     unittest.main()
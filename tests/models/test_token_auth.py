@@ -0,0 +1,228 @@
+#!/usr/bin/env python3
+"""Unittest Module for token principals and revocation"""
+
+import sys
+import os
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '../../')))
+
+import time
+import unittest
+from datetime import datetime, timedelta
+from unittest import mock
+from models import storage
+from models.client import Client
+from models.ids import new_public_id
+from models.revoked_token import RevokedToken
+from api.app import app
+from api.views.token_auth import (
+    Principal, PrincipalRecord, RevocationList, authenticate,
+    invalidate_principal, load_principal, max_staleness, revocation_list
+)
+from api.views.tokens import issue_tokens
+
+
+class ClientTokenTestCase(unittest.TestCase):
+    """Base for tests about the tokens of one client"""
+
+    def setUp(self):
+        """Set up a client"""
+        storage.reload()
+        self.client_id = new_public_id()
+        storage.new(Client(public_id=self.client_id, firstname='Ada',
+                           lastname='Lane', username=self.client_id,
+                           hashedpassword='x', email=self.client_id,
+                           phone=self.client_id[-30:], role='client'))
+        storage.save()
+
+    def tearDown(self):
+        """Remove the client"""
+        storage.close()
+        client = storage.get(Client, self.client_id)
+        if client:
+            storage.delete(client)
+            storage.save()
+        invalidate_principal('client', self.client_id)
+        storage.close()
+
+    def claims(self, age=0, **extra):
+        """Claims of a client token issued age seconds ago"""
+        return dict({'role': 'client', 'public_id': self.client_id,
+                     'user_role': 'client',
+                     'iat': int(time.time() - age)}, **extra)
+
+    def set_role(self, role):
+        """Change the client's role as its update endpoint would"""
+        storage.close()
+        storage.get(Client, self.client_id).role = role
+        storage.save()
+        invalidate_principal('client', self.client_id)
+
+
+class PrincipalTestCase(ClientTokenTestCase):
+    def test_fresh_token_needs_no_query(self):
+        """Test that a recent token is trusted without loading the row"""
+        with mock.patch('api.views.token_auth.load_principal') as load:
+            principal = authenticate(self.claims())
+            self.assertEqual((principal.public_id, principal.role),
+                             (self.client_id, 'client'))
+        load.assert_not_called()
+
+    def test_row_loads_lazily_once(self):
+        """Test that the user row is only loaded for a missing attribute"""
+        principal = Principal('client', self.client_id, 'client')
+        with mock.patch('api.views.token_auth.storage.get',
+                        wraps=storage.get) as get:
+            self.assertEqual(principal.role, 'client')
+            get.assert_not_called()
+            self.assertEqual(principal.email, self.client_id)
+            self.assertEqual(principal.firstname, 'Ada')
+        get.assert_called_once_with(Client, self.client_id)
+        with self.assertRaises(AttributeError):
+            principal.no_such_column
+
+    def test_missing_row_raises(self):
+        """Test that attributes of a deleted user raise AttributeError"""
+        principal = Principal('client', new_public_id(), 'client')
+        with self.assertRaises(AttributeError):
+            principal.email
+
+    def test_cached_record_is_plain(self):
+        """Test that the cache holds values, not session-bound rows"""
+        record = load_principal('client', self.client_id)
+        self.assertEqual(record, PrincipalRecord(self.client_id, 'client'))
+        storage.close()
+        self.assertIs(load_principal('client', self.client_id), record)
+
+    def test_stale_token_checks_the_row(self):
+        """Test that old tokens take the role from the user row"""
+        self.set_role('admin')
+        principal = authenticate(self.claims(age=max_staleness + 1))
+        self.assertEqual(principal.role, 'admin')
+        # Tokens without the role claim are always checked
+        claims = self.claims()
+        del claims['user_role']
+        self.assertEqual(authenticate(claims).role, 'admin')
+
+    def test_change_revokes_earlier_claims(self):
+        """Test that tokens issued before a change are checked at once"""
+        claims = self.claims(age=1)
+        self.set_role('admin')
+        self.assertEqual(authenticate(claims).role, 'admin')
+
+        storage.close()
+        storage.delete(storage.get(Client, self.client_id))
+        storage.save()
+        invalidate_principal('client', self.client_id)
+        self.assertIsNone(authenticate(claims))
+
+    def test_unknown_kind(self):
+        """Test that tokens of other kinds have no principal"""
+        self.assertIsNone(authenticate(self.claims(role='admin')))
+        self.assertIsNone(load_principal('admin', self.client_id))
+
+
+class RevocationListTestCase(unittest.TestCase):
+    def setUp(self):
+        """Two workers' revocation lists over the same table"""
+        storage.reload()
+        self.expires_at = datetime.utcnow() + timedelta(hours=1)
+        self.ours = RevocationList(refresh_interval=0)
+        self.theirs = RevocationList(refresh_interval=3600)
+
+    def tearDown(self):
+        """Close the session"""
+        storage.close()
+
+    def test_revoke_once(self):
+        """Test that only the first revocation of a token lands"""
+        jti = new_public_id()
+        self.assertFalse(self.ours.is_revoked(jti))
+        self.assertTrue(self.ours.revoke(jti, 'refresh', self.expires_at))
+        self.assertFalse(self.ours.revoke(jti, 'refresh', self.expires_at))
+        self.assertTrue(self.ours.is_revoked(jti))
+        self.assertFalse(self.ours.is_revoked(None))
+
+    def test_sync_merges_other_workers(self):
+        """Test that revocations elsewhere arrive with the next sync"""
+        first, second = new_public_id(), new_public_id()
+        self.assertTrue(self.ours.revoke(first, 'access', self.expires_at))
+        # Loaded on first use
+        self.assertTrue(self.theirs.is_revoked(first))
+        self.assertTrue(self.ours.revoke(second, 'access', self.expires_at))
+        # Not merged until refresh_interval has passed
+        self.assertFalse(self.theirs.is_revoked(second))
+        other = RevocationList(refresh_interval=0)
+        self.assertTrue(other.is_revoked(second))
+        self.assertTrue(self.ours.is_revoked(second))
+
+    def test_purge_expired(self):
+        """Test that only rows of expired tokens are purged"""
+        expired, live = new_public_id(), new_public_id()
+        self.ours.revoke(expired, 'access',
+                         datetime.utcnow() - timedelta(seconds=1))
+        self.ours.revoke(live, 'access', self.expires_at)
+        self.assertGreaterEqual(storage.purge_revoked_tokens(), 1)
+        self.assertIsNone(storage.get(RevokedToken, expired))
+        self.assertIsNotNone(storage.get(RevokedToken, live))
+
+
+class TokenFlowTestCase(ClientTokenTestCase):
+    def post(self, path, json=None, token=None):
+        """Dispatch a POST through the app; return (status, body)"""
+        headers = {'access-token': token} if token else {}
+        with app.test_request_context(path, method='POST', json=json,
+                                      headers=headers):
+            response = app.full_dispatch_request()
+        storage.close()
+        return response.status_code, response.get_json()
+
+    def tokens(self):
+        """A fresh access and refresh token for the client"""
+        with app.app_context():
+            return issue_tokens(storage.get(Client, self.client_id),
+                                'client')
+
+    def test_refresh_is_single_use(self):
+        """Test that a refresh token is exchanged once"""
+        tokens = self.tokens()
+        status, body = self.post('/api/tokens/refresh',
+                                 {'refresh_token': tokens['refresh_token']})
+        self.assertEqual(status, 200)
+        self.assertNotEqual(body['refresh_token'], tokens['refresh_token'])
+        status, body = self.post('/api/tokens/refresh',
+                                 {'refresh_token': tokens['refresh_token']})
+        self.assertEqual((status, body), (401, {'Message': 'Token Revoked'}))
+
+    def test_concurrent_refresh_gets_one_pair(self):
+        """Test that a refresh racing past the revocation check loses"""
+        tokens = self.tokens()
+        data = {'refresh_token': tokens['refresh_token']}
+        self.assertEqual(self.post('/api/tokens/refresh', data)[0], 200)
+        # The other request checked before the first one revoked it
+        with mock.patch.object(revocation_list, 'is_revoked',
+                               return_value=False):
+            status, body = self.post('/api/tokens/refresh', data)
+        self.assertEqual((status, body), (401, {'Message': 'Token Revoked'}))
+
+    def test_refresh_rejects_access_tokens(self):
+        """Test that access tokens cannot be refreshed"""
+        status, _ = self.post('/api/tokens/refresh',
+                              {'refresh_token': self.tokens()['token']})
+        self.assertEqual(status, 401)
+
+    def test_revoke_logs_out(self):
+        """Test that revoked access and refresh tokens stop working"""
+        tokens = self.tokens()
+        status, _ = self.post('/api/tokens/revoke',
+                              {'refresh_token': tokens['refresh_token']},
+                              token=tokens['token'])
+        self.assertEqual(status, 200)
+        status, body = self.post('/api/tokens/revoke', token=tokens['token'])
+        self.assertEqual((status, body), (401, {'Message': 'Token Revoked'}))
+        status, _ = self.post('/api/tokens/refresh',
+                              {'refresh_token': tokens['refresh_token']})
+        self.assertEqual(status, 401)
+
+
+if __name__ == '__main__':
+    unittest.main()